@@ -0,0 +1,181 @@
+# backend/app/admission.py
+# admission control หน้า inference: ช่วงเข้างานคนสแกนพร้อมกันมากกว่าที่ CPU embed ทัน
+# → แทนที่ request จะกองใน threadpool จน gunicorn --timeout ฆ่า worker (ทุกคน timeout)
+#   ให้รันพร้อมกันได้ INFER_SLOTS งาน ที่เหลือรอในคิวมีขอบเขต (INFER_QUEUE_MAX) ไม่เกิน INFER_MAX_WAIT_S
+#   คิวเต็ม / รอนานเกิน → 503 + Retry-After ทันที (ประมาณจากคิวที่รออยู่ × เวลา inference เฉลี่ย)
+#
+# priority (น้อย = ก่อน, FIFO ในระดับเดียวกัน) ตาม endpoint ของ request (metrics.endpoint()):
+#   0 clock – clock-in / clock-out ที่ login แล้ว
+#   1 kiosk – anonymous-clock / group-clock / kiosk WebSocket
+#   2 admin – recognize / recognize-batch / enroll และอื่น ๆ
+# คิวเต็มแล้ว request ที่ priority ดีกว่ามา → เบียดตัวท้ายสุดของ priority แย่สุดออก (ตัวนั้นได้ 503)
+#
+# ใช้ผ่าน Gated(svc): ครอบ method inference ของ FaceService (get_svc ใน main.py คืนตัวนี้)
+# INFER_SLOTS=0 → ปิด (พฤติกรรมเดิม: ไม่จำกัด)
+from contextlib import contextmanager
+from typing import Optional
+import heapq
+import itertools
+import math
+import os
+import threading
+import time
+
+from fastapi import HTTPException
+
+from . import metrics
+
+INFER_SLOTS = int(os.getenv("INFER_SLOTS", "2"))
+INFER_QUEUE_MAX = int(os.getenv("INFER_QUEUE_MAX", "32"))
+INFER_MAX_WAIT_S = float(os.getenv("INFER_MAX_WAIT_S", "5"))
+
+CLASSES = ("clock", "kiosk", "admin")
+PRIORITY = {
+    "/api/attendance/clock-in": 0,
+    "/api/attendance/clock-out": 0,
+    "/api/attendance/anonymous-clock": 1,
+    "/api/attendance/group-clock": 1,
+    "/api/attendance/kiosk": 1,
+}
+DEFAULT_PRIORITY = 2
+
+metrics.describe("attendance_infer_queue_depth", "gauge", "Requests waiting for an inference slot, by priority class")
+metrics.describe("attendance_infer_inflight", "gauge", "Inference calls currently running")
+metrics.describe("attendance_infer_wait_seconds", "histogram", "Time spent waiting for an inference slot")
+metrics.describe("attendance_infer_rejected_total", "counter",
+                 "Inference requests shed with 503 (queue full / wait timeout / evicted by higher priority)")
+
+
+class Busy(HTTPException):
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(503, f"inference busy ({reason})", headers={"Retry-After": str(retry_after)})
+        self.reason = reason
+
+
+class Controller:
+    def __init__(self, slots: int = INFER_SLOTS, queue_max: int = INFER_QUEUE_MAX,
+                 max_wait_s: float = INFER_MAX_WAIT_S):
+        self.slots, self.queue_max, self.max_wait_s = slots, queue_max, max_wait_s
+        self._cv = threading.Condition()
+        self._free = slots
+        self._waiting: list = []      # heap ของ [priority, seq, state]; state: None = รอ, "go", "evicted"
+        self._seq = itertools.count()
+        self._service_s = 0.05        # EMA ของเวลา inference (ใช้ประมาณ Retry-After)
+        self.stats = {"admitted": 0, "rejected": {c: 0 for c in CLASSES}}
+
+    @property
+    def enabled(self) -> bool:
+        return self.slots > 0
+
+    def _retry_after(self) -> int:
+        ahead = len(self._waiting) + (self.slots - self._free)
+        return max(1, min(30, math.ceil(ahead * self._service_s / max(1, self.slots))))
+
+    def _publish(self):
+        depth = [0] * len(CLASSES)
+        for p, _, _ in self._waiting:
+            depth[p] += 1
+        for c, n in zip(CLASSES, depth):
+            metrics.set_gauge("attendance_infer_queue_depth", n, {"priority": c})
+        metrics.set_gauge("attendance_infer_inflight", self.slots - self._free)
+
+    def _reject(self, priority: int, reason: str) -> Busy:
+        self.stats["rejected"][CLASSES[priority]] += 1
+        metrics.inc("attendance_infer_rejected_total", {"priority": CLASSES[priority], "reason": reason})
+        return Busy(reason, self._retry_after())
+
+    def _hand_off(self):
+        # slot ว่าง → ปลุกตัวหน้าสุดของคิว (ผู้เรียกถือ lock)
+        while self._free > 0 and self._waiting:
+            entry = heapq.heappop(self._waiting)
+            entry[2] = "go"
+            self._free -= 1
+        self._cv.notify_all()
+
+    def acquire(self, priority: int):
+        t0 = time.perf_counter()
+        with self._cv:
+            if self._free > 0 and not self._waiting:
+                self._free -= 1
+            else:
+                if len(self._waiting) >= self.queue_max:
+                    worst = max(self._waiting, key=lambda e: (e[0], e[1])) if self._waiting else None
+                    if worst is None or worst[0] <= priority:
+                        self._publish()
+                        raise self._reject(priority, "queue_full")
+                    worst[2] = "evicted"
+                    self._waiting.remove(worst)
+                    heapq.heapify(self._waiting)
+                    self._cv.notify_all()
+                entry = [priority, next(self._seq), None]
+                heapq.heappush(self._waiting, entry)
+                self._publish()
+                deadline = t0 + self.max_wait_s
+                while entry[2] is None:
+                    left = deadline - time.perf_counter()
+                    if left <= 0:
+                        self._waiting.remove(entry)
+                        heapq.heapify(self._waiting)
+                        self._publish()
+                        raise self._reject(priority, "timeout")
+                    self._cv.wait(left)
+                if entry[2] == "evicted":
+                    self._publish()
+                    raise self._reject(priority, "evicted")
+            self.stats["admitted"] += 1
+            self._publish()
+        metrics.observe("attendance_infer_wait_seconds", time.perf_counter() - t0, {"priority": CLASSES[priority]})
+
+    def release(self, service_s: Optional[float] = None):
+        with self._cv:
+            if service_s is not None:
+                self._service_s = 0.9 * self._service_s + 0.1 * service_s
+            self._free += 1
+            self._hand_off()
+            self._publish()
+
+    @contextmanager
+    def slot(self, priority: Optional[int] = None):
+        if not self.enabled:
+            yield
+            return
+        if priority is None:
+            priority = PRIORITY.get(metrics.endpoint(), DEFAULT_PRIORITY)
+        self.acquire(priority)
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.release(time.perf_counter() - t0)
+
+    def snapshot(self) -> dict:
+        with self._cv:
+            depth = {c: 0 for c in CLASSES}
+            for p, _, _ in self._waiting:
+                depth[CLASSES[p]] += 1
+            return {"enabled": self.enabled, "slots": self.slots, "inflight": self.slots - self._free,
+                    "queue_max": self.queue_max, "max_wait_s": self.max_wait_s, "queued": depth,
+                    "avg_service_ms": round(self._service_s * 1000, 1), "retry_after_s": self._retry_after(),
+                    **self.stats}
+
+
+controller = Controller()
+
+INFERENCE = ("extract", "extract_all", "extract_many", "detect", "embed")
+
+
+class Gated:
+    """FaceService ที่ทุก method inference ต้องได้ slot จาก controller ก่อน (method อื่นส่งผ่านตรง)"""
+
+    def __init__(self, svc, ctl: Controller = controller):
+        self._svc, self._ctl = svc, ctl
+
+    def __getattr__(self, name):
+        attr = getattr(self._svc, name)
+        if name not in INFERENCE or not callable(attr):
+            return attr
+
+        def call(*a, **kw):
+            with self._ctl.slot():
+                return attr(*a, **kw)
+        return call
@@ -1,11 +1,13 @@
 from datetime import datetime, timedelta
-from jose import jwt
+from jose import jwt, JWTError
 from passlib.hash import bcrypt
 import os
 
 SECRET = os.getenv("JWT_SECRET", "CHANGE_ME")
 ALG = "HS256"
 ACCESS_MIN = int(os.getenv("JWT_TTL_MIN", "120"))
+PREFLIGHT_TTL_S = int(os.getenv("PREFLIGHT_TTL_S", "60"))
+_PREFLIGHT_KEY = SECRET + ":preflight"  # คนละ key กับ access token → เอาไปใช้แทนกันไม่ได้
 
 def hash_pw(pw: str) -> str:
     return bcrypt.hash(pw)
@@ -20,3 +22,15 @@ def make_access_token(sub: str, role: str):
         "exp": datetime.utcnow() + timedelta(minutes=ACCESS_MIN)
     }
     return jwt.encode(payload, SECRET, algorithm=ALG)
+
+def make_preflight_token(claims: dict) -> str:
+    payload = {**claims, "typ": "preflight",
+               "exp": datetime.utcnow() + timedelta(seconds=PREFLIGHT_TTL_S)}
+    return jwt.encode(payload, _PREFLIGHT_KEY, algorithm=ALG)
+
+def read_preflight_token(token: str) -> dict | None:
+    try:
+        data = jwt.decode(token, _PREFLIGHT_KEY, algorithms=[ALG])
+    except JWTError:
+        return None  # หมดอายุ / ปลอม → clock endpoint ตรวจเต็มเหมือนไม่มี token
+    return data if data.get("typ") == "preflight" else None
@@ -0,0 +1,155 @@
+# backend/app/calibrate.py
+# calibrate threshold ของ face match (clock.DEFAULT_TH / FACE_MATCH_TH) จากข้อมูลจริงแทนการเดา
+#   GET /api/admin/calibration   หรือ   python -m scripts.calibrate_threshold
+#
+# แหล่ง score:
+#   gallery  – template ทุกอันเทียบกันเอง (all-pairs E·Eᵀ ทีละ block ของแถว ไม่สร้างเมทริกซ์เต็ม)
+#              คนเดียวกัน = genuine, ต่างคน = impostor (ordered pair, probe เป็นของ department ตัวเอง)
+#   attempts – AttendanceAttempt.score ย้อนหลัง: มี user_id = genuine, ไม่มี (จำไม่ได้) = impostor
+#              มี bias: anonymous ที่ score ต่ำกว่า th ตอนนั้นถูกนับเป็น impostor ทั้งหมด → ใช้ดูแนวโน้ม
+#
+# score ทุกคู่ลง histogram ละเอียด CALIBRATE_BINS ช่องบน [-1, 1] ด้วย bincount (ไม่เก็บ score รายคู่)
+# → FAR / FRR ทุก threshold จาก cumsum ครั้งเดียว (หลายล้านคู่ใช้เวลาเป็นวินาที)
+# แนะนำต่อ department: ในช่วง threshold ที่ FAR <= target_far และ FRR ต่ำสุด → เลือกกลางช่วง (เผื่อ margin ทั้งสองฝั่ง)
+# department ที่ genuine น้อยกว่า CALIBRATE_MIN_GENUINE → ใช้ค่ารวม (fallback)
+from datetime import datetime, timedelta
+import json
+import os
+import time
+
+import numpy as np
+from sqlmodel import Session, select
+
+from .clock import DEFAULT_TH
+from .models import AttendanceAttempt, Department, User
+
+BINS = int(os.getenv("CALIBRATE_BINS", "4000"))
+BLOCK_PAIRS = int(os.getenv("CALIBRATE_BLOCK_PAIRS", "4000000"))  # score ต่อ block (คุม memory)
+MIN_GENUINE = int(os.getenv("CALIBRATE_MIN_GENUINE", "20"))
+
+
+def _bin(scores: np.ndarray) -> np.ndarray:
+    return np.clip(((scores + 1.0) * (BINS / 2.0)).astype(np.int64), 0, BINS - 1)
+
+
+def thresholds() -> np.ndarray:
+    # ขอบล่างของแต่ละช่อง: score >= thresholds[i] ⇔ bin >= i
+    return np.linspace(-1.0, 1.0, BINS, endpoint=False)
+
+
+class Histograms:
+    """genuine / impostor ต่อ department (แถว = index ใน deps, None = ไม่มี department)"""
+
+    def __init__(self, deps: list):
+        self.deps = deps
+        self.gen = np.zeros((len(deps), BINS), np.int64)
+        self.imp = np.zeros((len(deps), BINS), np.int64)
+
+    def add(self, dep_idx: np.ndarray, scores: np.ndarray, genuine: np.ndarray):
+        flat = dep_idx.astype(np.int64) * BINS + _bin(scores)
+        n = len(self.deps) * BINS
+        self.gen += np.bincount(flat[genuine], minlength=n).reshape(self.gen.shape)
+        self.imp += np.bincount(flat[~genuine], minlength=n).reshape(self.imp.shape)
+
+
+def _dep_index(values: list) -> tuple:
+    deps = sorted({v for v in values if v is not None}) + [None]
+    pos = {d: i for i, d in enumerate(deps)}
+    return deps, np.array([pos[v] for v in values], np.int64)
+
+
+def from_gallery(s: Session) -> Histograms:
+    uids, deps, rows = [], [], []
+    q = select(User.id, User.department_id, User.embeddings_json).where(
+        User.embeddings_json.is_not(None), User.active)
+    for uid, dep, raw in s.exec(q):
+        for e in json.loads(raw) or []:
+            uids.append(uid); deps.append(dep); rows.append(e)
+    names, dep_idx = _dep_index(deps)
+    h = Histograms(names)
+    if len(rows) < 2:
+        return h
+    m = np.asarray(rows, np.float32)
+    m /= np.linalg.norm(m, axis=1, keepdims=True) + 1e-12
+    uid = np.asarray(uids)
+    block = max(1, BLOCK_PAIRS // len(m))
+    for i0 in range(0, len(m), block):
+        i1 = min(i0 + block, len(m))
+        sc = m[i0:i1] @ m.T                                  # (b, N) – matrix product เดียวต่อ block
+        same = uid[i0:i1, None] == uid[None, :]
+        off_diag = np.arange(i0, i1)[:, None] != np.arange(len(m))[None, :]
+        probe = np.broadcast_to(dep_idx[i0:i1, None], sc.shape)
+        h.add(probe[off_diag], sc[off_diag], same[off_diag])
+    return h
+
+
+def from_attempts(s: Session, days: int = 90) -> Histograms:
+    since = datetime.utcnow() - timedelta(days=days)
+    q = select(AttendanceAttempt.score, AttendanceAttempt.user_id, AttendanceAttempt.department_id).where(
+        AttendanceAttempt.ts >= since, AttendanceAttempt.score.is_not(None))
+    rows = s.exec(q).all()
+    names, dep_idx = _dep_index([r[2] for r in rows])
+    h = Histograms(names)
+    if rows:
+        h.add(dep_idx, np.array([r[0] for r in rows], np.float32), np.array([r[1] is not None for r in rows]))
+    return h
+
+
+def curves(gen: np.ndarray, imp: np.ndarray) -> dict:
+    """FAR / FRR ทุก threshold ใน thresholds(): FAR = impostor ที่ score >= t, FRR = genuine ที่ score < t"""
+    ng, ni = int(gen.sum()), int(imp.sum())
+    accept_imp = np.cumsum(imp[::-1])[::-1]
+    reject_gen = np.concatenate([[0], np.cumsum(gen)[:-1]])
+    return {"thresholds": thresholds(), "far": accept_imp / max(ni, 1), "frr": reject_gen / max(ng, 1),
+            "genuine": ng, "impostor": ni}
+
+
+def _point(c: dict, i: int) -> dict:
+    return {"threshold": round(float(c["thresholds"][i]), 4), "far": float(c["far"][i]), "frr": float(c["frr"][i])}
+
+
+def recommend(c: dict, target_far: float, current: float) -> dict:
+    far, frr = c["far"], c["frr"]
+    cur = int(_bin(np.array([current], np.float32))[0])
+    if not c["genuine"] or not c["impostor"]:  # ฝั่งเดียว → คำนวณ threshold ไม่ได้
+        return {"genuine": c["genuine"], "impostor": c["impostor"], "recommended": None, "eer": None,
+                "current": _point(c, cur)}
+    ok = np.nonzero(far <= target_far)[0]
+    if len(ok):
+        best = ok[frr[ok] <= frr[ok].min()]  # FRR ไม่ลดลงตาม threshold → ช่วงติดกันตั้งแต่ ok[0]
+        i = int(best[len(best) // 2])
+    else:
+        i = len(far) - 1
+    e = int(np.argmin(np.abs(far - frr)))
+    return {"genuine": c["genuine"], "impostor": c["impostor"], "recommended": _point(c, i),
+            "eer": {"threshold": round(float(c["thresholds"][e]), 4), "rate": float((far[e] + frr[e]) / 2)},
+            "current": _point(c, cur)}
+
+
+def roc(c: dict, points: int) -> list:
+    idx = np.unique(np.linspace(0, len(c["far"]) - 1, max(2, points)).astype(int))
+    return [_point(c, int(i)) for i in idx]
+
+
+def calibrate(s: Session, source: str = "gallery", target_far: float = 1e-3, current: float = DEFAULT_TH,
+              days: int = 90, points: int = 0) -> dict:
+    t0 = time.perf_counter()
+    h = from_gallery(s) if source == "gallery" else from_attempts(s, days)
+    overall = curves(h.gen.sum(0), h.imp.sum(0))
+    out = {"source": source, "target_far": target_far, "current_th": current, "bins": BINS, "overall": recommend(overall, target_far, current)}
+    if points:
+        out["overall"]["roc"] = roc(overall, points)
+    fallback = (out["overall"]["recommended"] or {}).get("threshold")
+    names = {d.id: d.name for d in s.exec(select(Department))}
+    deps = []
+    for i, dep in enumerate(h.deps):
+        if not h.gen[i].any() and not h.imp[i].any():
+            continue
+        r = recommend(curves(h.gen[i], h.imp[i]), target_far, current)
+        enough = r["genuine"] >= MIN_GENUINE and r["recommended"] is not None
+        deps.append({"department_id": dep, "name": names.get(dep), **r,
+                     "threshold": r["recommended"]["threshold"] if enough else fallback,
+                     "fallback": not enough})
+    out["departments"] = deps
+    out["elapsed_s"] = round(time.perf_counter() - t0, 3)
+    return out
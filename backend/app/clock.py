@@ -0,0 +1,378 @@
+# backend/app/clock.py
+# pipeline เดียวสำหรับทุก endpoint ที่ลงเวลา (clock-in / clock-out / manual-in / manual-out / anonymous-clock)
+#
+# ลำดับ stage: ตรวจที่ไม่ต้องใช้รูปก่อน (enroll / department / accuracy / geofence / สถานะเข้า-ออก)
+# → ถ้าไม่ผ่านตอบทันทีโดยไม่ต้องอ่าน/decode รูปหรือรัน ONNX
+# → แล้วจึง extract + match หน้า → commit Attendance
+# stage ที่ไม่ผ่าน raise Reject → run() บันทึก AttendanceAttempt(success=False) ให้แบบเดียวกันทุก endpoint
+#
+# preflight: client ถามก่อน (POST /api/attendance/preflight, ไม่มีรูป) → รันเฉพาะ stage ก่อนรูป
+# ผ่าน → ได้ token อายุสั้น (PREFLIGHT_TTL_S) ผูกกับ user / action / lat / lng / accuracy
+#   (พิกัดปัดที่ PREFLIGHT_COORD_DP, accuracy เป็นเมตรเต็ม: client ส่ง float เดิมเป็น string คนละรูปได้)
+# ส่ง token มากับ clock-in|out|anonymous-clock → ข้าม stage เหล่านั้น (ยกเว้นสถานะเข้า-ออกที่ตรวจซ้ำเสมอ)
+#
+# group (run_group, /api/attendance/group-clock): หลายคนในเฟรมเดียว → ANONYMOUS_PRE ครั้งเดียวต่อเฟรม
+# → extract_all (recognizer batch เดียว) → search_many (gallery คูณครั้งเดียว) → ANONYMOUS_POST ต่อคน
+# → Attendance + Attempt ของทุกคน commit ใน transaction เดียว
+from dataclasses import dataclass, field, replace
+from datetime import datetime, timedelta, timezone
+from math import radians, sin, cos, asin, sqrt
+from typing import Callable, Optional, Tuple
+import json
+import os
+
+import numpy as np
+from fastapi import HTTPException
+from sqlmodel import Session, select
+
+from . import image_archive, metrics, tracing
+from .auth import PREFLIGHT_TTL_S, make_preflight_token, read_preflight_token
+from .gallery import exact_templates, get_gallery
+from .metrics import stage
+from .models import Attendance, AttendanceAttempt, Department, User
+
+EARTH_R = 6371000.0
+MAX_ACCURACY_M = 100.0
+DEFAULT_RADIUS_M = 200
+DEFAULT_TH = float(os.getenv("FACE_MATCH_TH", "0.35"))  # cosine ขั้นต่ำที่นับว่าเป็นคนเดียวกัน (ดู calibrate.py)
+PREFLIGHT_COORD_DP = int(os.getenv("PREFLIGHT_COORD_DP", "5"))  # ทศนิยมของ lat/lng ที่ token ผูก (5 ≈ 1 m)
+
+# กำหนดโซนเวลาองค์กร (UTC+7: Bangkok)
+BKK_TZ = timezone(timedelta(hours=7))
+
+metrics.describe("attendance_clock_rejected_total", "counter", "Clock requests rejected, by pipeline stage")
+metrics.describe("attendance_group_faces_total", "counter", "Faces in group-clock frames, by outcome")
+metrics.describe("attendance_preflight_total", "counter",
+                 "Preflight results (ok / failing stage) and preflight tokens presented to clock endpoints")
+
+
+def haversine_m(lat1, lng1, lat2, lng2) -> float:
+    dlat = radians(lat2 - lat1); dlng = radians(lng2 - lng1)
+    a = sin(dlat/2)**2 + cos(radians(lat1))*cos(radians(lat2))*sin(dlng/2)**2
+    return 2 * asin(sqrt(a)) * EARTH_R
+
+
+def derive_slot(now: datetime | None = None) -> str:
+    """
+    คืนค่า 'morning' | 'noon' | 'afternoon' | 'evening'
+    กำหนดช่วงเวลาได้ตามโจทย์/นโยบาย
+    """
+    t = (now or datetime.now(BKK_TZ)).astimezone(BKK_TZ)
+    h = t.hour  # 0-23
+    if h < 10:      # 00:00–09:59
+        return "morning"
+    if h < 13:      # 10:00–12:59
+        return "noon"
+    if h < 17:      # 13:00–16:59
+        return "afternoon"
+    return "evening" # 17:00–23:59
+
+
+def last_attendance(s: Session, user_id: int):
+    return s.exec(
+        select(Attendance).where(Attendance.user_id == user_id).order_by(Attendance.ts.desc())
+    ).first()
+
+
+def best_match_user(emb: np.ndarray, s: Session, th: float = DEFAULT_TH) -> Tuple[float, Optional[User]]:
+    # gallery cache ต่อ process (GALLERY_DTYPE / GALLERY_RERANK, ดู gallery.py)
+    with stage("match"):
+        hits = get_gallery(s).search(emb, k=1, exact=exact_templates(s))
+    if not hits:
+        return -1.0, None
+    uid, best_score = hits[0]
+    if best_score >= th:
+        return best_score, s.get(User, uid)
+    return best_score, None
+
+
+def log_attempt(
+    s: Session,
+    *,
+    success: bool,
+    me: Optional[User],
+    email: Optional[str],
+    action: str,
+    reason: Optional[str],
+    lat: Optional[float],
+    lng: Optional[float],
+    accuracy: Optional[float],
+    score: Optional[float],
+    distance_m: Optional[float],
+    department_id: Optional[int],
+    client_ip: Optional[str],
+    user_agent: Optional[str],
+    image_sha256: Optional[str] = None,  # None = รูปของ request นี้ (image_archive.current)
+    slot: Optional[str] = None,  # ✅ keep this
+    commit: bool = True,         # False = แค่ add (ผู้เรียก commit เองทีเดียว เช่น group clock)
+):
+    if slot is None:
+        slot = derive_slot()
+    rec = AttendanceAttempt(
+        user_id = me.id if me else None,
+        email = email,
+        action = action,
+        success = success,
+        reason = reason,
+        lat = lat, lng = lng, accuracy = accuracy,
+        score = score, distance_m = distance_m,
+        department_id = department_id,
+        client_ip = client_ip,
+        user_agent = user_agent,
+        image_sha256 = image_sha256 or image_archive.current.get(),
+        slot = slot,  # ✅ save
+        trace_id = tracing.current_trace_id(),
+    )
+    with stage("log_attempt"):
+        s.add(rec)
+        if commit:
+            s.commit()
+    metrics.inc("attendance_attempts_total",
+                {"action": action, "reason": metrics.reason_label(reason, success)})
+
+
+# ---------- pipeline ----------
+class Reject(Exception):
+    """stage ไม่ผ่าน: status/detail → HTTPException, reason → AttendanceAttempt.reason (default = detail)"""
+
+    def __init__(self, status: int, detail: str, reason: Optional[str] = None):
+        super().__init__(detail)
+        self.status, self.detail, self.reason = status, detail, reason or detail
+
+
+@dataclass
+class ClockRequest:
+    s: Session
+    action: str                          # "in" | "out"
+    lat: float
+    lng: float
+    accuracy: Optional[float] = None
+    ip: Optional[str] = None
+    ua: Optional[str] = None
+    th: float = DEFAULT_TH
+    user: Optional[User] = None          # None = anonymous (รู้ตัวตนหลัง identify)
+    extract: Optional[Callable] = None   # () -> (emb, bbox) | None, เรียกเฉพาะเมื่อผ่าน stage ราคาถูกหมดแล้ว
+    reason: Optional[str] = None         # reason ของ attempt ที่สำเร็จ (เช่น "manual")
+    slot: str = field(default_factory=derive_slot)
+    dep: Optional[Department] = None
+    dist_m: Optional[float] = None
+    score: Optional[float] = None
+    emb: Optional[np.ndarray] = None
+    preflight: bool = False              # มี preflight token ที่ใช้ได้ → ข้าม stage ก่อนรูป
+
+    def response(self, rec: Attendance) -> dict:
+        u = self.user
+        return {"ok": True, "action": self.action, "slot": self.slot,
+                "score": self.score, "distance_m": int(self.dist_m), "attendance_id": rec.id,
+                "user": {"id": u.id, "email": u.email, "name": u.name}}
+
+
+# --- stage ที่ไม่ต้องใช้รูป ---
+def check_enrolled(r: ClockRequest):
+    if not r.user.embeddings_json:
+        raise Reject(400, "no enrolled face for this user")
+
+def check_department(r: ClockRequest):
+    if not r.user.department_id:
+        raise Reject(403, "No department assigned")
+    r.dep = r.s.get(Department, r.user.department_id)
+    if not r.dep:
+        raise Reject(403, "Department not found")
+
+def check_accuracy(r: ClockRequest):
+    if r.accuracy is not None and r.accuracy > MAX_ACCURACY_M:
+        raise Reject(400, "Location accuracy too low")
+
+def _out_of_area(dist_m: float, allow: float) -> Reject:
+    return Reject(403, f"Out of permitted area: {int(dist_m)}m > {int(allow)}m")
+
+def check_geofence(r: ClockRequest):
+    with stage("geofence"):
+        r.dist_m = haversine_m(r.dep.lat, r.dep.lng, r.lat, r.lng)
+        allow = (r.dep.radius_m or DEFAULT_RADIUS_M) + (r.accuracy or 0.0)
+    if r.dist_m > allow:
+        raise _out_of_area(r.dist_m, allow)
+
+def check_any_geofence(r: ClockRequest):
+    # anonymous: ยังไม่รู้ว่าใคร → ต้องอยู่ในรัศมีของ department ใดก็ได้ก่อนจะเสีย inference
+    with stage("geofence"):
+        deps = r.s.exec(select(Department)).all()
+        near = [(haversine_m(d.lat, d.lng, r.lat, r.lng), (d.radius_m or DEFAULT_RADIUS_M) + (r.accuracy or 0.0))
+                for d in deps]
+    if not near:
+        raise Reject(403, "Department not found")
+    if not any(d <= allow for d, allow in near):
+        raise _out_of_area(*min(near, key=lambda x: x[0] - x[1]))
+
+def check_clocked_in(r: ClockRequest):
+    if r.action == "out":
+        last = last_attendance(r.s, r.user.id)
+        if not last or last.action != "in":
+            raise Reject(400, "not clocked in yet", r.reason and f"not clocked in yet ({r.reason})")
+
+
+# --- stage ที่ใช้รูป ---
+def _extract(r: ClockRequest):
+    res = r.extract()
+    if not res:
+        raise Reject(400, "face not found")
+    r.emb, _ = res
+
+def verify_face(r: ClockRequest):
+    # 1:1 กับ template ของ user ที่ login
+    _extract(r)
+    with stage("match"):
+        targets = [np.array(x, dtype=np.float32) for x in json.loads(r.user.embeddings_json or "[]")]
+        best = max(float(np.dot(r.emb, t)) for t in targets) if targets else -1.0
+    r.score = best
+    if best < r.th:
+        raise Reject(403, f"face mismatch (score={best:.2f} < th={r.th})")
+
+def identify_face(r: ClockRequest):
+    # 1:N กับ gallery ทั้งหมด (anonymous)
+    _extract(r)
+    r.score, r.user = best_match_user(r.emb, r.s, th=r.th)
+    if not r.user:
+        raise Reject(401, "face not recognized", f"face mismatch (score={r.score:.2f} < th={r.th})")
+
+
+# ลำดับ stage ต่อชนิด endpoint (ราคาถูก → แพง)
+FACE = [check_enrolled, check_clocked_in, check_department, check_accuracy, check_geofence, verify_face]
+MANUAL = [check_clocked_in, check_department, check_accuracy, check_geofence]
+ANONYMOUS_PRE = [check_accuracy, check_any_geofence]
+ANONYMOUS_POST = [check_enrolled, check_department, check_geofence, check_clocked_in]  # หลังรู้ตัวตน
+ANONYMOUS = ANONYMOUS_PRE + [identify_face] + ANONYMOUS_POST
+
+IMAGE_STAGES = {verify_face, identify_face}
+RECHECK = {check_clocked_in}  # สถานะเปลี่ยนทุกครั้งที่ลงเวลา → token เดิมใช้ซ้ำ clock-out สองรอบไม่ได้
+
+
+def _before_image(stages: list) -> list:
+    i = next((i for i, fn in enumerate(stages) if fn in IMAGE_STAGES), len(stages))
+    return stages[:i]
+
+
+def _claims(r: ClockRequest) -> dict:
+    # สิ่งที่ preflight token รับรอง: ต้องตรงกับ request จริงทุกค่า (หลังปัด – เทียบ float ตรง ๆ พลาดง่าย)
+    return {"uid": r.user.id if r.user else None, "act": r.action,
+            "lat": round(r.lat, PREFLIGHT_COORD_DP), "lng": round(r.lng, PREFLIGHT_COORD_DP),
+            "acc": round(r.accuracy) if r.accuracy is not None else None}
+
+
+def preflight(r: ClockRequest, stages: list) -> dict:
+    """รันเฉพาะ stage ก่อนรูป (ไม่ log attempt) → ok + token หรือเหตุผลที่ไม่ผ่าน"""
+    for fn in _before_image(stages):
+        try:
+            fn(r)
+        except Reject as e:
+            metrics.inc("attendance_preflight_total", {"result": fn.__name__})
+            return {"ok": False, "status": e.status, "detail": e.detail, "stage": fn.__name__}
+    metrics.inc("attendance_preflight_total", {"result": "ok"})
+    return {"ok": True, "token": make_preflight_token({**_claims(r), "dist": r.dist_m}),
+            "expires_in": PREFLIGHT_TTL_S,
+            "distance_m": int(r.dist_m) if r.dist_m is not None else None}
+
+
+def accept_preflight(r: ClockRequest, token: Optional[str]):
+    # token ไม่ถูกต้อง / หมดอายุ / ไม่ตรงกับ request → ตรวจเต็มตามปกติ (ไม่ error)
+    if not token:
+        return
+    data = read_preflight_token(token)
+    ok = data is not None and all(data.get(k) == v for k, v in _claims(r).items())
+    metrics.inc("attendance_preflight_total", {"result": "token_accepted" if ok else "token_ignored"})
+    if ok:
+        r.preflight, r.dist_m = True, data.get("dist")
+
+
+def log_request(r: ClockRequest, success: bool, reason: Optional[str], commit: bool = True):
+    u = r.user
+    log_attempt(r.s, success=success, me=u, email=u.email if u else None, action=r.action,
+                reason=reason, lat=r.lat, lng=r.lng, accuracy=r.accuracy, score=r.score,
+                distance_m=r.dist_m, department_id=u.department_id if u else None,
+                client_ip=r.ip, user_agent=r.ua, slot=r.slot, commit=commit)
+
+
+def run(r: ClockRequest, stages: list, commit: bool = True) -> Attendance:
+    """รัน stage ตามลำดับ, stage แรกที่ไม่ผ่าน → log attempt + HTTPException; ผ่านหมด → บันทึก Attendance
+
+    commit=False → add ลง session อย่างเดียว (rec.id ยังไม่มีจนกว่าผู้เรียกจะ flush/commit)
+    """
+    skip = set(_before_image(stages)) - RECHECK if r.preflight else set()
+    for fn in stages:
+        if fn in skip:
+            continue
+        try:
+            fn(r)
+        except Reject as e:
+            metrics.inc("attendance_clock_rejected_total", {"stage": fn.__name__})
+            log_request(r, False, e.reason, commit)
+            raise HTTPException(e.status, e.detail)
+
+    # สำเร็จ → บันทึก Attendance + Attempt(success)
+    rec = Attendance(user_id=r.user.id, score=r.score, action=r.action,
+                     lat=r.lat, lng=r.lng, distance_m=r.dist_m, slot=r.slot)
+    with stage("commit"):
+        r.s.add(rec)
+        if commit:
+            r.s.commit(); r.s.refresh(rec)
+    log_request(r, True, r.reason, commit)
+    return rec
+
+
+def run_group(r: ClockRequest, extract_all: Callable[[], list], stages: list = ANONYMOUS_POST) -> dict:
+    """ลงเวลาทุกคนที่จำได้ในเฟรมเดียว: extract_all() -> [(emb, bbox), ...]
+
+    ผลต่อหน้าอยู่ใน "results" (ลำดับเดียวกับ extract_all); เฟรมไม่ผ่าน (ตำแหน่ง / ไม่มีหน้า) → HTTPException
+    """
+    name = None
+    try:
+        for fn in [] if r.preflight else ANONYMOUS_PRE:
+            name = fn.__name__
+            fn(r)
+        name = "extract_all"
+        faces = extract_all()
+        if not faces:
+            raise Reject(400, "face not found")
+    except Reject as e:
+        metrics.inc("attendance_clock_rejected_total", {"stage": name})
+        log_request(r, False, e.reason)
+        raise HTTPException(e.status, e.detail)
+
+    with stage("match"):
+        hits = get_gallery(r.s).search_many(np.stack([emb for emb, _ in faces]), k=1, exact=exact_templates(r.s))
+    # หลายหน้า match คนเดียวกัน (เงาสะท้อน / รูปบนบัตร) → ลงเวลาให้หน้าที่ score สูงสุดหน้าเดียว
+    best: dict = {}
+    for i, h in enumerate(hits):
+        if h and h[0][1] >= r.th and (h[0][0] not in best or h[0][1] > hits[best[h[0][0]]][0][1]):
+            best[h[0][0]] = i
+
+    results, done = [], []
+    for i, ((emb, bbox), h) in enumerate(zip(faces, hits)):
+        score = h[0][1] if h else -1.0
+        item = {"bbox": [int(x) for x in bbox], "score": round(score, 4)}
+        results.append(item)
+        if not h or score < r.th:
+            fr = replace(r, score=score, emb=emb)
+            log_request(fr, False, f"face mismatch (score={score:.2f} < th={r.th})", commit=False)
+            item.update(ok=False, status=401, detail="face not recognized")
+            continue
+        if best[h[0][0]] != i:
+            fr = replace(r, user=r.s.get(User, h[0][0]), score=score, emb=emb)
+            log_request(fr, False, "duplicate face", commit=False)  # ทุกหน้าในเฟรมต้องมี attempt
+            item.update(ok=False, status=409, detail="duplicate face", user_id=h[0][0])
+            continue
+        # preflight รับรองแค่ตำแหน่งของเฟรม → stage ต่อคนตรวจเต็มเสมอ
+        fr = replace(r, user=r.s.get(User, h[0][0]), score=score, emb=emb, preflight=False)
+        try:
+            done.append((item, fr, run(fr, stages, commit=False)))
+        except HTTPException as e:
+            item.update(ok=False, status=e.status_code, detail=e.detail, user_id=h[0][0])
+
+    with stage("commit"):
+        r.s.flush()  # ได้ id ของ Attendance ทุกแถวโดยไม่ต้อง refresh ทีละแถวหลัง commit
+        for item, fr, rec in done:
+            item.update(fr.response(rec))
+        r.s.commit()
+    for item in results:
+        metrics.inc("attendance_group_faces_total", {"result": "clocked" if item["ok"] else str(item["status"])})
+    return {"ok": bool(done), "action": r.action, "faces": len(faces), "clocked": len(done), "results": results}
@@ -1,13 +1,16 @@
 # backend/app/deps.py
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy.exc import DatabaseError
 from sqlmodel import Session, SQLModel, create_engine, select
 from jose import jwt, JWTError
 from pathlib import Path
+from typing import Optional
 import os
 
 # นำเข้าทุกโมเดล เพื่อให้ create_all รู้จักทุกตาราง
-from .models import User, Attendance, Department
+from .models import User, Attendance, Department, GalleryChange, GalleryVersion  # noqa: F401
+from . import tracing
 
 # ---- DB path แบบเสถียร (อิงไฟล์นี้) ----
 BASE_DIR = Path(__file__).resolve().parent           # .../backend/app
@@ -21,11 +24,17 @@ engine = create_engine(
     DB_URL,
     connect_args={"check_same_thread": False} if DB_URL.startswith("sqlite") else {},
 )
+tracing.instrument_engine(engine)  # span ต่อ SQL statement
 
 def init_db():
-    SQLModel.metadata.create_all(engine)
+    # หลาย worker start พร้อมกันตอนมีตารางใหม่ → อีก worker อาจ CREATE ตัดหน้าระหว่าง check กับ create → ลองซ้ำ
+    try:
+        SQLModel.metadata.create_all(engine)
+    except DatabaseError:
+        SQLModel.metadata.create_all(engine)
 
 oauth2 = OAuth2PasswordBearer(tokenUrl="/api/login")
+oauth2_optional = OAuth2PasswordBearer(tokenUrl="/api/login", auto_error=False)
 JWT_SECRET = os.getenv("JWT_SECRET", "CHANGE_ME")
 ALG = "HS256"
 
@@ -38,12 +47,17 @@ def get_current_user(token: str = Depends(oauth2), s: Session = Depends(get_sess
         data = jwt.decode(token, JWT_SECRET, algorithms=[ALG])
         email = data.get("sub")
         u = s.exec(select(User).where(User.email == email)).first()
-        if not u:
+        if not u or not u.active:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
         return u
     except JWTError:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
 
+def get_optional_user(token: Optional[str] = Depends(oauth2_optional),
+                      s: Session = Depends(get_session)) -> Optional[User]:
+    # endpoint ที่ใช้ได้ทั้ง login และ kiosk (ไม่มี token = None, token ผิด = 401)
+    return get_current_user(token, s) if token else None
+
 def require_admin(u: User = Depends(get_current_user)) -> User:
     if u.role != "admin":
         raise HTTPException(status_code=403, detail="Admin only")
@@ -0,0 +1,129 @@
+# backend/app/enroll_policy.py
+# นโยบายจัดการ template ใบหน้าต่อผู้ใช้ (dedupe / cap / centroids + outliers)
+# ใช้ทั้งตอน enroll (incremental) และงาน compaction แบบ bulk (scripts/compact_templates.py)
+#
+# - embedding ใหม่ชนะตอน dedupe และ cap เลือกจาก template ที่แทน embedding ใหม่ก่อน → enroll แล้วต้องมีผลเสมอ
+# - clustering ทำจาก embedding ดิบ (User.raw_embeddings_json, สูงสุด ENROLL_MAX_RAW) ไม่ใช่ template เดิม
+#   (template เดิมเป็น centroid แล้ว – คลัสเตอร์ซ้ำทุก enroll ทำให้ centroid เลื่อนไปเรื่อย ๆ)
+#   user ที่ยังไม่มี raw (enroll ก่อนมี column นี้) ใช้ template เดิมเป็นจุดเริ่ม
+from dataclasses import dataclass
+from typing import Optional
+import os
+import numpy as np
+
+DEDUP_TH = float(os.getenv("ENROLL_DEDUP_TH", "0.92"))       # cos >= ค่านี้ถือว่าซ้ำ
+MAX_TEMPLATES = int(os.getenv("ENROLL_MAX_TEMPLATES", "8"))  # 0 = ไม่จำกัด
+CENTROIDS = int(os.getenv("ENROLL_CENTROIDS", "0"))          # 0 = ไม่ทำ clustering
+OUTLIER_TH = float(os.getenv("ENROLL_OUTLIER_TH", "0.55"))   # cos กับ centroid ต่ำกว่านี้ → เก็บเป็น outlier
+MAX_RAW = int(os.getenv("ENROLL_MAX_RAW", "32"))             # embedding ดิบที่เก็บไว้ให้ clustering (0 = ไม่จำกัด)
+
+
+def _as_matrix(embs) -> np.ndarray:
+    m = np.asarray(embs, dtype=np.float32)
+    n = np.linalg.norm(m, axis=1, keepdims=True)
+    return m / np.maximum(n, 1e-12)
+
+
+def _dedupe_idx(m: np.ndarray, th: float, first=()) -> list[int]:
+    # greedy: ไล่ตัวใน first ก่อน (embedding ใหม่ชนะตัวเก่าที่ซ้ำ) แล้วตามลำดับเดิม ตัดตัวที่ใกล้กับที่เก็บไว้แล้วเกิน th
+    first = [int(i) for i in first]
+    rest = set(first)
+    keep: list[int] = []
+    for i in first + [i for i in range(len(m)) if i not in rest]:
+        if keep and float(np.max(m[keep] @ m[i])) >= th:
+            continue
+        keep.append(i)
+    return sorted(keep)
+
+
+def dedupe(m: np.ndarray, th: float = DEDUP_TH) -> np.ndarray:
+    return m[_dedupe_idx(m, th)]
+
+
+def _farthest_first(m: np.ndarray, n: int, seed=()) -> list[int]:
+    # เริ่มจาก seed (หรือ medoid) แล้วเลือกตัวที่ไกลจากชุดที่เลือกแล้วมากสุด → ครอบคลุมมุม/แสงได้กว้าง
+    sims = m @ m.T
+    picked = list(dict.fromkeys(int(i) for i in seed))[:n] or [int(np.argmax(sims.sum(axis=1)))]
+    closest = sims[picked].max(axis=0)
+    while len(picked) < n:
+        i = int(np.argmin(closest))
+        picked.append(i)
+        closest = np.maximum(closest, sims[i])
+    return sorted(picked)
+
+
+def _cap_idx(m: np.ndarray, max_n: int, keep=()) -> list[int]:
+    if max_n <= 0 or len(m) <= max_n:
+        return list(range(len(m)))
+    return _farthest_first(m, max_n, keep)
+
+
+def cap(m: np.ndarray, max_n: int = MAX_TEMPLATES) -> np.ndarray:
+    return m[_cap_idx(m, max_n)]
+
+
+def _cluster(m: np.ndarray, k: int, outlier_th: float, iters: int = 10) -> tuple:
+    # (templates, rep): rep[i] = แถวใน templates ที่แทน m[i] (centroid ของมัน หรือตัวมันเองถ้าเป็น outlier)
+    if k <= 0 or len(m) <= k:
+        return m, np.arange(len(m))
+    c = m[_farthest_first(m, k)]
+    for _ in range(iters):
+        assign = np.argmax(m @ c.T, axis=1)
+        for j in range(k):
+            members = m[assign == j]
+            if len(members):
+                v = members.sum(axis=0)
+                c[j] = v / max(float(np.linalg.norm(v)), 1e-12)
+    sims = m @ c.T
+    assign = np.argmax(sims, axis=1)
+    out = np.nonzero(sims[np.arange(len(m)), assign] < outlier_th)[0]
+    rep = assign.copy()
+    rep[out] = k + np.arange(len(out))
+    return (np.vstack([c, m[out]]) if len(out) else c), rep
+
+
+def cluster(m: np.ndarray, k: int = CENTROIDS, outlier_th: float = OUTLIER_TH,
+            iters: int = 10) -> np.ndarray:
+    """spherical k-means → k centroids (normalize แล้ว) + ตัวที่อยู่ไกล centroid ของตัวเองเป็น outlier"""
+    return _cluster(m, k, outlier_th, iters)[0]
+
+
+@dataclass
+class EnrollResult:
+    templates: list          # → User.embeddings_json (ที่ gallery ใช้)
+    raw: Optional[list]      # → User.raw_embeddings_json (None = ไม่ได้ทำ clustering ไม่ต้องเก็บ)
+    kept_new: int            # embedding ใหม่ที่มี template แทน (ตัวเอง หรือ centroid ของมัน) หลัง cap
+
+
+class EnrollPolicy:
+    def __init__(self, dedup_th: float = DEDUP_TH, max_templates: int = MAX_TEMPLATES,
+                 centroids: int = CENTROIDS, outlier_th: float = OUTLIER_TH, max_raw: int = MAX_RAW):
+        self.dedup_th = dedup_th
+        self.max_templates = max_templates
+        self.centroids = centroids
+        self.outlier_th = outlier_th
+        self.max_raw = max_raw
+
+    def apply(self, existing: list, new: Optional[list] = None, raw: Optional[list] = None) -> EnrollResult:
+        """รวม template เดิม (หรือ raw ถ้าทำ clustering) + ใหม่ แล้วผ่าน dedupe / clustering / cap (พร้อม json.dumps)"""
+        clustering = self.centroids > 0
+        old = list((raw or existing or []) if clustering else (existing or []))
+        new = list(new or [])
+        if not old and not new:
+            return EnrollResult([], [] if clustering else None, 0)
+        m = _as_matrix(old + new)
+        idx = _dedupe_idx(m, self.dedup_th, first=range(len(old), len(m)))
+        m, is_new = m[idx], np.array([i >= len(old) for i in idx])
+        out_raw = None
+        if clustering:
+            keep = _cap_idx(m, self.max_raw, np.nonzero(is_new)[0])
+            m, is_new = m[keep], is_new[keep]
+            out_raw = m.tolist()
+            t, rep = _cluster(m, self.centroids, self.outlier_th)
+        else:
+            t, rep = m, np.arange(len(m))
+        keep = _cap_idx(t, self.max_templates, np.unique(rep[is_new]))
+        return EnrollResult(t[keep].tolist(), out_raw, int(np.isin(rep[is_new], keep).sum()))
+
+
+policy = EnrollPolicy()
@@ -0,0 +1,102 @@
+# backend/app/extract_cache.py
+# cache ผล FaceService.extract ตาม hash ของไฟล์ที่อัปโหลด (bytes ดิบ ก่อน decode)
+# kiosk / มือถือเน็ตไม่ดี มัก retry ส่ง JPEG เดิมซ้ำหลัง timeout → ครั้งที่ซ้ำเหลือแค่ hash + lookup
+#
+# - เก็บ (embedding, bbox) หรือ None (= ไม่เจอหน้า) ต่อ process, LRU + TTL (EXTRACT_CACHE_TTL_S)
+# - จำกัดหน่วยความจำรวมที่ EXTRACT_CACHE_MB (0 = ปิด cache)
+# - hit/miss ดูได้ที่ /api/metrics (attendance_extract_cache_total) และ /api/admin/extract-cache
+from collections import OrderedDict
+from typing import Optional
+import hashlib
+import os
+import threading
+import time
+
+from . import metrics
+
+CACHE_MB = float(os.getenv("EXTRACT_CACHE_MB", "32"))
+TTL_S = float(os.getenv("EXTRACT_CACHE_TTL_S", "120"))
+_ENTRY_OVERHEAD = 200  # key + tuple + OrderedDict node (ประมาณ)
+
+metrics.describe("attendance_extract_cache_total", "counter", "Extraction cache lookups by result")
+metrics.describe("attendance_extract_cache_bytes", "gauge", "Approximate memory held by the extraction cache")
+
+_lock = threading.Lock()
+_items: OrderedDict = OrderedDict()  # key -> (expires, value, nbytes)
+_bytes = 0
+_stats = {"hits": 0, "misses": 0, "expired": 0, "evicted": 0}
+
+
+def key(data: bytes) -> bytes:
+    # blake2b 128-bit: เร็วระดับ GB/s และชนกันไม่ได้ในทางปฏิบัติ
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+def _size(value) -> int:
+    if value is None:
+        return _ENTRY_OVERHEAD
+    emb, bbox = value
+    return _ENTRY_OVERHEAD + getattr(emb, "nbytes", 0) + getattr(bbox, "nbytes", 0)
+
+
+def _drop(k):
+    global _bytes
+    _, _, n = _items.pop(k)
+    _bytes -= n
+
+
+def get(k: bytes) -> tuple[bool, Optional[tuple]]:
+    """(hit, value) – value None = ไม่เจอหน้า (cache ไว้เหมือนกัน)"""
+    if CACHE_MB <= 0:
+        return False, None
+    now = time.monotonic()
+    with _lock:
+        item = _items.get(k)
+        if item is not None and item[0] < now:
+            _drop(k)
+            _stats["expired"] += 1
+            item = None
+        if item is None:
+            _stats["misses"] += 1
+        else:
+            _items.move_to_end(k)
+            _stats["hits"] += 1
+    metrics.inc("attendance_extract_cache_total", {"result": "miss" if item is None else "hit"})
+    return (False, None) if item is None else (True, item[1])
+
+
+def put(k: bytes, value: Optional[tuple]):
+    global _bytes
+    if CACHE_MB <= 0:
+        return
+    n = _size(value)
+    cap = CACHE_MB * 2**20
+    with _lock:
+        if k in _items:
+            _drop(k)
+        _items[k] = (time.monotonic() + TTL_S, value, n)
+        _bytes += n
+        now = time.monotonic()
+        # ตัดตัวที่หมดอายุ/เก่าที่สุดออกจนไม่เกิน cap (LRU อยู่หัว OrderedDict)
+        while _items and (_bytes > cap or next(iter(_items.values()))[0] < now):
+            old = next(iter(_items))
+            expired = _items[old][0] < now
+            _drop(old)
+            _stats["expired" if expired else "evicted"] += 1
+        size = _bytes
+    metrics.set_gauge("attendance_extract_cache_bytes", size)
+
+
+def stats() -> dict:
+    with _lock:
+        s = dict(_stats, entries=len(_items), bytes=_bytes)
+    total = s["hits"] + s["misses"]
+    s.update(hit_rate=round(s["hits"] / total, 4) if total else None, cap_mb=CACHE_MB, ttl_s=TTL_S)
+    return s
+
+
+def clear():
+    global _bytes
+    with _lock:
+        _items.clear()
+        _bytes = 0
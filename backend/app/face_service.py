@@ -1,19 +1,309 @@
-from insightface.app import FaceAnalysis
+# insightface (→ onnxruntime, cv2, skimage ...) import ช้า → import ตอนสร้าง FaceService (ใน _warmup ของ main.py)
 import numpy as np
+from pathlib import Path
 from typing import Optional, Tuple
+import os
+import time
+
+from . import metrics, tracing
+from .metrics import stage
+
+# ---- ONNX Runtime session tuning (ใช้กับทั้ง detection และ recognition) ----
+# ค่า default ของ ORT = intra-op thread เท่าจำนวน core ต่อ session → หลาย gunicorn worker แย่ง CPU กันเอง
+# auto = core / WEB_CONCURRENCY (จำนวน worker ของ gunicorn), 0 = ให้ ORT เลือกเอง
+# หาค่าที่ดีที่สุดของเครื่องด้วย bench/bench_ort.py
+ORT_INTRA_THREADS = os.getenv("ORT_INTRA_THREADS", "auto")
+ORT_INTER_THREADS = int(os.getenv("ORT_INTER_THREADS", "0"))      # ใช้เฉพาะ execution mode = parallel
+ORT_OPT_LEVEL = os.getenv("ORT_OPT_LEVEL", "all")                 # disable | basic | extended | all
+ORT_EXECUTION_MODE = os.getenv("ORT_EXECUTION_MODE", "sequential")  # sequential | parallel
+ORT_ALLOW_SPINNING = os.getenv("ORT_ALLOW_SPINNING", "1") == "1"  # 0 = thread ไม่ busy-wait ระหว่าง op (ลด CPU เมื่อ oversubscribe)
+ORT_CPU_ARENA = os.getenv("ORT_CPU_ARENA", "1") == "1"
+ORT_MEM_PATTERN = os.getenv("ORT_MEM_PATTERN", "1") == "1"
+# เก็บโมเดลที่ optimize แล้วลง disk → รอบถัดไปโหลดไฟล์นี้และข้ามขั้น graph optimization
+# (level all อาจมี optimization เฉพาะ CPU เครื่องนั้น → ให้ชี้ไป volume ของ host ไม่ใช่ bake ลง image)
+ORT_OPTIMIZED_DIR = os.getenv("ORT_OPTIMIZED_DIR", "")
+
+# ---- engine mode ----
+# fp32 = โมเดลเดิมของ pack, int8-dynamic / int8-static = ไฟล์ที่สร้างด้วย scripts/quantize_models.py
+# (เลือกตาม deployment หลังดูผล bench/bench_quant.py) – ไฟล์อยู่ใน FACE_QUANT_DIR หรือ <model dir>_int8
+FACE_MODEL_VARIANT = os.getenv("FACE_MODEL_VARIANT", "fp32")
+FACE_QUANT_DIR = os.getenv("FACE_QUANT_DIR", "")
+VARIANTS = ("fp32", "int8-dynamic", "int8-static")
+
+
+def quant_path(model_file: str, variant: str, quant_dir: str = "") -> Path:
+    d = Path(quant_dir or FACE_QUANT_DIR or f"{Path(model_file).parent}_int8")
+    return d / f"{Path(model_file).stem}.{variant}.onnx"
+
+
+def intra_threads(value: str = ORT_INTRA_THREADS) -> int:
+    if value == "auto":
+        return max(1, (os.cpu_count() or 1) // max(1, int(os.getenv("WEB_CONCURRENCY", "1"))))
+    return int(value)
+
+
+def session_options(intra: Optional[int] = None, inter: Optional[int] = None, opt_level: Optional[str] = None):
+    import onnxruntime as ort
+
+    levels = {"disable": ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+              "basic": ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+              "extended": ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+              "all": ort.GraphOptimizationLevel.ORT_ENABLE_ALL}
+    so = ort.SessionOptions()
+    so.intra_op_num_threads = intra_threads() if intra is None else intra
+    so.inter_op_num_threads = ORT_INTER_THREADS if inter is None else inter
+    so.graph_optimization_level = levels[opt_level or ORT_OPT_LEVEL]
+    so.execution_mode = (ort.ExecutionMode.ORT_PARALLEL if ORT_EXECUTION_MODE == "parallel"
+                         else ort.ExecutionMode.ORT_SEQUENTIAL)
+    so.enable_cpu_mem_arena = ORT_CPU_ARENA
+    so.enable_mem_pattern = ORT_MEM_PATTERN
+    if not ORT_ALLOW_SPINNING:
+        so.add_session_config_entry("session.intra_op.allow_spinning", "0")
+        so.add_session_config_entry("session.inter_op.allow_spinning", "0")
+    return so
+
+
+def build_session(model_file: str, providers=None, **opts):
+    """InferenceSession ตาม ORT_* (ถ้าตั้ง ORT_OPTIMIZED_DIR ใช้/สร้างไฟล์ที่ optimize แล้ว)"""
+    import onnxruntime as ort
+
+    so = session_options(**opts)
+    providers = providers or ort.get_available_providers()
+    if ORT_OPTIMIZED_DIR and so.graph_optimization_level != ort.GraphOptimizationLevel.ORT_DISABLE_ALL:
+        level = opts.get("opt_level") or ORT_OPT_LEVEL
+        opt = Path(ORT_OPTIMIZED_DIR) / f"{Path(model_file).stem}.{level}.ort{ort.__version__}.onnx"
+        if opt.is_file():
+            so.graph_optimization_level = ort.GraphOptimizationLevel.ORT_DISABLE_ALL
+            return ort.InferenceSession(str(opt), sess_options=so, providers=providers)
+        # หลาย worker สร้างพร้อมกัน → ORT เขียนไฟล์ของ process ตัวเองก่อน แล้ว rename ทีเดียว
+        # (worker อื่นเห็น opt.is_file() เฉพาะตอนไฟล์ครบแล้ว ไม่โหลดไฟล์ที่เขียนค้างครึ่งทาง)
+        opt.parent.mkdir(parents=True, exist_ok=True)
+        tmp = opt.with_name(f"{opt.name}.{os.getpid()}.tmp")
+        so.optimized_model_filepath = str(tmp)
+        sess = ort.InferenceSession(model_file, sess_options=so, providers=providers)
+        if tmp.is_file():
+            os.replace(tmp, opt)
+        return sess
+    return ort.InferenceSession(model_file, sess_options=so, providers=providers)
+
+
+# ---- module set ----
+# extract ใช้แค่ detection (bbox + kps สำหรับ align) และ recognition (normed embedding)
+# → โหลดเฉพาะที่ระบุ ไม่ต้องสร้าง session ให้ landmark / genderage ที่ pack บางตัว (เช่น buffalo_l) มี
+FACE_MODULES = tuple(m.strip() for m in os.getenv("FACE_MODULES", "detection,recognition").split(",") if m.strip())
+REQUIRED_MODULES = ("detection", "recognition")
+
+# ---- cascaded detection ----
+# ภาพ kiosk/selfie หน้าเต็มเฟรม → detect ที่ขนาดเล็กก่อน (เช่น 160,320) รับผลถ้าหน้าใหญ่สุดมั่นใจพอและใหญ่พอ
+# ไม่งั้น escalate ไปขนาดถัดไปจนถึง DET_SIZE (ว่าง = ปิด, detect ที่ DET_SIZE อย่างเดียวเหมือนเดิม)
+DET_SIZE = 640
+FACE_DET_CASCADE = tuple(int(x) for x in os.getenv("FACE_DET_CASCADE", "").split(",") if x.strip())
+FACE_CASCADE_MIN_SCORE = float(os.getenv("FACE_CASCADE_MIN_SCORE", "0.7"))
+FACE_CASCADE_MIN_FACE = float(os.getenv("FACE_CASCADE_MIN_FACE", "0.2"))  # ด้านสั้นของ bbox / ด้านสั้นของภาพ
+metrics.describe("attendance_detect_total", "counter",
+                 "Face detections by the det_size that produced the accepted result (cascade escalation rate)")
+
+# ---- group mode (extract_all): ทุกหน้าในเฟรมที่ผ่านเกณฑ์ → embed เป็น batch เดียว ----
+FACE_GROUP_MIN_SCORE = float(os.getenv("FACE_GROUP_MIN_SCORE", "0.6"))
+FACE_GROUP_MIN_PX = int(os.getenv("FACE_GROUP_MIN_PX", "40"))   # ด้านสั้นของ bbox (pixel ของภาพที่ส่งมา)
+FACE_GROUP_MAX = int(os.getenv("FACE_GROUP_MAX", "16"))         # หน้าใหญ่สุด N หน้า ต่อเฟรม
+
+
+# insightface → albumentations เช็คเวอร์ชันใหม่ผ่าน network ตอน import (ช้า/timeout บนเครื่องที่ไม่มี internet)
+os.environ.setdefault("NO_ALBUMENTATIONS_UPDATE", "1")
+
+
+def _rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, AttributeError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # peak (ไม่มี /proc)
+
+
+def route_model(path: str) -> Optional[str]:
+    """task ของไฟล์ .onnx ตามกฎเดียวกับ insightface ModelRouter แต่ดูจาก graph โดยไม่สร้าง session"""
+    import onnx
+
+    g = onnx.load(path).graph
+    inits = {i.name for i in g.initializer}
+    inputs = [i for i in g.input if i.name not in inits]
+    shape = [d.dim_value if d.HasField("dim_value") else None for d in inputs[0].type.tensor_type.shape.dim]
+    if len(g.output) >= 5:
+        return "detection"
+    if shape[2:4] == [192, 192]:
+        return "landmark"
+    if shape[2:4] == [96, 96]:
+        return "genderage"
+    if len(inputs) == 2 and shape[2:4] == [128, 128]:
+        return "inswapper"
+    if shape[2] and shape[2] == shape[3] and shape[2] >= 112 and shape[2] % 16 == 0:
+        return "recognition"
+    return None
+
 
 class FaceService:
-    def __init__(self, cpu: bool = True, model_name: str = "buffalo_sc"):
+    def __init__(self, cpu: bool = True, model_name: str = "buffalo_sc", variant: str = FACE_MODEL_VARIANT,
+                 modules: tuple = FACE_MODULES, cascade: tuple = FACE_DET_CASCADE):
+        import glob
+        from insightface.model_zoo.arcface_onnx import ArcFaceONNX
+        from insightface.model_zoo.landmark import Landmark
+        from insightface.model_zoo.attribute import Attribute
+        from insightface.model_zoo.retinaface import RetinaFace
+        from insightface.utils import ensure_available
+
+        if variant not in VARIANTS:
+            raise ValueError(f"FACE_MODEL_VARIANT must be one of {VARIANTS}")
+        missing = [m for m in REQUIRED_MODULES if m not in modules]
+        if missing:
+            raise ValueError(f"FACE_MODULES must include {missing} (used by extract)")
+        classes = {"detection": RetinaFace, "recognition": ArcFaceONNX, "landmark": Landmark, "genderage": Attribute}
         providers = ["CPUExecutionProvider"] if cpu else None
-        self.app = FaceAnalysis(name=model_name, providers=providers)
-        self.app.prepare(ctx_id=(-1 if cpu else 0), det_size=(640, 640))
+        ctx_id = -1 if cpu else 0
+        self.variant = variant
+        self.models, self.load_report = {}, {}
+
+        # แทน FaceAnalysis (ซึ่งสร้าง session ให้ทุกไฟล์ใน pack แล้วค่อยทิ้ง) → route จาก graph แล้วสร้าง
+        # session (ORT_* / variant) เฉพาะ module ที่ใช้ ครั้งเดียว
+        model_dir = ensure_available("models", model_name, root="~/.insightface")
+        for path in sorted(glob.glob(os.path.join(model_dir, "*.onnx"))):
+            task = route_model(path)
+            if task not in modules or task in self.models or task not in classes:
+                continue
+            t0, rss0 = time.perf_counter(), _rss_mb()
+            src = path
+            if variant != "fp32":
+                q = quant_path(path, variant)
+                if not q.is_file():
+                    raise FileNotFoundError(f"{q} not found (run: python -m scripts.quantize_models)")
+                src = str(q)
+            # model_file = ไฟล์ fp32 เสมอ (insightface อ่าน mean/std จาก graph), session = ไฟล์ตาม variant
+            m = classes[task](model_file=path, session=build_session(src, providers))
+            if task == "detection":
+                m.prepare(ctx_id, input_size=(DET_SIZE, DET_SIZE), det_thresh=0.5)
+            else:
+                m.prepare(ctx_id)
+            self.models[task] = m
+            self.load_report[task] = {"file": Path(src).name, "file_mb": round(Path(src).stat().st_size / 2**20, 2),
+                                      "load_s": round(time.perf_counter() - t0, 3),
+                                      "rss_mb": round(_rss_mb() - rss0, 1)}
+        missing = [m for m in REQUIRED_MODULES if m not in self.models]
+        if missing:
+            raise RuntimeError(f"model pack {model_name} has no {missing} model")
+        self.det = self.models["detection"]
+        self.rec = self.models["recognition"]
+        # cascade ใช้ session เดียวกัน (input ของ detector เป็น dynamic shape) – ถ้าโมเดลล็อกขนาด input ไว้ใช้ไม่ได้
+        fixed = self.det.session.get_inputs()[0].shape[2]
+        self.cascade = tuple(sorted(c for c in cascade if c < DET_SIZE)) if not isinstance(fixed, int) else ()
+        # recognizer ที่ export แบบ batch คงที่ (เช่น 1) → extract_all แบ่ง get_feat ตามขนาดนั้น
+        batch = self.rec.session.get_inputs()[0].shape[0]
+        self.rec_batch = batch if isinstance(batch, int) and batch > 0 else 0
+        self.verify()
+
+    def verify(self):
+        # ตรวจตอน startup ว่า module ที่โหลดยังให้ output ที่ extract ใช้ครบ (kps สำหรับ align + embedding)
+        if not self.det.use_kps:
+            raise RuntimeError("detection model does not output keypoints (needed for alignment)")
+        bboxes, kpss = self.det.detect(np.zeros((640, 640, 3), np.uint8), max_num=0, metric="default")
+        if bboxes.ndim != 2 or bboxes.shape[1] != 5 or kpss is None:
+            raise RuntimeError(f"unexpected detector output: bboxes {bboxes.shape}")
+        feat = self.rec.get_feat([np.zeros((112, 112, 3), np.uint8)])
+        if feat.ndim != 2 or feat.shape[0] != 1 or not np.isfinite(feat).all():
+            raise RuntimeError(f"unexpected recognizer output: {feat.shape}")
+        self.embedding_dim = int(feat.shape[1])
+
+    def warmup(self):
+        # inference แรกของแต่ละ session/ขนาด input ช้ากว่าปกติมาก (ORT จัด memory, anchor cache ของ detector)
+        # → รันภาพเปล่าทุกขนาดของ cascade + recognizer ก่อนรับ request
+        blank = np.zeros((DET_SIZE, DET_SIZE, 3), np.uint8)
+        for size in self.cascade + (DET_SIZE,):
+            self.det.detect(blank, input_size=(size, size), max_num=0, metric="default")
+        self.rec.get_feat([np.zeros((112, 112, 3), np.uint8)])
+
+    def detect(self, bgr):
+        """(bboxes, kpss, det_size ที่ใช้) – ไล่ cascade จากเล็กไปใหญ่ แล้วจบที่ DET_SIZE"""
+        h, w = bgr.shape[:2]
+        for size in self.cascade:
+            bboxes, kpss = self.det.detect(bgr, input_size=(size, size), max_num=0, metric="default")
+            if bboxes.shape[0]:
+                side = np.minimum(bboxes[:, 2] - bboxes[:, 0], bboxes[:, 3] - bboxes[:, 1])
+                i = int(np.argmax(side))
+                if bboxes[i, 4] >= FACE_CASCADE_MIN_SCORE and side[i] >= FACE_CASCADE_MIN_FACE * min(h, w):
+                    metrics.inc("attendance_detect_total", {"det_size": str(size)})
+                    return bboxes, kpss, size
+        bboxes, kpss = self.det.detect(bgr, max_num=0, metric="default")
+        metrics.inc("attendance_detect_total", {"det_size": str(DET_SIZE)})
+        return bboxes, kpss, DET_SIZE
 
     def extract(self, bgr) -> Optional[Tuple[np.ndarray, list]]:
-        faces = self.app.get(bgr)
-        if not faces:
+        if bgr is None:  # cv2.imdecode ไม่สำเร็จ
             return None
-        f = max(faces, key=lambda x:(x.bbox[2]-x.bbox[0])*(x.bbox[3]-x.bbox[1]))
-        return f.normed_embedding, f.bbox.astype(int)
+        with tracing.span("extract", shape=list(bgr.shape)) as sp:
+            # detect ทุกหน้า แต่ embed เฉพาะหน้าที่ใหญ่สุด (ผลเท่ากับ app.get แล้วเลือกหน้าใหญ่สุด)
+            with stage("detect"):
+                bboxes, kpss, size = self.detect(bgr)
+            if sp is not None:
+                sp["faces"], sp["det_size"] = int(bboxes.shape[0]), size
+            if bboxes.shape[0] == 0:
+                return None
+            i = int(np.argmax((bboxes[:, 2] - bboxes[:, 0]) * (bboxes[:, 3] - bboxes[:, 1])))
+            emb = self.embed(bgr, bboxes[i], kpss[i] if kpss is not None else None)
+            return emb, bboxes[i, 0:4].astype(int)
+
+    def extract_all(self, bgr, min_score: float = FACE_GROUP_MIN_SCORE, min_face_px: int = FACE_GROUP_MIN_PX,
+                    max_faces: int = FACE_GROUP_MAX) -> list:
+        """[(emb, bbox), ...] ของทุกหน้าที่ det score / ขนาดผ่านเกณฑ์ (ใหญ่ → เล็ก) – recognizer รันครั้งเดียวทั้ง batch"""
+        with tracing.span("extract_all", shape=list(bgr.shape) if bgr is not None else None) as sp:
+            # หลายคนในเฟรม = หน้าเล็ก → detect ที่ DET_SIZE ตรง ๆ ไม่ผ่าน cascade (cascade ตัดสินจากหน้าใหญ่สุด)
+            with stage("detect"):
+                bboxes, kpss = self.det.detect(bgr, max_num=0, metric="default")
+            metrics.inc("attendance_detect_total", {"det_size": str(DET_SIZE)})
+            side = np.minimum(bboxes[:, 2] - bboxes[:, 0], bboxes[:, 3] - bboxes[:, 1])
+            keep = np.flatnonzero((bboxes[:, 4] >= min_score) & (side >= min_face_px))
+            keep = keep[np.argsort(-side[keep])][:max_faces]
+            if sp is not None:
+                sp["faces"], sp["kept"] = int(bboxes.shape[0]), int(len(keep))
+            if not len(keep) or kpss is None:
+                return []
+            feats = self._embed_batch([(bgr, kpss[i]) for i in keep])
+            return [(feats[n], bboxes[i, 0:4].astype(int)) for n, i in enumerate(keep)]
+
+    def extract_many(self, imgs: list) -> list:
+        """extract ของหลายภาพ (หน้าใหญ่สุดต่อภาพ) → [(emb, bbox) | None, ...] – recognizer รันเป็น batch เดียว"""
+        found = []
+        for n, bgr in enumerate(imgs):
+            with stage("detect"):
+                bboxes, kpss, _ = self.detect(bgr)
+            if bboxes.shape[0] and kpss is not None:
+                i = int(np.argmax((bboxes[:, 2] - bboxes[:, 0]) * (bboxes[:, 3] - bboxes[:, 1])))
+                found.append((n, bboxes[i, 0:4].astype(int), kpss[i]))
+        out = [None] * len(imgs)
+        if found:
+            feats = self._embed_batch([(imgs[n], kps) for n, _, kps in found])
+            for f, (n, bbox, _) in zip(feats, found):
+                out[n] = (f, bbox)
+        return out
+
+    def _embed_batch(self, faces: list) -> np.ndarray:
+        """faces = [(bgr, kps), ...] → normed embedding (N, dim) จาก get_feat ครั้งเดียว (หรือทีละ rec_batch)"""
+        from insightface.utils import face_align
+
+        size = self.rec.input_size[0]
+        crops = [face_align.norm_crop(bgr, landmark=kps, image_size=size) for bgr, kps in faces]
+        step = self.rec_batch or len(crops)
+        with stage("embed"):
+            feats = np.concatenate([self.rec.get_feat(crops[j:j + step]) for j in range(0, len(crops), step)])
+        return feats / np.linalg.norm(feats, axis=1, keepdims=True)
+
+    def embed(self, bgr, bbox, kps) -> np.ndarray:
+        """normed embedding ของหน้าเดียว (bbox = แถวจาก detect: x1, y1, x2, y2, score)"""
+        from insightface.app.common import Face
+
+        f = Face(bbox=bbox[0:4], kps=kps, det_score=bbox[4])
+        with stage("embed"):
+            self.rec.get(bgr, f)
+        return f.normed_embedding
 
     @staticmethod
     def cos(a, b):
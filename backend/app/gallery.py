@@ -0,0 +1,388 @@
+# backend/app/gallery.py
+# gallery ของ embedding ทุกคนในหน่วยความจำ (ใช้กับ 1:N เช่น anonymous clock / admin recognize)
+# เก็บได้ 3 แบบตาม GALLERY_DTYPE:
+#   float32 – เหมือนเดิม
+#   float16 – ครึ่งหนึ่งของหน่วยความจำ, error ~1e-3
+#   int8    – 1/4 ของหน่วยความจำ + scale ต่อ vector (float32)
+# ถ้า GALLERY_RERANK > 0 จะคำนวณ top-k ใหม่ด้วย template float32 จริง (อ่านจาก DB เฉพาะ k คน)
+#
+# snapshot ร่วมกันทั้ง host (GALLERY_MMAP=1): gallery ถูกเขียนเป็นไฟล์ใน GALLERY_MMAP_DIR
+#   gallery-<epoch>-<version>-<dtype>.bin = header (JSON, 4 KiB) + matrix + user id ต่อแถว (+ scale ของ int8)
+# ทุก worker np.memmap แบบ read-only → page cache มีสำเนาเดียว ไม่ว่าจะมีกี่ worker
+# เวอร์ชันอยู่ใน DB (GalleryVersion): admin enroll ฯลฯ เรียก bump_version() ใน transaction เดียวกับที่แก้ template
+# → request ถัดไปของแต่ละ worker เห็นเวอร์ชันใหม่ → worker แรกสร้างไฟล์ (flock กันสร้างซ้ำ, เขียน tmp แล้ว
+#   os.replace) ที่เหลือ memmap ไฟล์เดียวกัน ไม่ต้อง restart
+#
+# change feed (GalleryChange): ทุกที่ที่แก้ template / department / สถานะ active ของ user เรียก record_change()
+# → แถวใหม่ (seq เพิ่มขึ้นเรื่อย ๆ, เก็บสถานะล่าสุดของ user) + bump_version ใน transaction เดียวกัน
+#   (bump ก่อน add → seq ถูกจองหลังได้ lock ของ galleryversion = เรียงตามลำดับ commit แม้บน Postgres, ดู record_change)
+# gallery ใหม่ = gallery เดิม + change ตั้งแต่ seq ของมัน (O(changes) ไม่ต้องอ่าน user ทุกคน)
+# build ใหม่ทั้งหมดเฉพาะตอนไม่มี gallery เดิมของ epoch นี้ หรือ change ค้างเกิน GALLERY_DELTA_MAX
+# node อื่น / cache ภายนอก tail ได้ที่ GET /api/admin/gallery/changes?since=<seq>
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Iterable, Optional, Tuple
+import json
+import os
+import tempfile
+import threading
+import uuid
+
+import numpy as np
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, func, select, update
+
+from . import metrics
+from .models import GalleryChange, GalleryVersion, User
+
+GALLERY_DTYPE = os.getenv("GALLERY_DTYPE", "float32")
+GALLERY_RERANK = int(os.getenv("GALLERY_RERANK", "0"))
+GALLERY_MMAP = os.getenv("GALLERY_MMAP", "1") == "1"
+GALLERY_MMAP_DIR = Path(os.getenv("GALLERY_MMAP_DIR", Path(tempfile.gettempdir()) / "attendance-gallery"))
+GALLERY_MMAP_KEEP = int(os.getenv("GALLERY_MMAP_KEEP", "3"))  # snapshot ล่าสุดที่เก็บไว้ (worker ที่ยังไม่เปลี่ยนใช้อยู่)
+GALLERY_DELTA_MAX = int(os.getenv("GALLERY_DELTA_MAX", "5000"))  # change ค้างมากกว่านี้ → build ใหม่ทั้งหมดถูกกว่า
+DTYPES = ("float32", "float16", "int8")
+
+metrics.describe("attendance_gallery_refresh_total", "counter",
+                 "Gallery rebuilds after a version change (delta = change feed applied, full = every user re-read)")
+
+# คูณทีละ block ผ่าน buffer float32 เดียว (ไม่ upcast ทั้ง matrix, block เล็กพอให้อยู่ใน cache)
+BLOCK = 2048
+
+
+def quantize_int8(m: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    # per-vector scale: v ≈ q * scale, q ∈ [-127, 127]
+    scale = np.abs(m).max(axis=1) / 127.0
+    scale[scale == 0] = 1.0
+    q = np.rint(m / scale[:, None]).astype(np.int8)
+    return q, scale.astype(np.float32)
+
+
+class Gallery:
+    def __init__(self, mat: np.ndarray, row_user: np.ndarray, dtype: str = "float32",
+                 scales: Optional[np.ndarray] = None):
+        if dtype not in DTYPES:
+            raise ValueError(f"unknown gallery dtype: {dtype} (use: {'|'.join(DTYPES)})")
+        self.mat = mat
+        self.scales = scales
+        self.dtype = dtype
+        self.row_user = row_user
+        self.version: Optional[int] = None
+        self.epoch: Optional[str] = None
+        self.seq: Optional[int] = None     # GalleryChange.seq ล่าสุดที่รวมอยู่ในนี้แล้ว
+        # แถวของ user เดียวกันอยู่ติดกัน → per-user max ด้วย reduceat
+        if len(row_user):
+            edge = np.flatnonzero(np.diff(row_user)) + 1
+            self.starts = np.concatenate([[0], edge])
+            self.user_ids = row_user[self.starts]
+        else:
+            self.starts = np.zeros(0, dtype=np.int64)
+            self.user_ids = np.zeros(0, dtype=np.int64)
+
+    @classmethod
+    def build(cls, rows: Iterable[Tuple[int, list]], dtype: str = GALLERY_DTYPE) -> "Gallery":
+        """rows = [(user_id, [emb, ...]), ...]"""
+        owners, vecs = [], []
+        for uid, embs in rows:
+            for e in embs:
+                owners.append(uid); vecs.append(e)
+        dim = len(vecs[0]) if vecs else 512
+        m = np.asarray(vecs, dtype=np.float32).reshape(-1, dim)
+        row_user = np.asarray(owners, dtype=np.int64)
+        if dtype == "int8":
+            q, scales = quantize_int8(m)
+            return cls(q, row_user, dtype, scales)
+        return cls(m.astype(dtype), row_user, dtype)
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    def apply(self, latest: dict) -> "Gallery":
+        """gallery ใหม่ที่แทน template ของ user ใน latest ({user_id: [emb, ...]}, [] = เอาออก) – แถวอื่น copy ตามเดิม"""
+        keep = ~np.isin(self.row_user, np.fromiter(latest, dtype=np.int64, count=len(latest)))
+        owners, vecs = [], []
+        for uid, embs in latest.items():
+            for e in embs:
+                owners.append(uid); vecs.append(e)
+        m = np.asarray(vecs, dtype=np.float32).reshape(-1, self.mat.shape[1])
+        scales = None
+        if self.dtype == "int8":
+            m, sc = quantize_int8(m)
+            scales = np.concatenate([self.scales[keep], sc])
+        # แถวของ user ที่เปลี่ยนต่อท้าย (ยังอยู่ติดกันต่อ user → reduceat ใช้ได้เหมือนเดิม)
+        return Gallery(np.concatenate([self.mat[keep], m.astype(self.mat.dtype)]),
+                       np.concatenate([self.row_user[keep], np.asarray(owners, dtype=np.int64)]), self.dtype, scales)
+
+    @property
+    def nbytes(self) -> int:
+        n = self.mat.nbytes + self.row_user.nbytes
+        return n + (self.scales.nbytes if self.scales is not None else 0)
+
+    def row_scores_many(self, embs: np.ndarray) -> np.ndarray:
+        """cosine ของทุก query กับทุกแถว: embs (Q, dim) → (Q, rows) float32 ด้วย matrix-matrix product เดียว"""
+        embs = np.asarray(embs, dtype=np.float32).reshape(-1, self.mat.shape[1])
+        if self.dtype == "int8":
+            # q·q' เป็นจำนวนเต็ม |.| <= dim*127*127 < 2^24 → float32 BLAS ให้ผลตรงทุกบิต
+            qp, sp = quantize_int8(embs)
+            probes, post = qp.astype(np.float32), sp
+        else:
+            probes, post = embs, None
+        if self.dtype == "float32":
+            out = probes @ self.mat.T
+        else:
+            out = np.empty((len(probes), len(self.mat)), dtype=np.float32)
+            buf = np.empty((min(BLOCK, len(self.mat)), self.mat.shape[1]), dtype=np.float32)
+            for i in range(0, len(self.mat), BLOCK):
+                blk = self.mat[i:i + BLOCK]
+                n = len(blk)
+                np.copyto(buf[:n], blk, casting="unsafe")
+                out[:, i:i + n] = probes @ buf[:n].T
+        if self.dtype == "int8":
+            out *= self.scales[None, :] * post[:, None]
+        return out
+
+    def row_scores(self, emb: np.ndarray) -> np.ndarray:
+        """cosine ของ emb กับทุกแถว (float32)"""
+        return self.row_scores_many(np.asarray(emb, dtype=np.float32).ravel()[None, :])[0]
+
+    def user_scores_many(self, embs: np.ndarray) -> np.ndarray:
+        """(Q, users) – per-user max ของแต่ละ query"""
+        embs = np.asarray(embs, dtype=np.float32)
+        if not len(self.mat):
+            return np.zeros((len(embs), 0), dtype=np.float32)
+        return np.maximum.reduceat(self.row_scores_many(embs), self.starts, axis=1)
+
+    def user_scores(self, emb: np.ndarray) -> np.ndarray:
+        return self.user_scores_many(np.asarray(emb, dtype=np.float32).ravel()[None, :])[0]
+
+    def search(self, emb: np.ndarray, k: int = 1,
+               exact: Optional[Callable[[int], Optional[np.ndarray]]] = None,
+               rerank: int = GALLERY_RERANK) -> list[Tuple[int, float]]:
+        """top-k (user_id, score) เรียงจากมากไปน้อย
+
+        exact(user_id) -> template float32 ของ user (ใช้ตอน rerank); rerank = จำนวน candidate ที่จะคิดใหม่
+        """
+        return self.search_many(np.asarray(emb, dtype=np.float32).ravel()[None, :], k, exact, rerank)[0]
+
+    def search_many(self, embs: np.ndarray, k: int = 1,
+                    exact: Optional[Callable[[int], Optional[np.ndarray]]] = None,
+                    rerank: int = GALLERY_RERANK) -> list[list[Tuple[int, float]]]:
+        """search ของหลาย query พร้อมกัน (หลายหน้าในเฟรมเดียว) – คูณ gallery ครั้งเดียว, ผลต่อ query เหมือน search"""
+        embs = np.asarray(embs, dtype=np.float32).reshape(len(embs), -1)
+        scores = self.user_scores_many(embs)
+        if not scores.shape[1]:
+            return [[] for _ in range(len(embs))]
+        n = min(max(k, rerank if exact else 0), scores.shape[1])
+        tops = np.argpartition(-scores, n - 1, axis=1)[:, :n]
+        out = []
+        for q, top in enumerate(tops):
+            cand = [(int(self.user_ids[i]), float(scores[q, i])) for i in top]
+            if exact is not None and rerank > 0:
+                fixed = []
+                for uid, sc in cand:
+                    t = exact(uid)
+                    fixed.append((uid, float(np.max(t @ embs[q])) if t is not None and len(t) else sc))
+                cand = fixed
+            cand.sort(key=lambda x: -x[1])
+            out.append(cand[:k])
+        return out
+
+
+# ---------- เวอร์ชัน (DB) ----------
+def current_version(s: Session) -> Tuple[str, int]:
+    """(epoch, version) – query เดียวต่อ request แทนการ scan ตาราง user"""
+    row = s.exec(select(GalleryVersion.epoch, GalleryVersion.version).where(GalleryVersion.id == 1)).first()
+    if row is None:
+        try:
+            s.add(GalleryVersion(id=1, epoch=uuid.uuid4().hex)); s.commit()
+        except IntegrityError:  # worker อื่นสร้างพร้อมกัน
+            s.rollback()
+        row = s.exec(select(GalleryVersion.epoch, GalleryVersion.version).where(GalleryVersion.id == 1)).one()
+    return tuple(row)
+
+
+def bump_version(s: Session):
+    # เรียกผ่าน record_change เสมอ (bump อย่างเดียว gallery ที่ apply delta จะไม่เห็นการเปลี่ยน)
+    res = s.execute(update(GalleryVersion).where(GalleryVersion.id == 1)
+                    .values(version=GalleryVersion.version + 1, updated_at=datetime.now(timezone.utc)))
+    if not res.rowcount:
+        s.add(GalleryVersion(id=1, epoch=uuid.uuid4().hex, version=1))
+
+
+# ---------- change feed ----------
+def record_change(s: Session, u: User, op: str):
+    """บันทึกสถานะล่าสุดของ u ลง feed + bump version – เรียกก่อน commit ทุกครั้งที่ template / department / active เปลี่ยน
+
+    ลำดับสำคัญ: UPDATE galleryversion ก่อน → ได้ row lock (Postgres) / write lock (SQLite) ค้างถึง commit
+    แล้ว seq ของ GalleryChange ค่อยถูกจองตอน flush หลังจากนั้น → transaction ที่จอง seq ทีหลังต้องรอตัวก่อน commit
+    seq จึงเรียงตามลำดับ commit เสมอ (consumer ที่ since=N ไม่มีวันข้ามแถว < N ที่ commit ช้า)
+    """
+    bump_version(s)
+    s.add(GalleryChange(user_id=u.id, op=op, embeddings_json=u.embeddings_json if u.active else None,
+                        department_id=u.department_id))
+
+
+def last_seq(s: Session) -> int:
+    return s.exec(select(func.max(GalleryChange.seq))).one() or 0
+
+
+def changes_since(s: Session, seq: int, limit: int) -> list:
+    return s.exec(select(GalleryChange).where(GalleryChange.seq > seq)
+                  .order_by(GalleryChange.seq).limit(limit)).all()
+
+
+def _latest(changes) -> dict:
+    # หลาย change ของ user เดียวกัน → ใช้แถวหลังสุด (แต่ละแถวเป็นสถานะเต็มอยู่แล้ว)
+    return {c.user_id: json.loads(c.embeddings_json) if c.embeddings_json else [] for c in changes}
+
+
+def _load_rows(s: Session):
+    q = (select(User.id, User.embeddings_json)
+         .where(User.embeddings_json.is_not(None), User.active).order_by(User.id))
+    for uid, raw in s.exec(q):
+        embs = json.loads(raw)
+        if embs:
+            yield uid, embs
+
+
+def _build(s: Session, epoch: str) -> Gallery:
+    metrics.inc("attendance_gallery_refresh_total", {"kind": "full"})
+    seq = last_seq(s)  # อ่านก่อน rows: change ที่ commit ระหว่างนี้จะถูก apply ซ้ำรอบหน้า (ผลเท่าเดิม)
+    g = Gallery.build(_load_rows(s), GALLERY_DTYPE)
+    g.epoch, g.seq = epoch, seq
+    return g
+
+
+def _refresh(s: Session, epoch: str, base: Optional[Gallery]) -> Gallery:
+    """base + change ตั้งแต่ base.seq; ไม่มี base ของ epoch นี้ / change เยอะเกิน → build ใหม่ทั้งหมด"""
+    if base is None or base.epoch != epoch or base.seq is None or base.dtype != GALLERY_DTYPE:
+        return _build(s, epoch)
+    changes = changes_since(s, base.seq, GALLERY_DELTA_MAX + 1)
+    if len(changes) > GALLERY_DELTA_MAX:
+        return _build(s, epoch)
+    if not changes:
+        return base
+    metrics.inc("attendance_gallery_refresh_total", {"kind": "delta"})
+    g = base.apply(_latest(changes))
+    g.epoch, g.seq = epoch, changes[-1].seq
+    return g
+
+
+# ---------- snapshot (memmap) ----------
+MAGIC = b"ATTGAL1\n"
+HEADER = 4096
+
+
+def snapshot_path(epoch: str, version: int, dtype: str = GALLERY_DTYPE) -> Path:
+    return GALLERY_MMAP_DIR / f"gallery-{epoch}-{version}-{dtype}.bin"
+
+
+def write_snapshot(g: Gallery, path: Path, **meta):
+    parts = [("mat", g.mat), ("row_user", g.row_user)] + ([("scales", g.scales)] if g.scales is not None else [])
+    head, off = {"dtype": g.dtype, "rows": int(g.mat.shape[0]), "dim": int(g.mat.shape[1]), **meta}, HEADER
+    for name, a in parts:
+        head[name] = {"offset": off, "dtype": a.dtype.str, "shape": list(a.shape)}
+        off += a.nbytes
+    raw = MAGIC + json.dumps(head).encode()
+    if len(raw) > HEADER:
+        raise ValueError("gallery header too large")
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp, "wb") as f:
+        f.write(raw.ljust(HEADER, b"\0"))
+        for _, a in parts:
+            f.write(np.ascontiguousarray(a).tobytes())
+        f.flush(); os.fsync(f.fileno())
+    os.replace(tmp, path)  # worker อื่นเห็นไฟล์ที่เขียนครบแล้วเท่านั้น
+
+
+def open_snapshot(path: Path) -> Gallery:
+    with open(path, "rb") as f:
+        raw = f.read(HEADER)
+    if not raw.startswith(MAGIC):
+        raise ValueError(f"{path} is not a gallery snapshot")
+    head = json.loads(raw[len(MAGIC):].rstrip(b"\0"))
+
+    def arr(name):
+        a = head.get(name)
+        if a is None:
+            return None
+        if not np.prod(a["shape"]):  # mmap ขนาด 0 ไม่ได้
+            return np.zeros(a["shape"], dtype=a["dtype"])
+        return np.memmap(path, dtype=a["dtype"], mode="r", offset=a["offset"], shape=tuple(a["shape"]))
+
+    g = Gallery(arr("mat"), np.asarray(arr("row_user")), head["dtype"], arr("scales"))
+    g.epoch, g.version, g.seq = head.get("epoch"), head.get("version"), head.get("seq")
+    return g
+
+
+def _newest_snapshot(epoch: str) -> Optional[Gallery]:
+    # worker ที่เพิ่ง start ยังไม่มี gallery ในมือ → ใช้ snapshot ล่าสุดบนดิสก์เป็นฐานของ delta
+    best = None
+    for p in GALLERY_MMAP_DIR.glob(f"gallery-{epoch}-*-{GALLERY_DTYPE}.bin"):
+        try:
+            v = int(p.name.split("-")[2])
+        except ValueError:
+            continue
+        if best is None or v > best[0]:
+            best = (v, p)
+    if best is None:
+        return None
+    try:
+        return open_snapshot(best[1])
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _prune(keep: Path):
+    snaps = sorted(GALLERY_MMAP_DIR.glob("gallery-*.bin"), key=lambda p: p.stat().st_mtime, reverse=True)
+    for p in snaps[GALLERY_MMAP_KEEP:]:
+        if p != keep:
+            p.unlink(missing_ok=True)  # worker ที่ยัง memmap อยู่อ่านต่อได้ (inode ยังไม่หายจนกว่าจะ unmap)
+
+
+def _snapshot(s: Session, epoch: str, version: int, base: Optional[Gallery]) -> Gallery:
+    path = snapshot_path(epoch, version)
+    try:
+        return open_snapshot(path)
+    except FileNotFoundError:
+        pass
+    import fcntl
+
+    GALLERY_MMAP_DIR.mkdir(parents=True, exist_ok=True)
+    with open(GALLERY_MMAP_DIR / ".lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)  # worker เดียวสร้าง ที่เหลือรอแล้ว memmap ไฟล์เดียวกัน
+        if not path.exists():
+            if base is None or base.epoch != epoch:
+                base = _newest_snapshot(epoch)
+            g = _refresh(s, epoch, base)
+            write_snapshot(g, path, epoch=epoch, version=version, seq=g.seq)
+            _prune(path)
+    return open_snapshot(path)
+
+
+# ---------- cache ต่อ process ----------
+_lock = threading.Lock()
+_cache: tuple = (None, None)   # ((epoch, version), Gallery) – อ่าน/เขียนเป็นก้อนเดียว
+
+
+def get_gallery(s: Session) -> Gallery:
+    global _cache
+    key = current_version(s)
+    cached_key, g = _cache
+    if g is not None and cached_key == key:
+        return g
+    with _lock:
+        cached_key, g = _cache
+        if g is None or cached_key != key:
+            g = _snapshot(s, *key, base=g) if GALLERY_MMAP else _refresh(s, key[0], g)
+            _cache = (key, g)
+        return g
+
+
+def exact_templates(s: Session) -> Callable[[int], Optional[np.ndarray]]:
+    def lookup(uid: int):
+        u = s.get(User, uid)
+        if not u or not u.embeddings_json:
+            return None
+        return np.asarray(json.loads(u.embeddings_json), dtype=np.float32)
+    return lookup
@@ -0,0 +1,181 @@
+# backend/app/image_archive.py
+# เก็บรูปที่สแกนลงเวลาไว้ใช้ตอนมีข้อโต้แย้ง (AttendanceAttempt.image_sha256 → GET /api/admin/attempt-images/{sha})
+#
+# - content-addressed: ชื่อไฟล์ = sha256 ของ bytes ที่อัปโหลด → retry ส่งรูปเดิมซ้ำเก็บครั้งเดียว
+#     IMAGE_ARCHIVE_DIR/<sha[:2]>/<sha>
+# - write-behind: request แค่ hash + ใส่คิว (submit) → thread เขียนไฟล์ทีหลัง ไม่บล็อกการตอบ clock
+#   คิวเต็ม (IMAGE_ARCHIVE_QUEUE) → ทิ้งรูปนั้น (attempt ไม่มี image_sha256) ดีกว่าให้ request รอ disk
+# - ย่อด้านยาวสุดเหลือ IMAGE_ARCHIVE_MAX_PX แล้ว encode JPEG ใหม่ (0 = เก็บ bytes เดิม)
+# - รวมเกิน IMAGE_ARCHIVE_MAX_MB → ลบไฟล์ที่ mtime เก่าสุดจนเหลือ 90% (รูปซ้ำ touch mtime ใหม่ = LRU)
+#   หลาย worker เขียนโฟลเดอร์เดียวกัน → flock ให้ evict ทีละ process
+#
+# ผูกกับ attempt ผ่าน ContextVar (เหมือน trace_id): submit() ตั้ง current → log_attempt อ่านเอง
+# ปิดเป็นค่าเริ่มต้น: เปิดด้วย IMAGE_ARCHIVE=1 และตั้ง IMAGE_ARCHIVE_DIR ไปที่ volume ข้อมูล
+# (ค่า default backend/data/ อยู่ใน checkout – ใน .gitignore แล้ว แต่ไม่ควรใช้จริงบน production)
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Optional
+import hashlib
+import os
+import queue
+import threading
+
+from . import metrics
+from .deps import BASE_DIR
+
+ENABLED = os.getenv("IMAGE_ARCHIVE", "0") == "1"
+ARCHIVE_DIR = Path(os.getenv("IMAGE_ARCHIVE_DIR", BASE_DIR.parent / "data" / "attempt-images"))
+MAX_MB = float(os.getenv("IMAGE_ARCHIVE_MAX_MB", "2048"))
+MAX_PX = int(os.getenv("IMAGE_ARCHIVE_MAX_PX", "640"))
+JPEG_QUALITY = int(os.getenv("IMAGE_ARCHIVE_JPEG_QUALITY", "85"))
+QUEUE_MAX = int(os.getenv("IMAGE_ARCHIVE_QUEUE", "256"))
+
+metrics.describe("attendance_image_archive_total", "counter",
+                 "Attempt images submitted to the archive, by result (written / dedup / dropped / error)")
+metrics.describe("attendance_image_archive_bytes", "gauge", "Bytes on disk in the attempt image archive")
+metrics.describe("attendance_image_archive_evicted_total", "counter", "Archived attempt images removed by size limit")
+
+current: ContextVar[Optional[str]] = ContextVar("attempt_image", default=None)
+
+_q: queue.Queue = queue.Queue(maxsize=max(1, QUEUE_MAX))
+_pending: set = set()  # sha ที่อยู่ในคิว (ส่งซ้ำระหว่างรอเขียน → ไม่ต้องเข้าคิวอีก)
+_lock = threading.Lock()
+_writer: Optional[threading.Thread] = None
+_bytes: Optional[int] = None  # ขนาดรวมโดยประมาณ (scan ตอน writer เริ่ม + ที่ process นี้เขียน)
+
+
+def path_for(sha: str) -> Path:
+    return ARCHIVE_DIR / sha[:2] / sha
+
+
+def submit(data: bytes) -> Optional[str]:
+    """ใส่รูปเข้าคิวเขียน (ไม่รอ disk) → sha256 ที่ใช้อ้างอิง (None = ปิดอยู่ / คิวเต็ม); ตั้ง current ด้วย"""
+    if not ENABLED or not data:
+        return None
+    sha = hashlib.sha256(data).hexdigest()
+    with _lock:
+        queued = sha in _pending
+        if not queued:
+            try:
+                _q.put_nowait((sha, data))
+                _pending.add(sha)
+            except queue.Full:
+                metrics.inc("attendance_image_archive_total", {"result": "dropped"})
+                sha = None
+    if queued:
+        metrics.inc("attendance_image_archive_total", {"result": "dedup"})
+    _ensure_writer()
+    current.set(sha)
+    return sha
+
+
+def _ensure_writer():
+    global _writer
+    if _writer is None:
+        with _lock:
+            if _writer is None:
+                _writer = threading.Thread(target=_run, name="image-archive", daemon=True)
+                _writer.start()
+
+
+def _encode(data: bytes) -> bytes:
+    if MAX_PX <= 0:
+        return data
+    import cv2
+    import numpy as np
+
+    img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        return data  # decode ไม่ได้ก็เก็บตามที่ได้รับ (ใช้เป็นหลักฐานได้อยู่)
+    h, w = img.shape[:2]
+    if max(h, w) > MAX_PX:
+        f = MAX_PX / max(h, w)
+        img = cv2.resize(img, (max(1, round(w * f)), max(1, round(h * f))), interpolation=cv2.INTER_AREA)
+    ok, buf = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+    return buf.tobytes() if ok and len(buf) < len(data) else data
+
+
+def _write(sha: str, data: bytes) -> int:
+    p = path_for(sha)
+    if p.exists():
+        os.utime(p)  # ใช้อีกครั้ง → ยังไม่ควรโดน evict
+        metrics.inc("attendance_image_archive_total", {"result": "dedup"})
+        return 0
+    out = _encode(data)
+    p.parent.mkdir(parents=True, exist_ok=True)
+    tmp = p.with_name(f"{sha}.{os.getpid()}.tmp")
+    tmp.write_bytes(out)
+    os.replace(tmp, p)
+    metrics.inc("attendance_image_archive_total", {"result": "written"})
+    return len(out)
+
+
+def _files() -> list:
+    out = []
+    for p in ARCHIVE_DIR.glob("??/*"):
+        if not p.name.endswith(".tmp"):
+            try:
+                st = p.stat()
+            except FileNotFoundError:
+                continue
+            out.append((st.st_mtime, st.st_size, p))
+    return out
+
+
+def _evict():
+    """เกิน MAX_MB → ลบเก่าสุดจนเหลือ 90% (process เดียวทำ, ที่เหลือข้าม)"""
+    global _bytes
+    import fcntl
+
+    with open(ARCHIVE_DIR / ".evict.lock", "w") as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return
+        files = sorted(_files())
+        total = sum(size for _, size, _ in files)
+        target = MAX_MB * 0.9 * 1024 * 1024
+        n = 0
+        for _, size, p in files:
+            if total <= target:
+                break
+            p.unlink(missing_ok=True)
+            total -= size
+            n += 1
+        _bytes = total
+    if n:
+        metrics.inc("attendance_image_archive_evicted_total", value=n)
+
+
+def _run():
+    global _bytes
+    ARCHIVE_DIR.mkdir(parents=True, exist_ok=True)
+    _bytes = sum(size for _, size, _ in _files())
+    while True:
+        sha, data = _q.get()
+        try:
+            _bytes += _write(sha, data)
+            if MAX_MB > 0 and _bytes > MAX_MB * 1024 * 1024:
+                _evict()
+            metrics.set_gauge("attendance_image_archive_bytes", _bytes)
+        except Exception as e:
+            metrics.inc("attendance_image_archive_total", {"result": "error"})
+            print(f"[image-archive] {sha}: {e!r}", flush=True)
+        finally:
+            with _lock:
+                _pending.discard(sha)
+
+
+def media_type(p: Path) -> str:
+    with open(p, "rb") as f:
+        head = f.read(8)
+    if head.startswith(b"\xff\xd8"):
+        return "image/jpeg"
+    if head.startswith(b"\x89PNG"):
+        return "image/png"
+    return "application/octet-stream"
+
+
+def stats() -> dict:
+    return {"enabled": ENABLED, "dir": str(ARCHIVE_DIR), "queued": _q.qsize(), "bytes": _bytes,
+            "max_mb": MAX_MB, "max_px": MAX_PX}
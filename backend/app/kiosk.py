@@ -0,0 +1,230 @@
+# backend/app/kiosk.py
+# kiosk แบบ streaming ผ่าน WebSocket (/api/attendance/kiosk) แทน POST รูปเดียวต่อครั้ง
+#
+# protocol (1 connection ใช้ได้กับพนักงานหลายคนต่อกัน):
+#   connect  ?token=<JWT>  (ไม่บังคับ เว้นแต่ KIOSK_REQUIRE_AUTH=1 – ตรวจครั้งเดียวตอนต่อ)
+#   text     {"type": "config", "action": "in"|"out", "lat", "lng", "accuracy", "th"}
+#            → ตรวจ accuracy / geofence ครั้งเดียว (ANONYMOUS_PRE) แล้วจำไว้ทั้ง connection
+#            ← {"type": "ready"} | {"type": "rejected", "status", "detail"}
+#   binary   JPEG ย่อแล้ว (เช่นกว้าง 320–480px) ทีละเฟรม, ส่งเฟรมถัดไปหลังได้คำตอบของเฟรมก่อน
+#            ← {"type": "frame", "state": no_face|low_quality|matching|done, "track", ...}
+#            ← {"type": "clocked", ...เหมือน anonymous-clock} | {"type": "rejected", "status", "detail"}
+#
+# ต่อเฟรม: detect (cascade, FACE_DET_CASCADE) → ตามหน้าใหญ่สุดด้วย IoU กับเฟรมก่อน (track)
+# → quality gate (ขนาดหน้า / ความคม / det score) → ผ่านจึง embed + ค้น gallery
+# → มั่นใจ (score ≥ th + KIOSK_CONFIDENT_MARGIN หรือคนเดิม ≥ th ติดกัน KIOSK_CONFIRM_FRAMES เฟรม)
+#   → ลงเวลาผ่าน clock.run(ANONYMOUS_POST) ทันที
+# track ที่ลงเวลา/ถูกปฏิเสธแล้วไม่ embed ซ้ำจนกว่าหน้าจะหายไปจากกล้อง KIOSK_TRACK_LOST_FRAMES เฟรม
+from dataclasses import dataclass, field
+from typing import Optional
+import asyncio
+import json
+import os
+
+import numpy as np
+from fastapi import HTTPException, WebSocket, WebSocketDisconnect
+from sqlmodel import Session
+from starlette.concurrency import run_in_threadpool
+
+from . import clock, image_archive, metrics
+from .deps import engine, get_current_user
+from .metrics import stage
+
+REQUIRE_AUTH = os.getenv("KIOSK_REQUIRE_AUTH", "0") == "1"
+MIN_FACE_PX = int(os.getenv("KIOSK_MIN_FACE_PX", "64"))          # ด้านสั้นของ bbox ในเฟรมที่ส่งมา
+MIN_SHARPNESS = float(os.getenv("KIOSK_MIN_SHARPNESS", "40"))    # variance ของ Laplacian บนหน้า 112x112
+MIN_DET_SCORE = float(os.getenv("KIOSK_MIN_DET_SCORE", "0.6"))
+TRACK_IOU = float(os.getenv("KIOSK_TRACK_IOU", "0.3"))
+TRACK_LOST_FRAMES = int(os.getenv("KIOSK_TRACK_LOST_FRAMES", "3"))
+CONFIRM_FRAMES = int(os.getenv("KIOSK_CONFIRM_FRAMES", "2"))
+CONFIDENT_MARGIN = float(os.getenv("KIOSK_CONFIDENT_MARGIN", "0.15"))
+MAX_EMBEDS = int(os.getenv("KIOSK_MAX_EMBEDS", "8"))              # ต่อ track ก่อนตอบ "face not recognized"
+MAX_FRAME_BYTES = int(os.getenv("KIOSK_MAX_FRAME_KB", "256")) * 1024
+IDLE_TIMEOUT_S = float(os.getenv("KIOSK_IDLE_TIMEOUT_S", "300"))
+
+metrics.describe("attendance_kiosk_frames_total", "counter", "Kiosk WebSocket frames by outcome")
+metrics.describe("attendance_kiosk_connections", "gauge", "Open kiosk WebSocket connections (this worker)")
+
+_connections = 0
+
+
+def _iou(a, b) -> float:
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0.0, x2 - x1) * max(0.0, y2 - y1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return float(inter / union) if union > 0 else 0.0
+
+
+def quality(bgr, box) -> dict:
+    import cv2
+
+    h, w = bgr.shape[:2]
+    x1, y1 = max(int(box[0]), 0), max(int(box[1]), 0)
+    x2, y2 = min(int(box[2]), w), min(int(box[3]), h)
+    side = min(x2 - x1, y2 - y1)
+    sharp = 0.0
+    if side > 0:
+        face = cv2.cvtColor(bgr[y1:y2, x1:x2], cv2.COLOR_BGR2GRAY)
+        sharp = float(cv2.Laplacian(cv2.resize(face, (112, 112)), cv2.CV_64F).var())
+    ok = side >= MIN_FACE_PX and sharp >= MIN_SHARPNESS and float(box[4]) >= MIN_DET_SCORE
+    return {"ok": ok, "face_px": int(side), "sharpness": round(sharp, 1), "det_score": round(float(box[4]), 3)}
+
+
+@dataclass
+class Track:
+    id: int
+    bbox: np.ndarray
+    lost: int = 0
+    embeds: int = 0
+    best: float = -1.0
+    votes: dict = field(default_factory=dict)  # user_id -> จำนวนเฟรมที่ match ≥ th
+    done: bool = False                         # ลงเวลา / ปฏิเสธแล้ว → ไม่ embed ซ้ำ
+
+
+class KioskSession:
+    """state ต่อ connection: ตำแหน่ง/action ที่ตรวจแล้ว + track ของหน้าปัจจุบัน (เรียกจาก threadpool)"""
+
+    def __init__(self, get_svc, ip: Optional[str], ua: Optional[str]):
+        self.get_svc, self.ip, self.ua = get_svc, ip, ua
+        self.config: Optional[dict] = None
+        self.track: Optional[Track] = None
+        self._next_id = 1
+
+    def configure(self, msg: dict) -> dict:
+        try:
+            cfg = {"action": msg["action"], "lat": float(msg["lat"]), "lng": float(msg["lng"]),
+                   "accuracy": float(msg["accuracy"]) if msg.get("accuracy") is not None else None,
+                   "th": float(msg.get("th", clock.DEFAULT_TH))}
+        except (AttributeError, KeyError, TypeError, ValueError):
+            return {"type": "error", "detail": "config needs action, lat, lng"}
+        if cfg["action"] not in ("in", "out"):
+            return {"type": "error", "detail": "invalid action"}
+        self.config, self.track = None, None  # เปลี่ยน action → คนเดิมลงเวลาอีกฝั่งได้
+        with Session(engine) as s:
+            r = clock.ClockRequest(s=s, action=cfg["action"], lat=cfg["lat"], lng=cfg["lng"],
+                                   accuracy=cfg["accuracy"])
+            res = clock.preflight(r, clock.ANONYMOUS_PRE)
+        if not res["ok"]:
+            return {"type": "rejected", "status": res["status"], "detail": res["detail"]}
+        self.config = cfg
+        return {"type": "ready", "action": cfg["action"]}
+
+    def _follow(self, box) -> Track:
+        t = self.track
+        if t is not None and _iou(t.bbox, box[:4]) >= TRACK_IOU:
+            t.bbox, t.lost = box[:4], 0
+            return t
+        self.track = Track(self._next_id, box[:4])
+        self._next_id += 1
+        return self.track
+
+    def _request(self, s: Session, user=None, score=None) -> clock.ClockRequest:
+        c = self.config
+        r = clock.ClockRequest(s=s, action=c["action"], lat=c["lat"], lng=c["lng"], accuracy=c["accuracy"],
+                               ip=self.ip, ua=self.ua, th=c["th"], user=user)
+        r.score = score
+        return r
+
+    def frame(self, data: bytes) -> dict:
+        import cv2
+
+        if self.config is None:
+            return {"type": "error", "detail": "send config first"}
+        svc = self.get_svc()  # โมเดลยังไม่พร้อม → HTTPException 503
+        with stage("decode"):
+            img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        if img is None:
+            return {"type": "error", "detail": "cannot decode frame"}
+        with stage("detect"):
+            bboxes, kpss, _ = svc.detect(img)
+        if bboxes.shape[0] == 0:
+            if self.track is not None:
+                self.track.lost += 1
+                if self.track.lost >= TRACK_LOST_FRAMES:
+                    self.track = None
+            return {"type": "frame", "state": "no_face"}
+
+        i = int(np.argmax((bboxes[:, 2] - bboxes[:, 0]) * (bboxes[:, 3] - bboxes[:, 1])))
+        box = bboxes[i]
+        t = self._follow(box)
+        if t.done:
+            return {"type": "frame", "state": "done", "track": t.id}
+        with stage("quality"):
+            q = quality(img, box)
+        if not q.pop("ok"):
+            return {"type": "frame", "state": "low_quality", "track": t.id, **q}
+
+        emb = svc.embed(img, box, kpss[i] if kpss is not None else None)
+        t.embeds += 1
+        th = self.config["th"]
+        with Session(engine) as s:
+            score, u = clock.best_match_user(emb, s, th=th)
+            t.best = max(t.best, score)
+            if u is not None:
+                t.votes[u.id] = t.votes.get(u.id, 0) + 1
+                if score >= th + CONFIDENT_MARGIN or t.votes[u.id] >= CONFIRM_FRAMES:
+                    t.done = True
+                    image_archive.submit(data)  # เฟรมที่ใช้ตัดสิน → เก็บเป็นหลักฐานของ attempt
+                    r = self._request(s, u, score)
+                    try:
+                        rec = clock.run(r, clock.ANONYMOUS_POST)
+                    except HTTPException as e:
+                        return {"type": "rejected", "status": e.status_code, "detail": e.detail, "track": t.id}
+                    return {"type": "clocked", "track": t.id, "embeds": t.embeds, **r.response(rec)}
+            if t.embeds >= MAX_EMBEDS:
+                t.done = True
+                image_archive.submit(data)
+                clock.log_request(self._request(s, score=t.best), False,
+                                  f"face mismatch (score={t.best:.2f} < th={th})")
+                return {"type": "rejected", "status": 401, "detail": "face not recognized", "track": t.id}
+        return {"type": "frame", "state": "matching", "track": t.id, "score": round(score, 4), **q}
+
+
+def _auth(token: str):
+    with Session(engine) as s:
+        try:
+            return get_current_user(token, s)
+        except HTTPException:
+            return None
+
+
+async def serve(ws: WebSocket, get_svc, token: Optional[str] = None):
+    global _connections
+    if (token or REQUIRE_AUTH) and (not token or await run_in_threadpool(_auth, token) is None):
+        await ws.close(code=4401)  # ยังไม่ accept → client เห็นเป็น handshake ถูกปฏิเสธ
+        return
+    await ws.accept()
+    ip = ws.headers.get("x-forwarded-for") or (ws.client.host if ws.client else None)
+    k = KioskSession(get_svc, ip, ws.headers.get("user-agent"))
+    ep = metrics.current_endpoint.set(ws.url.path)  # label ของ stage() (copy ไป threadpool ด้วย)
+    _connections += 1
+    metrics.set_gauge("attendance_kiosk_connections", _connections)
+    try:
+        while True:
+            msg = await asyncio.wait_for(ws.receive(), IDLE_TIMEOUT_S)
+            if msg["type"] == "websocket.disconnect":
+                break
+            if msg.get("bytes") is not None:
+                if len(msg["bytes"]) > MAX_FRAME_BYTES:
+                    out = {"type": "error", "detail": "frame too large"}
+                else:
+                    try:
+                        out = await run_in_threadpool(k.frame, msg["bytes"])
+                    except HTTPException as e:
+                        out = {"type": "error", "status": e.status_code, "detail": e.detail}
+                metrics.inc("attendance_kiosk_frames_total", {"result": out.get("state") or out["type"]})
+            else:
+                try:
+                    out = await run_in_threadpool(k.configure, json.loads(msg.get("text") or ""))
+                except ValueError:
+                    out = {"type": "error", "detail": "invalid JSON"}
+            await ws.send_json(out)
+    except asyncio.TimeoutError:
+        await ws.close(code=1000)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        _connections -= 1
+        metrics.set_gauge("attendance_kiosk_connections", _connections)
+        metrics.current_endpoint.reset(ep)
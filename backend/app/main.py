@@ -1,37 +1,35 @@
 # backend/app/main.py
-from fastapi import FastAPI, Depends, UploadFile, File, Form, HTTPException, APIRouter
+from fastapi import FastAPI, Depends, UploadFile, File, Form, HTTPException, APIRouter, Query, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.security import OAuth2PasswordRequestForm
 from pydantic import BaseModel
-from typing import Optional, Tuple
-import cv2
+from typing import Optional
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
 import json
 import numpy as np
-from math import radians, sin, cos, asin, sqrt
 from sqlmodel import Session, select
+from sqlalchemy import text
+from starlette.concurrency import run_in_threadpool
 from starlette.requests import Request
-from .models import AttendanceAttempt, Department
-from .deps import get_session, get_current_user, require_admin, init_db
+from .models import User, AttendanceAttempt, Department
+from .deps import get_session, get_current_user, get_optional_user, oauth2_optional, require_admin, init_db, engine
 from .auth import make_access_token, verify_pw, hash_pw
 from .face_service import FaceService
-from .models import User, Attendance, Department
-from fastapi import Query
-from datetime import datetime, timedelta
-from fastapi import Depends
-from .models import User
-from .deps import require_admin
-from .deps import require_admin, init_db, engine  # เพิ่ม engine เข้ามาด้วย
-import os
+from .enroll_policy import policy as enroll_policy
+from . import admission, calibrate, clock, extract_cache, image_archive, kiosk, metrics, presence, profiler, recognize_batch, retention, tracing
+from .clock import best_match_user
+from .gallery import changes_since, last_seq, record_change
+from .metrics import stage
+import asyncio
+import itertools
+import threading
+import time
 
 
 # ---------- constants & utils ----------
 
-EARTH_R = 6371000.0
-def haversine_m(lat1, lng1, lat2, lng2) -> float:
-    dlat = radians(lat2 - lat1); dlng = radians(lng2 - lng1)
-    a = sin(dlat/2)**2 + cos(radians(lat1))*cos(radians(lat2))*sin(dlng/2)**2
-    return 2 * asin(sqrt(a)) * EARTH_R
-
 # NEW: valid time slots
 # valid time slots
 VALID_SLOTS = {"morning", "noon", "afternoon", "evening"}
@@ -41,29 +39,26 @@ def _validate_slot(slot: str) -> str:
     if s not in VALID_SLOTS:
         raise HTTPException(400, "invalid slot (use: morning|noon|afternoon|evening)")
     return s
-from datetime import datetime, timedelta, timezone
-
-# กำหนดโซนเวลาองค์กร (UTC+7: Bangkok)
-BKK_TZ = timezone(timedelta(hours=7))
-
-def derive_slot(now: datetime | None = None) -> str:
-    """
-    คืนค่า 'morning' | 'noon' | 'afternoon' | 'evening'
-    กำหนดช่วงเวลาได้ตามโจทย์/นโยบาย
-    """
-    t = (now or datetime.now(BKK_TZ)).astimezone(BKK_TZ)
-    h = t.hour  # 0-23
-    if h < 10:      # 00:00–09:59
-        return "morning"
-    if h < 13:      # 10:00–12:59
-        return "noon"
-    if h < 17:      # 13:00–16:59
-        return "afternoon"
-    return "evening" # 17:00–23:59
 
 # ---------- app & middlewares ----------
 
-app = FastAPI(title="Face Attendance", version="1.0.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # ของหนัก (migrate / cv2 / insightface / โมเดล) โหลดใน thread แยก → bind port และตอบ /api/health ได้ทันที
+    threading.Thread(target=_warmup, name="warmup", daemon=True).start()
+    yield
+
+app = FastAPI(title="Face Attendance", version="1.0.0", lifespan=lifespan)
+presence.install()  # commit ที่มีการลงเวลา → event ให้ dashboard (ดู presence.py)
+
+# middleware ที่ประกาศทีหลังครอบตัวก่อนหน้า → gate ต้องประกาศก่อน CORS (อยู่ในสุด)
+# ไม่งั้น 503 ตอน startup ไม่มี CORS header และ preflight OPTIONS ไม่ถึง CORSMiddleware
+@app.middleware("http")
+async def readiness_gate(request: Request, call_next):
+    # ก่อน migrate เสร็จ ทุก endpoint ที่แตะ DB ตอบ 503 (health / ready / metrics ผ่านได้) – _db_ready ดู startup
+    if not _db_ready.is_set() and request.url.path not in ("/api/health", "/api/ready", "/api/metrics"):
+        return JSONResponse({"detail": "starting up"}, status_code=503, headers={"Retry-After": "2"})
+    return await call_next(request)
 
 origins = [
     "https://attendance-tracker-woad-one.vercel.app",
@@ -75,529 +70,141 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Trace-Id"],
 )
 
-# init db (สร้างตารางอัตโนมัติถ้ายังไม่มี)
-init_db()
-
-# --- add 'slot' column if missing (SQLite/Postgres safe) ---
-from sqlalchemy import text
-with engine.connect() as conn:
+@app.middleware("http")
+async def stage_metrics(request: Request, call_next):
+    # endpoint label ให้ stage() ใน threadpool + latency รวมต่อ route
+    # scope ไม่ใช่ path จริง: metrics.endpoint() อ่าน route template หลัง routing → label ไม่งอกต่อ request
+    token = metrics.current_endpoint.set(request.scope)
+    t0 = time.perf_counter()
+    status = 500
     try:
-        conn.execute(text("ALTER TABLE attendance ADD COLUMN slot TEXT"))
-    except Exception:
-        pass
+        resp = await call_next(request)
+        status = resp.status_code
+        return resp
+    finally:
+        route = request.scope.get("route")
+        metrics.observe("attendance_http_request_seconds", time.perf_counter() - t0,
+                        {"route": getattr(route, "path", "unmatched"), "method": request.method,
+                         "status": str(status)})
+        metrics.current_endpoint.reset(token)
+
+# sampling profiler ต่อ request (opt-in: PROFILE_ENABLED=1, ดู profiler.py)
+app.middleware("http")(profiler.middleware)
+
+# trace ต่อ request (X-Trace-Id, ดู tracing.py) – ประกาศท้ายสุด = ครอบ middleware อื่นทั้งหมด
+app.middleware("http")(tracing.middleware)
+
+# ---------- startup (ดู lifespan) ----------
+# /api/health = liveness (ตอบได้ทันทีหลัง bind), /api/ready = migrate แล้ว + โมเดลโหลดและ warm แล้ว
+_db_ready = threading.Event()
+_model_ready = threading.Event()
+_startup = {"t0": time.time(), "db_s": None, "model_s": None, "warm_s": None, "modules": None, "error": None}
+_svc = None
+_gated = None
+
+def _migrate():
+    # init db (สร้างตารางอัตโนมัติถ้ายังไม่มี)
+    init_db()
+
+    # --- add 'slot' column if missing (SQLite/Postgres safe) ---
+    with engine.connect() as conn:
+        try:
+            conn.execute(text("ALTER TABLE attendance ADD COLUMN slot TEXT"))
+        except Exception:
+            pass
+        try:
+            conn.execute(text("ALTER TABLE attendanceattempt ADD COLUMN slot TEXT"))
+        except Exception:
+            pass
+        try:
+            conn.execute(text('ALTER TABLE "user" ADD COLUMN active BOOLEAN NOT NULL DEFAULT TRUE'))
+        except Exception:
+            pass
+        try:
+            conn.execute(text("ALTER TABLE attendanceattempt ADD COLUMN trace_id VARCHAR(32)"))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_attendanceattempt_trace_id ON attendanceattempt (trace_id)"))
+        except Exception:
+            pass
+        try:
+            conn.execute(text("ALTER TABLE attendanceattempt ADD COLUMN image_sha256 VARCHAR(64)"))
+        except Exception:
+            pass
+        try:
+            conn.execute(text('ALTER TABLE "user" ADD COLUMN raw_embeddings_json TEXT'))
+        except Exception:
+            pass
+
+def _warmup():
+    global _svc, _gated
+    since = lambda: round(time.time() - _startup["t0"], 3)
     try:
-        conn.execute(text("ALTER TABLE attendanceattempt ADD COLUMN slot TEXT"))
-    except Exception:
-        pass
-
+        _migrate()
+        _startup["db_s"] = since()
+        _db_ready.set()
+        retention.start()  # ย้าย attempt เก่าไป archive เป็นระยะ (ดู retention.py)
+        import cv2  # noqa: F401  (import ช้า → โหลดที่นี่แทนตอน import app.main)
+        svc = FaceService(cpu=True)  # ถ้ามี GPU ค่อยเปลี่ยน cpu=False
+        _startup["model_s"] = since()
+        _startup["modules"] = getattr(svc, "load_report", None)  # load time / RSS / ขนาดไฟล์ ต่อ module
+        if hasattr(svc, "warmup"):
+            svc.warmup()  # inference แรกช้า (onnxruntime จัด memory/kernel) → จ่ายตรงนี้แทน request แรก
+        _svc, _gated = svc, admission.Gated(svc)
+        _startup["warm_s"] = since()
+        _model_ready.set()
+    except Exception as e:
+        _startup["error"] = repr(e)
+        print(f"[startup] failed: {e!r}", flush=True)
 
-# face service
-# แทนที่ svc = FaceService(cpu=True)
-_svc = None
 def get_svc():
-    global _svc
-    if _svc is None:
-        _svc = FaceService(cpu=True)  # ถ้ามี GPU ค่อยเปลี่ยน cpu=False
-    return _svc
-
-
-# ---------- Utility: หา user ที่ใกล้สุด ----------
-def best_match_user(emb: np.ndarray, s: Session, th: float = 0.35) -> Tuple[float, Optional[User]]:
-    best_score, best_user = -1.0, None
-    users = s.exec(select(User)).all()
-    for u in users:
-        if not u.embeddings_json:
-            continue
-        targets = [np.array(x, dtype=np.float32) for x in json.loads(u.embeddings_json)]
-        if not targets:
-            continue
-        score = max(float(np.dot(emb, t)) for t in targets)
-        if score > best_score:
-            best_score, best_user = score, u
-    if best_score >= th:
-        return best_score, best_user
-    return best_score, None
+    # ระหว่างโหลดโมเดลตอบ 503 ให้ client retry
+    # inference ทุกครั้งผ่าน admission control (คิวจำกัด + priority, ดู admission.py)
+    if _gated is None:
+        raise HTTPException(503, "face model loading", headers={"Retry-After": "2"})
+    return _gated
 
 
+# ---------- Utility ----------
 def _get_client_ip_ua(request: Request) -> tuple[str|None, str|None]:
     # รองรับ reverse proxy เบื้องต้น
     ip = request.headers.get("x-forwarded-for") or request.client.host if request.client else None
     ua = request.headers.get("user-agent")
     return ip, ua
 
-def log_attempt(
-    s: Session,
-    *,
-    success: bool,
-    me: Optional[User],
-    email: Optional[str],
-    action: str,
-    reason: Optional[str],
-    lat: Optional[float],
-    lng: Optional[float],
-    accuracy: Optional[float],
-    score: Optional[float],
-    distance_m: Optional[float],
-    department_id: Optional[int],
-    client_ip: Optional[str],
-    user_agent: Optional[str],
-    image_path: Optional[str] = None,
-    slot: Optional[str] = None,  # ✅ keep this
-):
-    if slot is None:
-        slot = derive_slot()
-    rec = AttendanceAttempt(
-        user_id = me.id if me else None,
-        email = email,
-        action = action,
-        success = success,
-        reason = reason,
-        lat = lat, lng = lng, accuracy = accuracy,
-        score = score, distance_m = distance_m,
-        department_id = department_id,
-        client_ip = client_ip,
-        user_agent = user_agent,
-        image_path = image_path,
-        slot = slot,  # ✅ save
-    )
-    s.add(rec); s.commit()
-
-
-
-# ---------- Schemas ----------
-class LoginOut(BaseModel):
-    access_token: str
-    token_type: str = "bearer"
-    role: str
-    name: str
-    email: str
-
-# ---------- Health ----------
-@app.get("/api/health")
-def health():
-    return {"ok": True}
-
-# ---------- Bootstrap admin ครั้งแรก ----------
-@app.post("/api/bootstrap-admin")
-def bootstrap_admin(
-    email: str = Form(...),
-    password: str = Form(...),
-    name: str = Form("Admin"),
-    s: Session = Depends(get_session),
-):
-    exists = s.exec(select(User).where(User.email == email)).first()
-    if exists:
-        raise HTTPException(400, "admin exists")
-    u = User(email=email, name=name, role="admin", hashed_password=hash_pw(password))
-    s.add(u); s.commit(); s.refresh(u)
-    return {"ok": True, "id": u.id}
-
-# ---------- Login ----------
-@app.post("/api/login", response_model=LoginOut)
-def login(form: OAuth2PasswordRequestForm = Depends(), s: Session = Depends(get_session)):
-    u = s.exec(select(User).where(User.email == form.username)).first()
-    if not u or not verify_pw(form.password, u.hashed_password):
-        raise HTTPException(401, "invalid credentials")
-    token = make_access_token(u.email, u.role)
-    return LoginOut(access_token=token, role=u.role, name=u.name, email=u.email)
-
-# ---------- Admin router ----------
-admin = APIRouter(prefix="/api/admin", tags=["admin"])
-
-class DepartmentIn(BaseModel):
-    name: str; lat: float; lng: float; radius_m: int = 200
-
-@admin.post("/departments")
-def create_department(payload: DepartmentIn,
-                      _: User = Depends(require_admin),
-                      s: Session = Depends(get_session)):
-    dep = Department(**payload.dict()); s.add(dep); s.commit(); s.refresh(dep)
-    return {"ok": True, "department": dep}
-
-@admin.get("/departments")
-def list_departments(_: User = Depends(require_admin), s: Session = Depends(get_session)):
-    items = s.exec(select(Department).order_by(Department.name)).all()
-    return {"items": items}
-
-class AssignDepartmentIn(BaseModel):
-    user_id: int; department_id: int
-
-@admin.post("/assign-department")
-def assign_department(payload: AssignDepartmentIn,
-                      _: User = Depends(require_admin),
-                      s: Session = Depends(get_session)):
-    u = s.get(User, payload.user_id); dep = s.get(Department, payload.department_id)
-    if not u or not dep: raise HTTPException(404, "User or Department not found")
-    u.department_id = dep.id; s.add(u); s.commit()
-    return {"ok": True}
-
-@admin.get("/attendance-attempts")
-def list_attempts(
-    success: Optional[bool] = Query(None),
-    email: Optional[str] = Query(None),
-    action: Optional[str] = Query(None),
-    days: int = Query(7, ge=1, le=90),
-    s: Session = Depends(get_session),
-    _: User = Depends(require_admin),
-):
-    since = datetime.utcnow() - timedelta(days=days)
-    q = select(AttendanceAttempt).where(AttendanceAttempt.ts >= since).order_by(AttendanceAttempt.ts.desc())
-    if success is not None:
-        q = q.where(AttendanceAttempt.success == success)
-    if email:
-        q = q.where(AttendanceAttempt.email == email)
-    if action in ("in", "out"):
-        q = q.where(AttendanceAttempt.action == action)
-    items = s.exec(q).all()
-    return {"items": items}
-
-@app.post("/api/admin/users")
-def create_user(
-    email: str = Form(...),
-    name: str = Form(...),
-    password: str = Form(...),
-    _: User = Depends(require_admin),
-    s: Session = Depends(get_session),
-):
-    if s.exec(select(User).where(User.email == email)).first():
-        raise HTTPException(400, "email exists")
-    u = User(email=email, name=name, role="user", hashed_password=hash_pw(password))
-
-    s.add(u); s.commit(); s.refresh(u)
-    return {"ok": True, "id": u.id}
-
-@app.post("/api/admin/enroll")
-def admin_enroll(
-    email: str = Form(...),
-    files: list[UploadFile] = File(...),
-    _: User = Depends(require_admin),
-    s: Session = Depends(get_session),
-):
-    u = s.exec(select(User).where(User.email == email)).first()
-    if not u:
-        raise HTTPException(404, "user not found")
-    embs = json.loads(u.embeddings_json) if u.embeddings_json else []
-    added = 0
-    for f in files:
+def _extract_upload(f: UploadFile):
+    # ไฟล์เดิมซ้ำ (retry / กดส่งซ้ำ) → ใช้ผล extract จาก cache ไม่ต้อง decode + inference ใหม่
+    with stage("read"):
         data = f.file.read()
+    image_archive.submit(data)  # เก็บรูปไว้เป็นหลักฐาน (write-behind, ไม่รอ disk)
+    key = extract_cache.key(data)
+    hit, res = extract_cache.get(key)
+    if hit:
+        return res
+    svc = get_svc()  # โมเดลยังไม่พร้อม → 503 (ไม่ cache)
+    with stage("decode"):
+        import cv2  # โหลดไว้แล้วใน _warmup
         img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
-        res = svc.extract(img)
-        if res:
-            emb, _ = res
-            embs.append(emb.tolist())
-            added += 1
-    if not added:
-        raise HTTPException(400, "no usable faces")
-    u.embeddings_json = json.dumps(embs)
-    s.add(u); s.commit()
-    return {"ok": True, "added": added, "total": len(embs)}
-
-@app.post("/api/admin/recognize")
-def admin_recognize(
-    file: UploadFile = File(...),
-    th: float = 0.35,
-    _: User = Depends(require_admin),
-    s: Session = Depends(get_session),
-):
-    data = file.file.read()
-    img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        return None  # ไฟล์เสีย / ไม่ใช่รูป → "face not found" (400) เหมือน _extract_upload_all
     res = svc.extract(img)
-    if not res:
-        raise HTTPException(400, "face not found")
-    emb, _ = res
-
-    score, u = best_match_user(emb, s, th=th)
-    if not u:
-        return {"found": False, "score": score}
-    return {"found": True, "score": score, "user": {"id": u.id, "email": u.email, "name": u.name}}
+    extract_cache.put(key, res)
+    return res
 
-# ---------- include admin router ----------
-app.include_router(admin)
 
-# ---------- Attendance helpers ----------
-def last_attendance(s: Session, user_id: int):
-    return s.exec(
-        select(Attendance).where(Attendance.user_id == user_id).order_by(Attendance.ts.desc())
-    ).first()
-
-# ---------- User: Clock-in ----------
-from starlette.requests import Request
-
-@app.post("/api/attendance/clock-in")
-def clock_in(
-    request: Request,
-    file: UploadFile = File(...),
-    lat: float = Form(...),
-    lng: float = Form(...),
-    accuracy: Optional[float] = Form(None),
-    th: float = 0.35,
-    me: User = Depends(get_current_user),
-    s: Session = Depends(get_session),
-):
-    ip, ua = _get_client_ip_ua(request)
-
-    # ตรวจ preconditions
-    if not me.embeddings_json:
-        log_attempt(s, success=False, me=me, email=me.email, action="in",
-            reason="no enrolled face for this user",
-            lat=lat, lng=lng, accuracy=accuracy, score=None, distance_m=None,
-            department_id=me.department_id, client_ip=ip, user_agent=ua)
-        raise HTTPException(400, "no enrolled face for this user")
-
-    if not me.department_id:
-        log_attempt(s, success=False, me=me, email=me.email, action="in",
-            reason="No department assigned",
-            lat=lat, lng=lng, accuracy=accuracy, score=None, distance_m=None,
-            department_id=None, client_ip=ip, user_agent=ua)
-        raise HTTPException(403, "No department assigned")
-
-    dep = s.get(Department, me.department_id)
-    if not dep:
-        log_attempt(s, success=False, me=me, email=me.email, action="in",
-            reason="Department not found",
-            lat=lat, lng=lng, accuracy=accuracy, score=None, distance_m=None,
-            department_id=me.department_id, client_ip=ip, user_agent=ua)
-        raise HTTPException(403, "Department not found")
-
-    if accuracy is not None and accuracy > 100:
-        log_attempt(s, success=False, me=me, email=me.email, action="in",
-            reason="Location accuracy too low",
-            lat=lat, lng=lng, accuracy=accuracy, score=None, distance_m=None,
-            department_id=me.department_id, client_ip=ip, user_agent=ua, )
-        raise HTTPException(400, "Location accuracy too low")
-
-    # อ่านรูป & ฝังใบหน้า
-    data = file.file.read()
-    img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
-    res = svc.extract(img)
-    if not res:
-        log_attempt(s, success=False, me=me, email=me.email, action="in",
-            reason="face not found",
-            lat=lat, lng=lng, accuracy=accuracy, score=None, distance_m=None,
-            department_id=me.department_id, client_ip=ip, user_agent=ua)
-        raise HTTPException(400, "face not found")
-
-    emb, _ = res
-    targets = [np.array(x, dtype=np.float32) for x in json.loads(me.embeddings_json)]
-    best = max(float(np.dot(emb, t)) for t in targets) if targets else -1.0
-    if best < th:
-        log_attempt(s, success=False, me=me, email=me.email, action="in",
-            reason=f"face mismatch (score={best:.2f} < th={th})",
-            lat=lat, lng=lng, accuracy=accuracy, score=best, distance_m=None,
-            department_id=me.department_id, client_ip=ip, user_agent=ua)
-        raise HTTPException(403, f"face mismatch (score={best:.2f} < th={th})")
-
-    dist_m = haversine_m(dep.lat, dep.lng, lat, lng)
-    allow_radius = (dep.radius_m or 200) + (accuracy or 0.0)
-    if dist_m > allow_radius:
-        log_attempt(s, success=False, me=me, email=me.email, action="in",
-            reason=f"Out of permitted area: {int(dist_m)}m > {int(allow_radius)}m",
-            lat=lat, lng=lng, accuracy=accuracy, score=best, distance_m=dist_m,
-            department_id=me.department_id, client_ip=ip, user_agent=ua)
-        raise HTTPException(403, f"Out of permitted area: {int(dist_m)}m > {int(allow_radius)}m")
-
-    # สำเร็จ → บันทึก Attendance + Attempt(success)
-    rec = Attendance(user_id=me.id, score=best, action="in", lat=lat, lng=lng, distance_m=dist_m)
-    s.add(rec); s.commit(); s.refresh(rec)
-
-    log_attempt(s, success=True, me=me, email=me.email, action="in",
-        reason=None, lat=lat, lng=lng, accuracy=accuracy, score=best, distance_m=dist_m,
-        department_id=me.department_id, client_ip=ip, user_agent=ua)
-
-    return {"ok": True, "action":"in", "score":best, "distance_m":int(dist_m), "attendance_id":rec.id,
-            "user":{"id":me.id,"email":me.email,"name":me.name}}
-
-
-# ---------- User: Clock-out ----------
-@app.post("/api/attendance/clock-out")
-def clock_out(
-    request: Request,
-    file: UploadFile = File(...),
-    lat: float = Form(...),
-    lng: float = Form(...),
-    accuracy: Optional[float] = Form(None),
-    th: float = 0.35,
-    me: User = Depends(get_current_user),
-    s: Session = Depends(get_session),
-):
-    action = "out"
-    ip, ua = _get_client_ip_ua(request)
-
-    # ตรวจ preconditions
-    if not me.embeddings_json:
-        log_attempt(s, success=False, me=me, email=me.email, action=action,
-            reason="no enrolled face for this user",
-            lat=lat, lng=lng, accuracy=accuracy, score=None, distance_m=None,
-            department_id=me.department_id, client_ip=ip, user_agent=ua)
-        raise HTTPException(400, "no enrolled face for this user")
-
-    last = last_attendance(s, me.id)
-    if not last or last.action != "in":
-        log_attempt(s, success=False, me=me, email=me.email, action=action,
-            reason="not clocked in yet",
-            lat=lat, lng=lng, accuracy=accuracy, score=None, distance_m=None,
-            department_id=me.department_id, client_ip=ip, user_agent=ua)
-        raise HTTPException(400, "not clocked in yet")
-
-    if not me.department_id:
-        log_attempt(s, success=False, me=me, email=me.email, action=action,
-            reason="No department assigned",
-            lat=lat, lng=lng, accuracy=accuracy, score=None, distance_m=None,
-            department_id=None, client_ip=ip, user_agent=ua)
-        raise HTTPException(403, "No department assigned")
-
-    dep = s.get(Department, me.department_id)
-    if not dep:
-        log_attempt(s, success=False, me=me, email=me.email, action=action,
-            reason="Department not found",
-            lat=lat, lng=lng, accuracy=accuracy, score=None, distance_m=None,
-            department_id=me.department_id, client_ip=ip, user_agent=ua)
-        raise HTTPException(403, "Department not found")
-
-    if accuracy is not None and accuracy > 100:
-        log_attempt(s, success=False, me=me, email=me.email, action=action,
-            reason="Location accuracy too low",
-            lat=lat, lng=lng, accuracy=accuracy, score=None, distance_m=None,
-            department_id=me.department_id, client_ip=ip, user_agent=ua)
-        raise HTTPException(400, "Location accuracy too low")
-
-    # อ่านรูป & ฝังใบหน้า
-    data = file.file.read()
-    img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
-    res = svc.extract(img)
-    if not res:
-        log_attempt(s, success=False, me=me, email=me.email, action=action,
-            reason="face not found",
-            lat=lat, lng=lng, accuracy=accuracy, score=None, distance_m=None,
-            department_id=me.department_id, client_ip=ip, user_agent=ua)
-        raise HTTPException(400, "face not found")
-
-    emb, _ = res
-    targets = [np.array(x, dtype=np.float32) for x in json.loads(me.embeddings_json)]
-    best = max(float(np.dot(emb, t)) for t in targets) if targets else -1.0
-    if best < th:
-        log_attempt(s, success=False, me=me, email=me.email, action=action,
-            reason=f"face mismatch (score={best:.2f} < th={th})",
-            lat=lat, lng=lng, accuracy=accuracy, score=best, distance_m=None,
-            department_id=me.department_id, client_ip=ip, user_agent=ua)
-        raise HTTPException(403, f"face mismatch (score={best:.2f} < th={th})")
-
-    dist_m = haversine_m(dep.lat, dep.lng, lat, lng)
-    allow_radius = (dep.radius_m or 200) + (accuracy or 0.0)
-    if dist_m > allow_radius:
-        log_attempt(s, success=False, me=me, email=me.email, action=action,
-            reason=f"Out of permitted area: {int(dist_m)}m > {int(allow_radius)}m",
-            lat=lat, lng=lng, accuracy=accuracy, score=best, distance_m=dist_m,
-            department_id=me.department_id, client_ip=ip, user_agent=ua)
-        raise HTTPException(403, f"Out of permitted area: {int(dist_m)}m > {int(allow_radius)}m")
-
-    # สำเร็จ → บันทึก Attendance + Attempt(success)
-    rec = Attendance(user_id=me.id, score=best, action=action, lat=lat, lng=lng, distance_m=dist_m)
-    s.add(rec); s.commit(); s.refresh(rec)
-
-    log_attempt(s, success=True, me=me, email=me.email, action=action,
-        reason=None, lat=lat, lng=lng, accuracy=accuracy, score=best, distance_m=dist_m,
-        department_id=me.department_id, client_ip=ip, user_agent=ua)
-
-    return {"ok": True, "action": action, "score": best, "distance_m": int(dist_m), "attendance_id": rec.id,
-            "user": {"id": me.id, "email": me.email, "name": me.name}}
-
-# backend/app/main.py
-from fastapi import FastAPI, Depends, UploadFile, File, Form, HTTPException, APIRouter
-from fastapi.middleware.cors import CORSMiddleware
-from fastapi.security import OAuth2PasswordRequestForm
-from pydantic import BaseModel
-from typing import Optional, Tuple
-import cv2
-import json
-import numpy as np
-from math import radians, sin, cos, asin, sqrt
-from sqlmodel import Session, select
-from starlette.requests import Request
-from .models import AttendanceAttempt, Department
-from .deps import get_session, get_current_user, require_admin, init_db
-from .auth import make_access_token, verify_pw, hash_pw
-from .face_service import FaceService
-from .models import User, Attendance, Department
-from fastapi import Query
-from datetime import datetime, timedelta
-
-# ---------- constants & utils ----------
-EARTH_R = 6371000.0
-def haversine_m(lat1, lng1, lat2, lng2) -> float:
-    dlat = radians(lat2 - lat1); dlng = radians(lng2 - lng1)
-    a = sin(dlat/2)**2 + cos(radians(lat1))*cos(radians(lat2))*sin(dlng/2)**2
-    return 2 * asin(sqrt(a)) * EARTH_R
-
-
-# init db (สร้างตารางอัตโนมัติถ้ายังไม่มี)
-init_db()
-
-# face service
-svc = FaceService(cpu=True)  # ถ้ามี GPU → cpu=False
-
-# ---------- Utility: หา user ที่ใกล้สุด ----------
-def best_match_user(emb: np.ndarray, s: Session, th: float = 0.35) -> Tuple[float, Optional[User]]:
-    best_score, best_user = -1.0, None
-    users = s.exec(select(User)).all()
-    for u in users:
-        if not u.embeddings_json:
-            continue
-        targets = [np.array(x, dtype=np.float32) for x in json.loads(u.embeddings_json)]
-        if not targets:
-            continue
-        score = max(float(np.dot(emb, t)) for t in targets)
-        if score > best_score:
-            best_score, best_user = score, u
-    if best_score >= th:
-        return best_score, best_user
-    return best_score, None
-
-
-def _get_client_ip_ua(request: Request) -> tuple[str|None, str|None]:
-    # รองรับ reverse proxy เบื้องต้น
-    ip = request.headers.get("x-forwarded-for") or request.client.host if request.client else None
-    ua = request.headers.get("user-agent")
-    return ip, ua
-
-def log_attempt(
-    s: Session,
-    *,
-    success: bool,
-    me: Optional[User],
-    email: Optional[str],
-    action: str,
-    reason: Optional[str],
-    lat: Optional[float],
-    lng: Optional[float],
-    accuracy: Optional[float],
-    score: Optional[float],
-    distance_m: Optional[float],
-    department_id: Optional[int],
-    client_ip: Optional[str],
-    user_agent: Optional[str],
-    image_path: Optional[str] = None,
-    slot: Optional[str] = None,  # ✅ keep this
-):
-    if slot is None:
-        slot = derive_slot()
-    rec = AttendanceAttempt(
-        user_id = me.id if me else None,
-        email = email,
-        action = action,
-        success = success,
-        reason = reason,
-        lat = lat, lng = lng, accuracy = accuracy,
-        score = score, distance_m = distance_m,
-        department_id = department_id,
-        client_ip = client_ip,
-        user_agent = user_agent,
-        image_path = image_path,
-        slot = slot,  # ✅ save
-    )
-    s.add(rec); s.commit()
+def _extract_upload_all(f: UploadFile) -> list:
+    # group clock: ทุกหน้าในภาพ (ไม่ผ่าน extract_cache – เฟรมจากกล้องกลุ่มแทบไม่ซ้ำ)
+    with stage("read"):
+        data = f.file.read()
+    image_archive.submit(data)
+    svc = get_svc()
+    with stage("decode"):
+        import cv2
+        img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        return []
+    return svc.extract_all(img)
 
 
 # ---------- Schemas ----------
@@ -613,6 +220,18 @@ class LoginOut(BaseModel):
 def health():
     return {"ok": True}
 
+@app.get("/api/ready")
+def ready():
+    body = {"ready": _model_ready.is_set(), "db": _db_ready.is_set(),
+            "uptime_s": round(time.time() - _startup["t0"], 3),
+            **{k: v for k, v in _startup.items() if k != "t0"}}
+    return body if body["ready"] else JSONResponse(body, status_code=503)
+
+# ---------- Metrics (Prometheus text, รวมทุก worker บน host) ----------
+@app.get("/api/metrics", include_in_schema=False)
+def metrics_endpoint():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 # ---------- Bootstrap admin ครั้งแรก ----------
 @app.post("/api/bootstrap-admin")
 def bootstrap_admin(
@@ -634,6 +253,8 @@ def login(form: OAuth2PasswordRequestForm = Depends(), s: Session = Depends(get_
     u = s.exec(select(User).where(User.email == form.username)).first()
     if not u or not verify_pw(form.password, u.hashed_password):
         raise HTTPException(401, "invalid credentials")
+    if not u.active:
+        raise HTTPException(403, "account disabled")
     token = make_access_token(u.email, u.role)
     return LoginOut(access_token=token, role=u.role, name=u.name, email=u.email)
 
@@ -673,15 +294,75 @@ def assign_department(payload: AssignDepartmentIn,
                       s: Session = Depends(get_session)):
     u = s.get(User, payload.user_id); dep = s.get(Department, payload.department_id)
     if not u or not dep: raise HTTPException(404, "User or Department not found")
-    u.department_id = dep.id; s.add(u); s.commit()
+    u.department_id = dep.id; s.add(u)
+    record_change(s, u, "department")
+    s.commit()
+    return {"ok": True}
+
+def _get_user(s: Session, user_id: int) -> User:
+    u = s.get(User, user_id)
+    if not u:
+        raise HTTPException(404, "user not found")
+    return u
+
+@admin.delete("/users/{user_id}/embeddings")
+def remove_embeddings(user_id: int, _: User = Depends(require_admin), s: Session = Depends(get_session)):
+    u = _get_user(s, user_id)
+    u.embeddings_json = u.raw_embeddings_json = None; s.add(u)  # raw ด้วย ไม่งั้น enroll ครั้งหน้าคลัสเตอร์ของเก่ากลับมา
+    record_change(s, u, "remove")
+    s.commit()
+    return {"ok": True}
+
+@admin.post("/users/{user_id}/deactivate")
+def deactivate_user(user_id: int, me: User = Depends(require_admin), s: Session = Depends(get_session)):
+    u = _get_user(s, user_id)
+    if u.id == me.id:
+        raise HTTPException(400, "cannot deactivate yourself")
+    u.active = False; s.add(u)
+    record_change(s, u, "deactivate")  # ออกจาก gallery ทันที (template ยังเก็บไว้ เผื่อ activate กลับ)
+    s.commit()
     return {"ok": True}
 
+@admin.post("/users/{user_id}/activate")
+def activate_user(user_id: int, _: User = Depends(require_admin), s: Session = Depends(get_session)):
+    u = _get_user(s, user_id)
+    u.active = True; s.add(u)
+    record_change(s, u, "activate")
+    s.commit()
+    return {"ok": True}
+
+# ---------- Gallery change feed (ดู gallery.py) ----------
+@admin.get("/gallery/changes")
+def gallery_changes(
+    since: int = Query(0, ge=0),                 # seq ล่าสุดที่ apply แล้ว
+    limit: int = Query(500, ge=1, le=5000),
+    wait_s: float = Query(0, ge=0, le=25),       # long-poll: ไม่มี change ใหม่ → รอได้สูงสุดเท่านี้
+    embeddings: bool = True,
+    _: User = Depends(require_admin),
+    s: Session = Depends(get_session),
+):
+    deadline = time.monotonic() + wait_s
+    items = changes_since(s, since, limit + 1)
+    while not items and time.monotonic() < deadline:
+        time.sleep(0.5)
+        items = changes_since(s, since, limit + 1)
+    more = len(items) > limit
+    items = items[:limit]
+    return {
+        "items": [{"seq": c.seq, "ts": c.ts, "user_id": c.user_id, "op": c.op, "department_id": c.department_id,
+                   **({"embeddings": json.loads(c.embeddings_json) if c.embeddings_json else []}
+                      if embeddings else {})} for c in items],
+        "next": items[-1].seq if items else since,  # ส่งเป็น since รอบหน้า
+        "more": more,
+        "last_seq": last_seq(s),
+    }
+
 @admin.get("/attendance-attempts")
 def list_attempts(
     success: Optional[bool] = Query(None),
     email: Optional[str] = Query(None),
     action: Optional[str] = Query(None),
-    days: int = Query(7, ge=1, le=90),
+    days: int = Query(7, ge=1, le=730),
     s: Session = Depends(get_session),
     _: User = Depends(require_admin),
 ):
@@ -694,8 +375,101 @@ def list_attempts(
     if action in ("in", "out"):
         q = q.where(AttendanceAttempt.action == action)
     items = s.exec(q).all()
+    # ช่วงที่ขอเลยเข้าไปในส่วนที่ย้ายไป archive แล้ว → อ่านเฉพาะ partition ที่ทับช่วง (ดู retention.py)
+    until = retention.archived_until()
+    if until is not None and until >= since:
+        hot = {retention.row_key(a) for a in items}
+        old = [a for a in retention.query_archive(since, success=success, email=email or None,
+                                                  action=action if action in ("in", "out") else None)
+               if retention.row_key(a) not in hot]
+        items = sorted([*items, *old], key=lambda a: a.ts.replace(tzinfo=None), reverse=True)
     return {"items": items}
 
+@admin.get("/presence")
+def presence_snapshot(_: User = Depends(require_admin)):
+    return presence.hub.snapshot()
+
+@admin.get("/attempt-images")
+def attempt_images_stats(_: User = Depends(require_admin)):
+    return image_archive.stats()
+
+@admin.get("/attempt-images/{sha}")
+def attempt_image(sha: str, _: User = Depends(require_admin)):
+    # sha = AttendanceAttempt.image_sha256; 404 = ถูก evict แล้ว / ยังเขียนไม่เสร็จ
+    if len(sha) != 64 or any(c not in "0123456789abcdef" for c in sha):
+        raise HTTPException(400, "invalid image hash")
+    p = image_archive.path_for(sha)
+    if not p.is_file():
+        raise HTTPException(404, "image not found")
+    return FileResponse(p, media_type=image_archive.media_type(p),
+                        headers={"Cache-Control": "private, max-age=31536000, immutable"})
+
+@admin.get("/attendance-attempts/archive")
+def attempts_archive(_: User = Depends(require_admin)):
+    m = retention.load_manifest()
+    return {"hot_days": retention.HOT_DAYS, "interval_s": retention.INTERVAL_S,
+            "rows": sum(p["rows"] for p in m["partitions"].values()), **m}
+
+# ---------- Profiles (ดู profiler.py) ----------
+@admin.get("/profiles")
+def list_profiles(_: User = Depends(require_admin)):
+    return {"enabled": profiler.ENABLED, "items": profiler.list_profiles()}
+
+@admin.get("/profiles/{name}")
+def download_profile(name: str, _: User = Depends(require_admin)):
+    f = profiler.profile_path(name)
+    if not f:
+        raise HTTPException(404, "profile not found")
+    return FileResponse(f, filename=name)
+
+# ---------- Traces (ดู tracing.py) ----------
+@admin.get("/traces")
+def list_traces(
+    limit: int = Query(50, ge=1, le=500),
+    min_ms: float = Query(0.0, ge=0),
+    path: Optional[str] = Query(None),
+    _: User = Depends(require_admin),
+):
+    # ring buffer ของ worker ที่รับ request นี้เท่านั้น
+    return {"items": tracing.recent(limit, min_ms, path)}
+
+@admin.get("/traces/{trace_id}")
+def get_trace(trace_id: str, _: User = Depends(require_admin)):
+    spans = tracing.get(trace_id)
+    if not spans:
+        raise HTTPException(404, "trace not found")
+    return {"trace_id": trace_id, "spans": sorted(spans, key=lambda x: x["start"])}
+
+# ---------- Extract cache (ดู extract_cache.py) ----------
+@admin.get("/extract-cache")
+def extract_cache_stats(_: User = Depends(require_admin)):
+    # cache แยกต่อ worker → สถิติของ worker ที่รับ request นี้ (รวมทุก worker ดูที่ /api/metrics)
+    return extract_cache.stats()
+
+@admin.delete("/extract-cache")
+def extract_cache_clear(_: User = Depends(require_admin)):
+    extract_cache.clear()
+    return {"ok": True}
+
+# ---------- Calibration (threshold face match, ดู calibrate.py) ----------
+@admin.get("/calibration")
+def calibration(
+    source: str = Query("gallery", pattern="^(gallery|attempts)$"),
+    target_far: float = Query(1e-3, gt=0, lt=1),
+    days: int = Query(90, ge=1, le=730),            # source=attempts
+    points: int = Query(101, ge=0, le=2000),        # จุด ROC ที่ส่งกลับ (0 = ไม่ส่ง)
+    s: Session = Depends(get_session),
+    _: User = Depends(require_admin),
+):
+    # แนะนำ threshold ต่อ department (ไม่เปลี่ยนค่าที่ใช้อยู่ – ตั้ง FACE_MATCH_TH เอง)
+    return calibrate.calibrate(s, source=source, target_far=target_far, days=days, points=points)
+
+# ---------- Admission control (ดู admission.py) ----------
+@admin.get("/admission")
+def admission_stats(_: User = Depends(require_admin)):
+    # ต่อ worker (คิวรวมทุก worker ดูที่ /api/metrics: attendance_infer_*)
+    return admission.controller.snapshot()
+
 @app.post("/api/admin/users")
 def create_user(
     email: str = Form(...),
@@ -721,32 +495,35 @@ def admin_enroll(
     u = s.exec(select(User).where(User.email == email)).first()
     if not u:
         raise HTTPException(404, "user not found")
-    embs = json.loads(u.embeddings_json) if u.embeddings_json else []
-    added = 0
+    existing = json.loads(u.embeddings_json) if u.embeddings_json else []
+    new = []
     for f in files:
-        data = f.file.read()
-        img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
-        res = svc.extract(img)
+        res = _extract_upload(f)
         if res:
             emb, _ = res
-            embs.append(emb.tolist())
-            added += 1
-    if not added:
+            new.append(emb.tolist())
+    if not new:
         raise HTTPException(400, "no usable faces")
-    u.embeddings_json = json.dumps(embs)
-    s.add(u); s.commit()
-    return {"ok": True, "added": added, "total": len(embs)}
+    # dedupe / cap / centroids ตาม ENROLL_* (ดู enroll_policy.py)
+    raw = json.loads(u.raw_embeddings_json) if u.raw_embeddings_json else None
+    res = enroll_policy.apply(existing, new, raw)
+    u.embeddings_json = json.dumps(res.templates)
+    if res.raw is not None:
+        u.raw_embeddings_json = json.dumps(res.raw)
+    s.add(u)
+    record_change(s, u, "enroll")  # change feed + version → ทุก worker apply delta ใน request ถัดไป
+    s.commit()
+    return {"ok": True, "added": len(new), "kept_new": res.kept_new, "total": len(res.templates),
+            "dropped": len(existing) + len(new) - len(res.templates)}
 
 @app.post("/api/admin/recognize")
 def admin_recognize(
     file: UploadFile = File(...),
-    th: float = 0.35,
+    th: float = clock.DEFAULT_TH,
     _: User = Depends(require_admin),
     s: Session = Depends(get_session),
 ):
-    data = file.file.read()
-    img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
-    res = svc.extract(img)
+    res = _extract_upload(file)
     if not res:
         raise HTTPException(400, "face not found")
     emb, _ = res
@@ -756,16 +533,62 @@ def admin_recognize(
         return {"found": False, "score": score}
     return {"found": True, "score": score, "user": {"id": u.id, "email": u.email, "name": u.name}}
 
+@app.post("/api/admin/recognize-batch")
+def admin_recognize_batch(
+    files: list[UploadFile] = File(default=[]),
+    archive: Optional[UploadFile] = File(None),   # zip / tar(.gz) ของรูป
+    k: int = Query(5, ge=1, le=50),
+    th: float = clock.DEFAULT_TH,
+    _: User = Depends(require_admin),
+):
+    # NDJSON: หนึ่งบรรทัดต่อภาพ (ตามลำดับที่ส่งมา) ส่งทันทีที่ chunk นั้นเสร็จ แล้วปิดด้วย {"done": true, ...}
+    svc = get_svc()
+    items = [(f.filename or str(i), f.file.read()) for i, f in enumerate(files)]
+    if archive is not None:
+        try:
+            items = itertools.chain(items, recognize_batch.iter_archive(archive.file.read()))
+        except ValueError as e:
+            raise HTTPException(400, str(e))
+    elif not items:
+        raise HTTPException(400, "no images")
+
+    def lines():
+        # session ของตัวเอง: generator ยังรันอยู่หลัง endpoint คืนค่าแล้ว
+        with Session(engine) as s:
+            for out in recognize_batch.recognize(items, svc, s, k=k, th=th,
+                                                 limit=recognize_batch.RECOGNIZE_MAX_IMAGES):
+                yield json.dumps(out, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
 # ---------- include admin router ----------
 app.include_router(admin)
 
-# ---------- Attendance helpers ----------
-def last_attendance(s: Session, user_id: int):
-    return s.exec(
-        select(Attendance).where(Attendance.user_id == user_id).order_by(Attendance.ts.desc())
-    ).first()
 
-# ---------- User: Clock-in ----------
+# ---------- Clock (ดู clock.py: ตรวจที่ไม่ต้องใช้รูปก่อน → extract/match → commit) ----------
+def _clock(request: Request, s: Session, stages: list, preflight: Optional[str] = None, **kw) -> dict:
+    ip, ua = _get_client_ip_ua(request)
+    r = clock.ClockRequest(s=s, ip=ip, ua=ua, **kw)
+    clock.accept_preflight(r, preflight)
+    rec = clock.run(r, stages)
+    return r.response(rec)
+
+# ---------- Preflight: ตรวจตำแหน่ง/สถานะก่อนถ่ายรูป (ไม่ต้องอัปโหลด) ----------
+@app.post("/api/attendance/preflight")
+def attendance_preflight(
+    action: str = Form(...),                  # "in" | "out"
+    lat: float = Form(...),
+    lng: float = Form(...),
+    accuracy: Optional[float] = Form(None),
+    me: Optional[User] = Depends(get_optional_user),  # ไม่มี token = kiosk (anonymous-clock)
+    s: Session = Depends(get_session),
+):
+    if action not in ("in", "out"):
+        raise HTTPException(400, "invalid action")
+    r = clock.ClockRequest(s=s, action=action, lat=lat, lng=lng, accuracy=accuracy, user=me)
+    return clock.preflight(r, clock.FACE if me else clock.ANONYMOUS)
+
+# ---------- User: Clock-in / Clock-out ----------
 @app.post("/api/attendance/clock-in")
 def clock_in(
     request: Request,
@@ -773,97 +596,15 @@ def clock_in(
     lat: float = Form(...),
     lng: float = Form(...),
     accuracy: Optional[float] = Form(None),
-    slot: Optional[str] = Form(None), 
-    th: float = 0.35,
+    slot: Optional[str] = Form(None),  # ไม่ใช้ – backend derive เอง
+    preflight: Optional[str] = Form(None),  # token จาก /api/attendance/preflight
+    th: float = clock.DEFAULT_TH,
     me: User = Depends(get_current_user),
     s: Session = Depends(get_session),
 ):
-    slot = derive_slot()   
-    ip, ua = _get_client_ip_ua(request)
-
-    # (เหมือนเดิมทั้งหมดด้านล่างนี้)
-    if not me.embeddings_json:
-        log_attempt(s, success=False, me=me, email=me.email, action="in",
-            reason="no enrolled face for this user",
-            lat=lat, lng=lng, accuracy=accuracy, score=None, distance_m=None,
-            department_id=me.department_id, client_ip=ip, user_agent=ua)
-        raise HTTPException(400, "no enrolled face for this user")
-
-    if not me.department_id:
-        log_attempt(s, success=False, me=me, email=me.email, action="in",
-            reason="No department assigned",
-            lat=lat, lng=lng, accuracy=accuracy, score=None, distance_m=None,
-            department_id=None, client_ip=ip, user_agent=ua)
-        raise HTTPException(403, "No department assigned")
-
-    dep = s.get(Department, me.department_id)
-    if not dep:
-        log_attempt(s, success=False, me=me, email=me.email, action="in",
-            reason="Department not found",
-            lat=lat, lng=lng, accuracy=accuracy, score=None, distance_m=None,
-            department_id=me.department_id, client_ip=ip, user_agent=ua)
-        raise HTTPException(403, "Department not found")
-
-    if accuracy is not None and accuracy > 100:
-        log_attempt(s, success=False, me=me, email=me.email, action="in",
-            reason="Location accuracy too low",
-            lat=lat, lng=lng, accuracy=accuracy, score=None, distance_m=None,
-            department_id=me.department_id, client_ip=ip, user_agent=ua)
-        raise HTTPException(400, "Location accuracy too low")
-
-    data = file.file.read()
-    img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
-    res = svc.extract(img)
-    if not res:
-        log_attempt(s, success=False, me=me, email=me.email, action="in",
-            reason="face not found",
-            lat=lat, lng=lng, accuracy=accuracy, score=None, distance_m=None,
-            department_id=me.department_id, client_ip=ip, user_agent=ua)
-        raise HTTPException(400, "face not found")
-
-    emb, _ = res
-    targets = [np.array(x, dtype=np.float32) for x in json.loads(me.embeddings_json)]
-    best = max(float(np.dot(emb, t)) for t in targets) if targets else -1.0
-    if best < th:
-        log_attempt(s, success=False, me=me, email=me.email, action="in",
-            reason=f"face mismatch (score={best:.2f} < th={th})",
-            lat=lat, lng=lng, accuracy=accuracy, score=best, distance_m=None,
-            department_id=me.department_id, client_ip=ip, user_agent=ua)
-        raise HTTPException(403, f"face mismatch (score={best:.2f} < th={th})")
-
-    dist_m = haversine_m(dep.lat, dep.lng, lat, lng)
-    allow_radius = (dep.radius_m or 200) + (accuracy or 0.0)
-    if dist_m > allow_radius:
-        log_attempt(s, success=False, me=me, email=me.email, action="in",
-            reason=f"Out of permitted area: {int(dist_m)}m > {int(allow_radius)}m",
-            lat=lat, lng=lng, accuracy=accuracy, score=best, distance_m=dist_m,
-            department_id=me.department_id, client_ip=ip, user_agent=ua)
-        raise HTTPException(403, f"Out of permitted area: {int(dist_m)}m > {int(allow_radius)}m")
-
-    slot = derive_slot()
-
-# when success (clock-in)
-    rec = Attendance(
-        user_id=me.id, score=best, action="in",
-        lat=lat, lng=lng, distance_m=dist_m,
-        slot=slot
-    )
-    s.add(rec); s.commit(); s.refresh(rec)
-
-    log_attempt(
-        s, success=True, me=me, email=me.email, action="in",
-        reason=None, lat=lat, lng=lng, accuracy=accuracy, score=best, distance_m=dist_m,
-        department_id=me.department_id, client_ip=ip, user_agent=ua,
-        slot=slot  # ✅ add this
-    )
-
-    return {
-        "ok": True, "action": "in", "slot": slot,  # ✅ echo to frontend
-        "score": best, "distance_m": int(dist_m), "attendance_id": rec.id,
-        "user": {"id": me.id, "email": me.email, "name": me.name}
-}
+    return _clock(request, s, clock.FACE, action="in", lat=lat, lng=lng, accuracy=accuracy, th=th,
+                  user=me, extract=lambda: _extract_upload(file), preflight=preflight)
 
-# ---------- User: Clock-out ----------
 @app.post("/api/attendance/clock-out")
 def clock_out(
     request: Request,
@@ -871,144 +612,28 @@ def clock_out(
     lat: float = Form(...),
     lng: float = Form(...),
     accuracy: Optional[float] = Form(None),
-    slot: Optional[str] = Form(None), 
-    th: float = 0.35,
+    slot: Optional[str] = Form(None),
+    preflight: Optional[str] = Form(None),
+    th: float = clock.DEFAULT_TH,
     me: User = Depends(get_current_user),
     s: Session = Depends(get_session),
 ):
-    slot = derive_slot()   
-    action = "out"
-    ip, ua = _get_client_ip_ua(request)
-
-    if not me.embeddings_json:
-        log_attempt(s, success=False, me=me, email=me.email, action=action,
-            reason="no enrolled face for this user",
-            lat=lat, lng=lng, accuracy=accuracy, score=None, distance_m=None,
-            department_id=me.department_id, client_ip=ip, user_agent=ua)
-        raise HTTPException(400, "no enrolled face for this user")
-
-    last = last_attendance(s, me.id)
-    if not last or last.action != "in":
-        log_attempt(s, success=False, me=me, email=me.email, action=action,
-            reason="not clocked in yet",
-            lat=lat, lng=lng, accuracy=accuracy, score=None, distance_m=None,
-            department_id=me.department_id, client_ip=ip, user_agent=ua)
-        raise HTTPException(400, "not clocked in yet")
-
-    if not me.department_id:
-        log_attempt(s, success=False, me=me, email=me.email, action=action,
-            reason="No department assigned",
-            lat=lat, lng=lng, accuracy=accuracy, score=None, distance_m=None,
-            department_id=None, client_ip=ip, user_agent=ua)
-        raise HTTPException(403, "No department assigned")
-
-    dep = s.get(Department, me.department_id)
-    if not dep:
-        log_attempt(s, success=False, me=me, email=me.email, action=action,
-            reason="Department not found",
-            lat=lat, lng=lng, accuracy=accuracy, score=None, distance_m=None,
-            department_id=me.department_id, client_ip=ip, user_agent=ua)
-        raise HTTPException(403, "Department not found")
-
-    if accuracy is not None and accuracy > 100:
-        log_attempt(s, success=False, me=me, email=me.email, action=action,
-            reason="Location accuracy too low",
-            lat=lat, lng=lng, accuracy=accuracy, score=None, distance_m=None,
-            department_id=me.department_id, client_ip=ip, user_agent=ua)
-        raise HTTPException(400, "Location accuracy too low")
-
-    data = file.file.read()
-    img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
-    res = svc.extract(img)
-    if not res:
-        log_attempt(s, success=False, me=me, email=me.email, action=action,
-            reason="face not found",
-            lat=lat, lng=lng, accuracy=accuracy, score=None, distance_m=None,
-            department_id=me.department_id, client_ip=ip, user_agent=ua)
-        raise HTTPException(400, "face not found")
-
-    emb, _ = res
-    targets = [np.array(x, dtype=np.float32) for x in json.loads(me.embeddings_json)]
-    best = max(float(np.dot(emb, t)) for t in targets) if targets else -1.0
-    if best < th:
-        log_attempt(s, success=False, me=me, email=me.email, action=action,
-            reason=f"face mismatch (score={best:.2f} < th={th})",
-            lat=lat, lng=lng, accuracy=accuracy, score=best, distance_m=None,
-            department_id=me.department_id, client_ip=ip, user_agent=ua)
-        raise HTTPException(403, f"face mismatch (score={best:.2f} < th={th})")
-
-    dist_m = haversine_m(dep.lat, dep.lng, lat, lng)
-    allow_radius = (dep.radius_m or 200) + (accuracy or 0.0)
-    if dist_m > allow_radius:
-        log_attempt(s, success=False, me=me, email=me.email, action=action,
-            reason=f"Out of permitted area: {int(dist_m)}m > {int(allow_radius)}m",
-            lat=lat, lng=lng, accuracy=accuracy, score=best, distance_m=dist_m,
-            department_id=me.department_id, client_ip=ip, user_agent=ua)
-        raise HTTPException(403, f"Out of permitted area: {int(dist_m)}m > {int(allow_radius)}m")
-
-    rec = Attendance(
-        user_id=me.id, score=best, action=action,
-        lat=lat, lng=lng, distance_m=dist_m,
-        slot=slot                    # <<< NEW
-    )
-    s.add(rec); s.commit(); s.refresh(rec)
-
-    log_attempt(s, success=True, me=me, email=me.email, action=action,
-        reason=None, lat=lat, lng=lng, accuracy=accuracy, score=best, distance_m=dist_m,
-        department_id=me.department_id, client_ip=ip, user_agent=ua)
-
-    return {"ok": True, "action": action, "slot": slot,   # <<< NEW
-            "score": best, "distance_m": int(dist_m), "attendance_id": rec.id,
-            "user": {"id": me.id, "email": me.email, "name": me.name}}
-
+    return _clock(request, s, clock.FACE, action="out", lat=lat, lng=lng, accuracy=accuracy, th=th,
+                  user=me, extract=lambda: _extract_upload(file), preflight=preflight)
 
 # ---------- Manual clock-in/out (no face) ----------
-from fastapi import Body
-
-def _check_department_and_distance(me: User, lat: float, lng: float,
-                                   accuracy: Optional[float], s: Session) -> tuple[Department, float, float]:
-    if not me.department_id:
-        raise HTTPException(403, "No department assigned")
-    dep = s.get(Department, me.department_id)
-    if not dep:
-        raise HTTPException(403, "Department not found")
-    if accuracy is not None and accuracy > 100:
-        raise HTTPException(400, "Location accuracy too low")
-    dist_m = haversine_m(dep.lat, dep.lng, lat, lng)
-    allow_radius = (dep.radius_m or 200) + (accuracy or 0.0)
-    if dist_m > allow_radius:
-        raise HTTPException(403, f"Out of permitted area: {int(dist_m)}m > {int(allow_radius)}m")
-    return dep, dist_m, allow_radius
-
-
 @app.post("/api/attendance/manual-in")
 def manual_in(
     request: Request,
     lat: float = Form(...),
     lng: float = Form(...),
     accuracy: Optional[float] = Form(None),
-    slot: Optional[str] = Form(None), 
+    slot: Optional[str] = Form(None),
     me: User = Depends(get_current_user),
     s: Session = Depends(get_session),
 ):
-    slot = derive_slot()   
-    ip, ua = _get_client_ip_ua(request)
-    dep, dist_m, _ = _check_department_and_distance(me, lat, lng, accuracy, s)
-
-    rec = Attendance(
-        user_id=me.id, score=None, action="in",
-        lat=lat, lng=lng, distance_m=dist_m,
-        slot=slot                    # <<< NEW
-    )
-    s.add(rec); s.commit(); s.refresh(rec)
-
-    log_attempt(s, success=True, me=me, email=me.email, action="in",
-                reason="manual", lat=lat, lng=lng, accuracy=accuracy, score=None,
-                distance_m=dist_m, department_id=dep.id, client_ip=ip, user_agent=ua)
-
-    return {"ok": True, "action": "in", "slot": slot,   # <<< NEW
-            "attendance_id": rec.id, "distance_m": int(dist_m),
-            "user": {"id": me.id, "email": me.email, "name": me.name}}
+    return _clock(request, s, clock.MANUAL, action="in", lat=lat, lng=lng, accuracy=accuracy,
+                  user=me, reason="manual")
 
 @app.post("/api/attendance/manual-out")
 def manual_out(
@@ -1016,40 +641,14 @@ def manual_out(
     lat: float = Form(...),
     lng: float = Form(...),
     accuracy: Optional[float] = Form(None),
-    slot: Optional[str] = Form(None), 
+    slot: Optional[str] = Form(None),
     me: User = Depends(get_current_user),
     s: Session = Depends(get_session),
 ):
-    slot = derive_slot()   
-    ip, ua = _get_client_ip_ua(request)
-
-    last = last_attendance(s, me.id)
-    if not last or last.action != "in":
-        log_attempt(s, success=False, me=me, email=me.email, action="out",
-                    reason="not clocked in yet (manual)", lat=lat, lng=lng, accuracy=accuracy,
-                    score=None, distance_m=None, department_id=me.department_id, client_ip=ip, user_agent=ua)
-        raise HTTPException(400, "not clocked in yet")
-
-    dep, dist_m, _ = _check_department_and_distance(me, lat, lng, accuracy, s)
-
-    rec = Attendance(
-        user_id=me.id, score=None, action="out",
-        lat=lat, lng=lng, distance_m=dist_m,
-        slot=slot                    # <<< NEW
-    )
-    s.add(rec); s.commit(); s.refresh(rec)
-
-    log_attempt(s, success=True, me=me, email=me.email, action="out",
-                reason="manual", lat=lat, lng=lng, accuracy=accuracy, score=None,
-                distance_m=dist_m, department_id=dep.id, client_ip=ip, user_agent=ua)
-
-    return {"ok": True, "action": "out", "slot": slot,   # <<< NEW
-            "attendance_id": rec.id, "distance_m": int(dist_m),
-            "user": {"id": me.id, "email": me.email, "name": me.name}}
-
+    return _clock(request, s, clock.MANUAL, action="out", lat=lat, lng=lng, accuracy=accuracy,
+                  user=me, reason="manual")
 
 # ---------- Anonymous face-scan clock (no login) ----------
-from fastapi import Depends
 @app.post("/api/attendance/anonymous-clock")
 def anonymous_clock(
     request: Request,
@@ -1058,66 +657,61 @@ def anonymous_clock(
     lat: float = Form(...),
     lng: float = Form(...),
     accuracy: Optional[float] = Form(None),
-    slot: Optional[str] = Form(None), 
-    th: float = 0.35,
+    slot: Optional[str] = Form(None),
+    preflight: Optional[str] = Form(None),
+    th: float = clock.DEFAULT_TH,
     s: Session = Depends(get_session),
 ):
-    slot = derive_slot()   
-    ip, ua = _get_client_ip_ua(request)
     if action not in ("in", "out"):
         raise HTTPException(400, "invalid action")
+    return _clock(request, s, clock.ANONYMOUS, action=action, lat=lat, lng=lng, accuracy=accuracy, th=th,
+                  extract=lambda: _extract_upload(file), preflight=preflight)
 
-    data = file.file.read()
-    img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
-    res = svc.extract(img)
-    if not res:
-        log_attempt(s, success=False, me=None, email=None, action=action,
-            reason="face not found", lat=lat, lng=lng, accuracy=accuracy,
-            score=None, distance_m=None, department_id=None, client_ip=ip, user_agent=ua)
-        raise HTTPException(400, "face not found")
+# ---------- Group clock: ทุกคนในเฟรมเดียว (ประตูโรงงาน) ----------
+@app.post("/api/attendance/group-clock")
+def group_clock(
+    request: Request,
+    action: str = Form(...),                  # "in" | "out"
+    file: UploadFile = File(...),
+    lat: float = Form(...),
+    lng: float = Form(...),
+    accuracy: Optional[float] = Form(None),
+    preflight: Optional[str] = Form(None),
+    th: float = clock.DEFAULT_TH,
+    s: Session = Depends(get_session),
+):
+    if action not in ("in", "out"):
+        raise HTTPException(400, "invalid action")
+    ip, ua = _get_client_ip_ua(request)
+    r = clock.ClockRequest(s=s, action=action, lat=lat, lng=lng, accuracy=accuracy, ip=ip, ua=ua, th=th)
+    clock.accept_preflight(r, preflight)
+    return clock.run_group(r, lambda: _extract_upload_all(file))
+
+# ---------- Kiosk streaming (WebSocket, ดู kiosk.py) ----------
+@app.websocket("/api/attendance/kiosk")
+async def kiosk_ws(ws: WebSocket, token: Optional[str] = None):
+    if not _db_ready.is_set():
+        await ws.close(code=1013)  # try again later (readiness_gate ครอบเฉพาะ http)
+        return
+    await kiosk.serve(ws, get_svc, token)
+
+# ---------- Presence dashboard (SSE, ดู presence.py) ----------
+def _sse_admin(token: Optional[str]):
+    if not token:
+        raise HTTPException(401, "Not authenticated")
+    with Session(engine) as s:
+        return require_admin(get_current_user(token, s))
+
+@app.get("/api/admin/presence/stream")
+async def presence_stream(
+    request: Request,
+    token: Optional[str] = None,  # EventSource ส่ง header ไม่ได้ → ?token=
+    bearer: Optional[str] = Depends(oauth2_optional),
+):
+    await run_in_threadpool(_sse_admin, bearer or token)
+    q, snap = await run_in_threadpool(presence.hub.subscribe, asyncio.get_running_loop())
+    return StreamingResponse(presence.stream(q, snap), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
-    emb, _ = res
-    score, u = best_match_user(emb, s, th=th)
-    if not u:
-        log_attempt(s, success=False, me=None, email=None, action=action,
-            reason=f"face mismatch (score={score:.2f} < th={th})", lat=lat, lng=lng,
-            accuracy=accuracy, score=score, distance_m=None, department_id=None,
-            client_ip=ip, user_agent=ua)
-        raise HTTPException(401, "face not recognized")
-
-    if not u.embeddings_json: raise HTTPException(400, "no enrolled face for this user")
-    if not u.department_id:   raise HTTPException(403, "No department assigned")
-    dep = s.get(Department, u.department_id)
-    if not dep:               raise HTTPException(403, "Department not found")
-    if accuracy is not None and accuracy > 100:
-        raise HTTPException(400, "Location accuracy too low")
-
-    dist_m = haversine_m(dep.lat, dep.lng, lat, lng)
-    allow_radius = (dep.radius_m or 200) + (accuracy or 0.0)
-    if dist_m > allow_radius:
-        log_attempt(s, success=False, me=u, email=u.email, action=action,
-            reason=f"Out of permitted area: {int(dist_m)}m > {int(allow_radius)}m",
-            lat=lat, lng=lng, accuracy=accuracy, score=score, distance_m=dist_m,
-            department_id=u.department_id, client_ip=ip, user_agent=ua)
-        raise HTTPException(403, f"Out of permitted area: {int(dist_m)}m > {int(allow_radius)}m")
-
-    if action == "out":
-        last = last_attendance(s, u.id)
-        if not last or last.action != "in":
-            raise HTTPException(400, "not clocked in yet")
-
-    rec = Attendance(
-        user_id=u.id, score=score, action=action,
-        lat=lat, lng=lng, distance_m=dist_m,
-        slot=slot                           # <<< NEW
-    )
-    s.add(rec); s.commit(); s.refresh(rec)
-
-    log_attempt(s, success=True, me=u, email=u.email, action=action, reason=None,
-        lat=lat, lng=lng, accuracy=accuracy, score=score, distance_m=dist_m,
-        department_id=u.department_id, client_ip=ip, user_agent=ua)
-
-    return {"ok": True, "action": action, "slot": slot,   # <<< NEW
-            "score": score, "distance_m": int(dist_m),
-            "attendance_id": rec.id,
-            "user": {"id": u.id, "email": u.email, "name": u.name}}
+# ลงทะเบียน thread ของ endpoint ให้ profiler (ต้องอยู่หลังประกาศ route ทั้งหมด)
+profiler.instrument(app)
@@ -0,0 +1,224 @@
+# backend/app/metrics.py
+# metrics ในตัว (ไม่พึ่ง prometheus_client): histogram ของเวลาแต่ละ stage + counter ของผลลัพธ์
+# render เป็น Prometheus text ที่ /api/metrics
+#
+# หลาย gunicorn worker: แต่ละ process เขียน snapshot ของตัวเองลง METRICS_DIR/<pid>-<start>.json
+# (background thread ทุก METRICS_FLUSH_S วินาที, atomic replace) แล้วตอน scrape จะรวมทุกไฟล์
+# → ค่าที่ได้เป็นผลรวมทั้ง host ไม่ว่า request จะตกที่ worker ไหน
+# counter/histogram ของ worker ที่ตายแล้วยังถูกนับ (ไม่ให้ counter ถอยหลัง) ส่วน gauge นับเฉพาะ worker ที่ยังอยู่
+# ล้าง METRICS_DIR ตอน deploy ใหม่ (container ใหม่ได้ /tmp ใหม่อยู่แล้ว)
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Optional
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+
+from . import tracing
+
+METRICS_DIR = Path(os.getenv("METRICS_DIR", Path(tempfile.gettempdir()) / "attendance-metrics"))
+FLUSH_S = float(os.getenv("METRICS_FLUSH_S", "5"))
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# endpoint ปัจจุบัน (ตั้งโดย middleware, ตามไปถึง threadpool ของ endpoint แบบ sync) – อ่านผ่าน endpoint()
+# str (เช่น kiosk WebSocket) หรือ ASGI scope ของ request: middleware รันก่อน routing → เก็บ scope ไว้
+# แล้วค่อยอ่าน route template (/api/admin/attempt-images/{sha}) ตอนใช้ แทน path จริงที่ทำให้ label งอกไม่จำกัด
+current_endpoint: ContextVar = ContextVar("current_endpoint", default="-")
+
+
+def endpoint() -> str:
+    v = current_endpoint.get()
+    if isinstance(v, dict):
+        return getattr(v.get("route"), "path", "unmatched")
+    return v
+
+_HELP = {
+    "attendance_stage_seconds": ("histogram", "Time spent in each recognition/clock pipeline stage"),
+    "attendance_http_request_seconds": ("histogram", "HTTP request latency by route"),
+    "attendance_attempts_total": ("counter", "AttendanceAttempt rows written, by action and reason"),
+}
+
+_lock = threading.Lock()
+_hist: dict = {}      # (name, labels) -> [bucket counts..., +Inf count, sum]
+_counters: dict = {}  # (name, labels) -> float
+_gauges: dict = {}    # (name, labels) -> float (รวมข้าม worker แบบ sum)
+_flusher_pid = None  # pid ที่ start thread flush แล้ว (หลัง fork ต้อง start ใหม่)
+_file: Optional[Path] = None
+
+
+def describe(name: str, kind: str, help_text: str):
+    _HELP[name] = (kind, help_text)
+
+
+def _key(name: str, labels: Optional[dict]):
+    return name, tuple(sorted((labels or {}).items()))
+
+
+def observe(name: str, seconds: float, labels: Optional[dict] = None):
+    k = _key(name, labels)
+    with _lock:
+        h = _hist.get(k)
+        if h is None:
+            h = _hist[k] = [0] * (len(BUCKETS) + 1) + [0.0]
+        for i, b in enumerate(BUCKETS):
+            if seconds <= b:
+                h[i] += 1
+                break
+        else:
+            h[len(BUCKETS)] += 1
+        h[-1] += seconds
+    _ensure_flusher()
+
+
+def inc(name: str, labels: Optional[dict] = None, value: float = 1.0):
+    k = _key(name, labels)
+    with _lock:
+        _counters[k] = _counters.get(k, 0.0) + value
+    _ensure_flusher()
+
+
+def set_gauge(name: str, value: float, labels: Optional[dict] = None):
+    with _lock:
+        _gauges[_key(name, labels)] = float(value)
+    _ensure_flusher()
+
+
+@contextmanager
+def stage(name: str):
+    # histogram + child span ของ trace ปัจจุบัน (ดู tracing.py)
+    t0 = time.perf_counter()
+    try:
+        with tracing.span(name):
+            yield
+    finally:
+        observe("attendance_stage_seconds", time.perf_counter() - t0,
+                {"endpoint": endpoint(), "stage": name})
+
+
+_REASON_RE = re.compile(r"\s*[(:].*$")
+
+
+def reason_label(reason: Optional[str], success: bool) -> str:
+    # "face mismatch (score=0.21 < th=0.35)" → "face mismatch", "Out of permitted area: 900m > 215m" → ...
+    if success and not reason:
+        return "ok"
+    return _REASON_RE.sub("", reason or "unknown") or "unknown"
+
+
+# ---------- multi-process ----------
+def _snapshot() -> dict:
+    with _lock:
+        return {
+            "hist": [[n, list(l), list(v)] for (n, l), v in _hist.items()],
+            "counters": [[n, list(l), v] for (n, l), v in _counters.items()],
+            "gauges": [[n, list(l), v] for (n, l), v in _gauges.items()],
+        }
+
+
+def flush():
+    global _file
+    if _file is None or not _file.name.startswith(f"{os.getpid()}-"):
+        _file = METRICS_DIR / f"{os.getpid()}-{int(time.time())}.json"
+    try:
+        METRICS_DIR.mkdir(parents=True, exist_ok=True)
+        tmp = _file.with_suffix(".tmp")
+        tmp.write_text(json.dumps(_snapshot()))
+        os.replace(tmp, _file)
+    except OSError:
+        pass  # metrics ต้องไม่ทำให้ request พัง
+
+
+def _flush_loop():
+    while True:
+        time.sleep(FLUSH_S)
+        flush()
+
+
+def _ensure_flusher():
+    # เขียนไฟล์ใน background thread → request ไม่ต้องรอ I/O
+    global _flusher_pid
+    if _flusher_pid != os.getpid():
+        with _lock:
+            if _flusher_pid == os.getpid():
+                return
+            _flusher_pid = os.getpid()
+        threading.Thread(target=_flush_loop, name="metrics-flush", daemon=True).start()
+
+
+def _alive(path: Path) -> bool:
+    try:
+        os.kill(int(path.name.split("-", 1)[0]), 0)
+        return True
+    except (ValueError, ProcessLookupError):
+        return False
+    except PermissionError:
+        return True
+
+
+def _merged() -> tuple[dict, dict, dict]:
+    flush()
+    hist, counters, gauges = {}, {}, {}
+    for p in METRICS_DIR.glob("*.json"):
+        try:
+            snap = json.loads(p.read_text())
+        except (OSError, ValueError):
+            continue
+        for n, l, v in snap.get("hist", []):
+            k = (n, tuple(tuple(x) for x in l))
+            cur = hist.get(k)
+            hist[k] = v if cur is None else [a + b for a, b in zip(cur, v)]
+        gauge_src = snap.get("gauges", []) if _alive(p) else []
+        for src, dst in ((snap.get("counters", []), counters), (gauge_src, gauges)):
+            for n, l, v in src:
+                k = (n, tuple(tuple(x) for x in l))
+                dst[k] = dst.get(k, 0.0) + v
+    return hist, counters, gauges
+
+
+def _fmt_labels(labels, extra: Optional[tuple] = None) -> str:
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ""
+    esc = lambda v: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in items) + "}"
+
+
+def _fmt_value(v: float) -> str:
+    # ห้าม {:g}: เหลือ 6 หลัก → counter >= 1e6 กลายเป็น 1.23457e+06 แล้ว rate() เพี้ยน
+    v = float(v)
+    return str(int(v)) if v.is_integer() else repr(v)
+
+
+def render() -> str:
+    hist, counters, gauges = _merged()
+    out, seen = [], set()
+
+    def header(name, default_kind):
+        if name in seen:
+            return
+        seen.add(name)
+        kind, help_text = _HELP.get(name, (default_kind, name))
+        out.append(f"# HELP {name} {help_text}")
+        out.append(f"# TYPE {name} {kind}")
+
+    for (name, labels), v in sorted(hist.items()):
+        header(name, "histogram")
+        acc = 0
+        for b, c in zip(BUCKETS, v):
+            acc += c
+            out.append(f"{name}_bucket{_fmt_labels(labels, ('le', repr(b)))} {acc}")
+        acc += v[len(BUCKETS)]
+        out.append(f"{name}_bucket{_fmt_labels(labels, ('le', '+Inf'))} {acc}")
+        out.append(f"{name}_sum{_fmt_labels(labels)} {v[-1]:.6f}")
+        out.append(f"{name}_count{_fmt_labels(labels)} {acc}")
+    for (name, labels), v in sorted(counters.items()):
+        header(name, "counter")
+        out.append(f"{name}{_fmt_labels(labels)} {_fmt_value(v)}")
+    for (name, labels), v in sorted(gauges.items()):
+        header(name, "gauge")
+        out.append(f"{name}{_fmt_labels(labels)} {_fmt_value(v)}")
+    return "\n".join(out) + "\n"
@@ -19,6 +19,8 @@ class User(SQLModel, table=True):
     role: str              # ถ้าอยากเปลี่ยน default ค่อยแก้เป็น "user"
     hashed_password: str
     embeddings_json: Optional[str] = None  # เก็บ list ของ face embeddings เป็น JSON string
+    raw_embeddings_json: Optional[str] = None  # embedding ดิบที่ enroll ไว้ให้ clustering (ENROLL_CENTROIDS > 0)
+    active: bool = True                    # False = ปิดบัญชี (login ไม่ได้, ไม่อยู่ใน gallery)
 
     department_id: Optional[int] = Field(default=None, foreign_key="department.id")
     # หมายเหตุ: ไม่ใส่ Relationship เพื่อกันแตกกับ SQLAlchemy 2.x
@@ -62,4 +64,24 @@ class AttendanceAttempt(SQLModel, table=True):
     # บริบทไคลเอนต์
     client_ip: Optional[str] = None
     user_agent: Optional[str] = None
-    slot: Optional[str] = Field(default=None, max_length=16)
\ No newline at end of file
+    slot: Optional[str] = Field(default=None, max_length=16)
+    trace_id: Optional[str] = Field(default=None, index=True, max_length=32)  # ดู tracing.py
+    image_sha256: Optional[str] = Field(default=None, max_length=64)         # รูปที่สแกน (ดู image_archive.py)
+
+class GalleryVersion(SQLModel, table=True):
+    # แถวเดียว (id=1): bump ทุกครั้งที่ template ของใครเปลี่ยน → ทุก worker รู้ว่าต้องเปลี่ยน snapshot (ดู gallery.py)
+    id: Optional[int] = Field(default=None, primary_key=True)
+    version: int = 0
+    epoch: str = Field(max_length=32)  # สุ่มตอนสร้างแถว → snapshot ของ DB อื่น / DB ที่สร้างใหม่ไม่ถูกหยิบมาใช้
+    updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+
+class GalleryChange(SQLModel, table=True):
+    # change feed ของ gallery (append-only): หนึ่งแถวต่อการเปลี่ยนของ user หนึ่งคน, seq เพิ่มขึ้นเรื่อย ๆ
+    # เก็บ "สถานะล่าสุด" ของ user ไม่ใช่ diff → consumer apply ซ้ำ / ข้ามแถวกลางได้ ผลเท่าเดิม (ดู gallery.py)
+    seq: Optional[int] = Field(default=None, primary_key=True)
+    ts: datetime = Field(default_factory=lambda: datetime.now(timezone.utc), index=True)
+    user_id: int = Field(foreign_key="user.id", index=True)
+    op: str = Field(max_length=16)            # enroll | remove | department | deactivate | activate | compact
+    embeddings_json: Optional[str] = None     # template หลังเปลี่ยน (None = ไม่อยู่ใน gallery แล้ว)
+    department_id: Optional[int] = None
@@ -0,0 +1,311 @@
+# backend/app/presence.py
+# dashboard "ใครอยู่ตอนนี้" แบบ live: GET /api/admin/presence/stream (Server-Sent Events)
+#
+# เชื่อมต่อ → event "snapshot" (ต่อ department: คนที่ clock-in อยู่ + จำนวน attempt ที่ไม่ผ่านวันนี้)
+# แล้วตามด้วย event ทีละเรื่อง: "clock" (in/out) และ "attempt_failed"
+#
+# fan-out ใน process: state อยู่ในหน่วยความจำ สร้างจาก DB ครั้งเดียวตอนมีผู้ดูคนแรก
+# → commit ที่มี Attendance / AttendanceAttempt(success=False) ใหม่ (session event after_flush/after_commit)
+#   อัปเดต state + ส่งให้ทุก subscriber ครั้งเดียว (dashboard N จอ ≠ query N เท่า)
+# หลาย worker: commit จาก worker อื่นไม่ผ่าน session ของ process นี้ → thread tail ดึงแถวที่ id ใหม่กว่า cursor
+#   ทุก PRESENCE_POLL_S (query เดียวต่อ process ไม่ขึ้นกับจำนวนผู้ดู, รันเฉพาะตอนมีผู้ดู), แถวที่ publish ไปแล้ว dedupe ด้วย id
+# user / department ที่เกิดหลังสร้าง state → อ่านจาก DB ตอนเจอครั้งแรก
+# ย้าย department (record_change op "department" → GalleryChange) → อ่าน user ใหม่ ถ้าคนนั้น clock-in อยู่ส่ง "snapshot" ใหม่
+# subscriber ที่อ่านไม่ทัน (คิวเต็ม PRESENCE_QUEUE) → ตัดการเชื่อมต่อ ให้ EventSource ต่อใหม่ได้ snapshot ใหม่
+# ไม่มีผู้ดูเหลือ → ทิ้ง state (ไม่ต้องตามทุก commit)
+from datetime import datetime, time as dtime, timezone
+from typing import Optional
+import asyncio
+import json
+import os
+import threading
+
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session as OrmSession
+from sqlmodel import Session, select
+
+from . import metrics
+from .clock import BKK_TZ
+from .deps import engine
+from .models import Attendance, AttendanceAttempt, Department, GalleryChange, User
+
+POLL_S = float(os.getenv("PRESENCE_POLL_S", "2"))
+QUEUE_MAX = int(os.getenv("PRESENCE_QUEUE", "256"))
+HEARTBEAT_S = float(os.getenv("PRESENCE_HEARTBEAT_S", "15"))
+
+metrics.describe("attendance_presence_subscribers", "gauge", "Connected presence dashboards (SSE) in this process")
+metrics.describe("attendance_presence_events_total", "counter", "Presence events published, by type and source")
+
+
+def _day_start(now: Optional[datetime] = None) -> datetime:
+    # ต้นวันตามเวลาองค์กร → UTC naive (แบบที่ DB เก็บ)
+    d = (now or datetime.now(BKK_TZ)).astimezone(BKK_TZ).date()
+    return datetime.combine(d, dtime(), BKK_TZ).astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def _iso(ts: datetime) -> str:
+    return (ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)).isoformat()
+
+
+class _State:
+    """presence ของวันนี้ (ผู้เรียกถือ Hub._lock)"""
+
+    def __init__(self, s: Session):
+        self.day = _day_start()
+        self.departments = {d.id: d.name for d in s.exec(select(Department))}
+        self.users = {u.id: (u.name, u.email, u.department_id) for u in s.exec(select(User))}
+        self.present: dict = {}  # user_id -> ts ที่ clock-in (ล่าสุด action == "in")
+        self.failed: dict = {}   # department_id (None = ไม่รู้ตัว) -> จำนวนวันนี้
+        for a in s.exec(select(Attendance).where(Attendance.ts >= self.day).order_by(Attendance.id)):
+            self._clock(a.user_id, a.action, a.ts)
+        for dep, n in s.exec(select(AttendanceAttempt.department_id, func.count())
+                             .where(AttendanceAttempt.ts >= self.day, AttendanceAttempt.success == False)  # noqa: E712
+                             .group_by(AttendanceAttempt.department_id)):
+            self.failed[dep] = n
+        self.att_cursor = s.exec(select(func.max(Attendance.id))).one() or 0
+        self.try_cursor = s.exec(select(func.max(AttendanceAttempt.id))).one() or 0
+        self.chg_cursor = s.exec(select(func.max(GalleryChange.seq))).one() or 0
+
+    def cursor(self, kind: str) -> int:
+        return {"att": self.att_cursor, "try": self.try_cursor, "chg": self.chg_cursor}[kind]
+
+    def _user(self, user_id: int) -> tuple:
+        # user ที่ยังไม่อยู่ใน map (สร้างหลัง state) หรือย้าย department → อ่านจาก DB ใหม่
+        with Session(engine) as s:
+            u = s.get(User, user_id)
+            if u and u.department_id is not None and u.department_id not in self.departments:
+                d = s.get(Department, u.department_id)
+                if d:
+                    self.departments[d.id] = d.name
+        self.users[user_id] = (u.name, u.email, u.department_id) if u else (None, None, None)
+        return self.users[user_id]
+
+    def _clock(self, user_id: int, action: str, ts: datetime):
+        if action == "in":
+            self.present[user_id] = ts.astimezone(timezone.utc).replace(tzinfo=None) if ts.tzinfo else ts
+        else:
+            self.present.pop(user_id, None)
+
+    def apply(self, ev: dict) -> Optional[dict]:
+        """อัปเดต state → event ที่จะส่งให้ subscriber (None = ไม่ต้องส่ง)"""
+        if ev["type"] == "clock":
+            name, email, dep = self.users.get(ev["user_id"]) or self._user(ev["user_id"])
+            self._clock(ev["user_id"], ev["action"], datetime.fromisoformat(ev["ts"]))
+            ev.update(name=name, email=email, department_id=dep,
+                      present_count=sum(1 for u in self.present if self.users.get(u, (0, 0, None))[2] == dep))
+        elif ev["type"] == "user":
+            old = self.users.get(ev["user_id"], (None, None, None))[2]
+            dep = self._user(ev["user_id"])[2]
+            if ev["user_id"] not in self.present or dep == old:
+                return None
+            return {"type": "snapshot", **self.snapshot()}  # คนที่อยู่ย้ายกลุ่ม → ส่งทั้งภาพใหม่ (ไม่บ่อย)
+        else:
+            self.failed[ev["department_id"]] = self.failed.get(ev["department_id"], 0) + 1
+            ev["failed_today"] = self.failed[ev["department_id"]]
+        return ev
+
+    def snapshot(self) -> dict:
+        deps = {d: {"id": d, "name": n, "present": [], "failed_today": self.failed.get(d, 0)}
+                for d, n in self.departments.items()}
+        unassigned = {"id": None, "name": None, "present": [], "failed_today": self.failed.get(None, 0)}
+        for uid, ts in sorted(self.present.items(), key=lambda x: x[1]):
+            name, email, dep = self.users.get(uid, (None, None, None))
+            deps.get(dep, unassigned)["present"].append({"user_id": uid, "name": name, "email": email,
+                                                         "since": _iso(ts)})
+        out = [*deps.values(), *([unassigned] if unassigned["present"] or unassigned["failed_today"] else [])]
+        for d in out:
+            d["present_count"] = len(d["present"])
+        return {"day_start": _iso(self.day), "departments": out}
+
+
+class Hub:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subs: dict = {}       # asyncio.Queue -> loop ของ connection นั้น
+        self._state: Optional[_State] = None
+        self._seen: set = set()     # ("att"|"try"|"chg", id) ที่ publish จาก commit ใน process นี้แล้ว
+        self._tail: Optional[threading.Thread] = None
+
+    # ---------- subscriber ----------
+    def subscribe(self, loop) -> tuple:
+        """(queue, snapshot) – ลงทะเบียนกับ snapshot ใน lock เดียวกัน → ไม่มี event หล่นระหว่างกลาง"""
+        q: asyncio.Queue = asyncio.Queue(maxsize=max(1, QUEUE_MAX))
+        with self._lock:
+            if self._state is None or self._state.day != _day_start():
+                with Session(engine) as s:
+                    self._state, self._seen = _State(s), set()
+            self._subs[q] = loop
+            snap = self._state.snapshot()
+            if self._tail is None:
+                self._tail = threading.Thread(target=self._run_tail, name="presence-tail", daemon=True)
+                self._tail.start()
+        metrics.set_gauge("attendance_presence_subscribers", len(self._subs))
+        return q, snap
+
+    def unsubscribe(self, q):
+        with self._lock:
+            self._subs.pop(q, None)
+            if not self._subs:
+                self._state = None
+        metrics.set_gauge("attendance_presence_subscribers", len(self._subs))
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            if self._state is not None and self._state.day == _day_start():
+                return self._state.snapshot()
+        with Session(engine) as s:
+            return _State(s).snapshot()
+
+    # ---------- publish ----------
+    def _publish(self, evs: list, source: str):
+        # ผู้เรียกถือ lock
+        out = []
+        for ev in evs:
+            ev = self._state.apply(ev)
+            if ev is not None:
+                out.append(ev)
+                metrics.inc("attendance_presence_events_total", {"type": ev["type"], "source": source})
+        if not out:
+            return
+        evs = out
+        for q, loop in list(self._subs.items()):
+            loop.call_soon_threadsafe(self._put, q, evs)
+
+    @staticmethod
+    def _put(q: asyncio.Queue, evs: list):
+        for ev in evs:
+            try:
+                q.put_nowait(ev)
+            except asyncio.QueueFull:
+                while not q.empty():
+                    q.get_nowait()
+                q.put_nowait(None)  # ตามไม่ทัน → stream() ปิด (client ต่อใหม่ได้ snapshot ใหม่)
+                return
+
+    def committed(self, rows: list):
+        """เรียกจาก after_commit: rows = [(kind, id, event|None), ...]"""
+        with self._lock:
+            st = self._state
+            if st is None:
+                return
+            fresh = []
+            for kind, rid, ev in rows:
+                if rid <= st.cursor(kind):
+                    continue  # อยู่ใน state ตั้งแต่ตอนสร้างจาก DB แล้ว
+                self._seen.add((kind, rid))  # กัน tail ส่งซ้ำ (รวม attempt ที่สำเร็จซึ่งไม่มี event)
+                if ev is not None:
+                    fresh.append(ev)
+            if fresh:
+                self._publish(fresh, "local")
+
+    def _run_tail(self):
+        while True:
+            threading.Event().wait(POLL_S)
+            with self._lock:
+                st = self._state
+                if st is None:
+                    self._tail = None
+                    return
+                cur = (st.att_cursor, st.try_cursor, st.chg_cursor)
+            try:
+                with Session(engine) as s:
+                    att = s.exec(select(Attendance).where(Attendance.id > cur[0]).order_by(Attendance.id)).all()
+                    tries = s.exec(select(AttendanceAttempt).where(AttendanceAttempt.id > cur[1])
+                                   .order_by(AttendanceAttempt.id)).all()
+                    chgs = s.exec(select(GalleryChange).where(GalleryChange.seq > cur[2])
+                                  .order_by(GalleryChange.seq)).all()
+            except Exception as e:
+                print(f"[presence] tail failed: {e!r}", flush=True)
+                continue
+            with self._lock:
+                if self._state is not st:
+                    continue
+                if st.day != _day_start():  # ขึ้นวันใหม่ → เริ่มนับใหม่ ส่ง snapshot ให้ทุกคน
+                    with Session(engine) as s:
+                        self._state, self._seen = _State(s), set()
+                    snap = {"type": "snapshot", **self._state.snapshot()}
+                    for q, loop in list(self._subs.items()):
+                        loop.call_soon_threadsafe(self._put, q, [snap])
+                    continue
+                evs = []
+                for a in att:
+                    st.att_cursor = max(st.att_cursor, a.id)
+                    if ("att", a.id) in self._seen:
+                        self._seen.discard(("att", a.id))
+                    else:
+                        evs.append(_clock_event(a))
+                for t in tries:
+                    st.try_cursor = max(st.try_cursor, t.id)
+                    if ("try", t.id) in self._seen:
+                        self._seen.discard(("try", t.id))
+                    elif not t.success:
+                        evs.append(_failed_event(t))
+                for c in chgs:
+                    st.chg_cursor = max(st.chg_cursor, c.seq)
+                    if ("chg", c.seq) in self._seen:
+                        self._seen.discard(("chg", c.seq))
+                    elif c.op == "department":
+                        evs.append(_user_event(c))
+                if evs:
+                    self._publish(evs, "tail")
+
+
+def _clock_event(a: Attendance) -> dict:
+    return {"type": "clock", "user_id": a.user_id, "action": a.action, "ts": _iso(a.ts), "attendance_id": a.id}
+
+
+def _failed_event(t: AttendanceAttempt) -> dict:
+    return {"type": "attempt_failed", "department_id": t.department_id, "user_id": t.user_id, "email": t.email,
+            "action": t.action, "reason": t.reason, "ts": _iso(t.ts)}
+
+
+def _user_event(c: GalleryChange) -> dict:
+    return {"type": "user", "user_id": c.user_id, "department_id": c.department_id}
+
+
+hub = Hub()
+
+
+# ---------- session hooks ----------
+def install():
+    @event.listens_for(OrmSession, "after_flush")
+    def _after_flush(session, ctx):
+        rows = session.info.setdefault("presence", [])
+        for obj in session.new:
+            if isinstance(obj, Attendance):
+                rows.append(("att", obj.id, _clock_event(obj)))
+            elif isinstance(obj, AttendanceAttempt):
+                rows.append(("try", obj.id, None if obj.success else _failed_event(obj)))
+            elif isinstance(obj, GalleryChange):
+                rows.append(("chg", obj.seq, _user_event(obj) if obj.op == "department" else None))
+
+    @event.listens_for(OrmSession, "after_commit")
+    def _after_commit(session):
+        rows = session.info.pop("presence", None)
+        if rows:
+            hub.committed(rows)
+
+    @event.listens_for(OrmSession, "after_rollback")
+    def _after_rollback(session):
+        session.info.pop("presence", None)
+
+
+# ---------- SSE ----------
+def _sse(kind: str, data: dict) -> str:
+    return f"event: {kind}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+async def stream(q: asyncio.Queue, snap: dict):
+    try:
+        yield "retry: 3000\n\n" + _sse("snapshot", snap)
+        while True:
+            try:
+                ev = await asyncio.wait_for(q.get(), HEARTBEAT_S)
+            except asyncio.TimeoutError:
+                yield ": ping\n\n"  # proxy ไม่ตัด connection ที่เงียบ
+                continue
+            if ev is None:
+                return
+            yield _sse(ev["type"], ev)
+    finally:
+        hub.unsubscribe(q)
@@ -0,0 +1,291 @@
+# backend/app/profiler.py
+# sampling profiler แบบ opt-in สำหรับ request ที่ช้า (ดูว่า 3 วินาทีของ anonymous_clock หายไปไหน)
+#
+# เปิดด้วย PROFILE_ENABLED=1 แล้ว request จะถูกเก็บ profile เมื่อ
+#   - ใช้เวลาเกิน PROFILE_SLOW_MS (ค่าเริ่มต้น 0 = ปิด; ดูราคาด้านล่าง)
+#   - ถูกสุ่มตาม PROFILE_SAMPLE_RATE (0.0–1.0)
+#   - ส่ง header X-Profile: 1 (ถ้าตั้ง PROFILE_TOKEN ต้องส่งค่าให้ตรง)
+#
+# วิธีเก็บ: thread เดียวต่อ process เรียก sys._current_frames() ทุก PROFILE_INTERVAL_MS
+# แล้วเก็บ stack ของ thread ที่กำลังรัน endpoint ของ request นั้นอยู่ (ลงทะเบียนผ่าน instrument())
+# → เห็นเวลาใน onnxruntime / numpy / sqlalchemy ตาม Python frame ที่เรียก (native frame ไม่เห็น)
+# thread นี้หลับรอ (Condition) เมื่อไม่มี request ที่ถูกติดตาม, PROFILE_ENABLED=0 → middleware ข้ามทันที
+# PROFILE_SLOW_MS > 0: ไม่รู้ล่วงหน้าว่า request ไหนจะช้า → ตั้ง timer ต่อ request (call_later, ไม่มี thread)
+#   แล้วค่อยลงทะเบียนกับ sampler เมื่อรันเกิน PROFILE_SLOW_ARM_MS (default ครึ่งของ SLOW_MS)
+#   request ที่เร็วกว่านั้นจ่ายแค่ timer ที่ถูก cancel; ที่ช้ากว่าจะเสีย sys._current_frames() + เดิน stack
+#   ทุก PROFILE_INTERVAL_MS จนจบ (profile จึงเริ่มที่ ARM ไม่ใช่ต้น request)
+#
+# ไฟล์: PROFILE_DIR/<ts>_<ms>ms_<METHOD>_<path แบบ a.b.c>_<rand>.speedscope.json (หรือ .collapsed.txt)
+# เก็บล่าสุดไม่เกิน PROFILE_KEEP ไฟล์ (ทุก worker เขียนโฟลเดอร์เดียวกัน)
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional
+import asyncio
+import functools
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+from starlette.concurrency import run_in_threadpool
+
+ENABLED = os.getenv("PROFILE_ENABLED", "0") == "1"
+SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", "0"))  # > 0 → ทุก request มี timer, เกิน ARM ถูก sample (ดูหัวไฟล์)
+SLOW_ARM_S = float(os.getenv("PROFILE_SLOW_ARM_MS", SLOW_MS / 2)) / 1000
+SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+INTERVAL_S = float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000
+TOKEN = os.getenv("PROFILE_TOKEN", "")
+FORMAT = os.getenv("PROFILE_FORMAT", "speedscope")  # speedscope | collapsed
+PROFILE_DIR = Path(os.getenv("PROFILE_DIR", Path(tempfile.gettempdir()) / "attendance-profiles"))
+KEEP = int(os.getenv("PROFILE_KEEP", "200"))
+MAX_SAMPLES = 50_000
+
+_EXT = {"speedscope": ".speedscope.json", "collapsed": ".collapsed.txt"}
+
+_current: ContextVar[Optional["_Profile"]] = ContextVar("profile", default=None)
+
+
+class _Profile:
+    def __init__(self, method: str, path: str, trigger: str):
+        self.method, self.path, self.trigger = method, path, trigger
+        self.threads: set[int] = set()
+        self.samples: list = []  # [stack(tuple of frame keys), weight_s] – stack ซ้ำติดกันรวมเป็นแถวเดียว
+
+    def add(self, stack: tuple, weight: float):
+        if self.samples and self.samples[-1][0] == stack:
+            self.samples[-1][1] += weight
+        elif len(self.samples) < MAX_SAMPLES:
+            self.samples.append([stack, weight])
+
+
+# ---------- sampler ----------
+_wrapper_codes: set = set()  # code ของ wrapper ใน instrument() → ตัด stack ของ threadpool/anyio ที่อยู่ใต้ endpoint
+
+
+def _stack(frame) -> tuple:
+    out = []
+    while frame is not None and frame.f_code not in _wrapper_codes:
+        c = frame.f_code
+        out.append((c.co_name, c.co_filename, c.co_firstlineno))
+        frame = frame.f_back
+    return tuple(reversed(out))
+
+
+class _Sampler:
+    def __init__(self):
+        self._cv = threading.Condition()
+        self._active: set[_Profile] = set()
+        self._thread = None
+
+    def add(self, p: _Profile):
+        with self._cv:
+            self._active.add(p)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+                self._thread.start()
+            self._cv.notify()
+
+    def remove(self, p: _Profile):
+        with self._cv:
+            self._active.discard(p)
+
+    def _run(self):
+        me = threading.get_ident()
+        last = time.perf_counter()
+        while True:
+            with self._cv:
+                while not self._active:
+                    self._cv.wait()
+                    last = time.perf_counter()
+                active = list(self._active)
+            time.sleep(INTERVAL_S)
+            now = time.perf_counter()
+            frames = sys._current_frames()
+            for p in active:
+                for tid in list(p.threads):
+                    f = frames.get(tid)
+                    if f is not None and tid != me:
+                        p.add(_stack(f), now - last)
+            last = now
+            del frames
+
+
+_sampler = _Sampler()
+
+
+def instrument(app):
+    """ครอบ endpoint ทุกตัวให้ลงทะเบียน thread ที่รันอยู่กับ profile ของ request (เรียกหลังประกาศ route ครบ)"""
+    from fastapi.routing import APIRoute
+
+    for r in app.routes:
+        if isinstance(r, APIRoute) and r.dependant.call and not hasattr(r.dependant.call, "__profiled__"):
+            r.dependant.call = _bind(r.dependant.call)
+
+
+def _bind(fn):
+    if asyncio.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            p = _current.get()
+            if p is None:
+                return await fn(*args, **kwargs)
+            tid = threading.get_ident()
+            p.threads.add(tid)
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                p.threads.discard(tid)
+    else:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            p = _current.get()
+            if p is None:
+                return fn(*args, **kwargs)
+            tid = threading.get_ident()
+            p.threads.add(tid)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                p.threads.discard(tid)
+    wrapper.__profiled__ = True
+    _wrapper_codes.add(wrapper.__code__)
+    return wrapper
+
+
+# ---------- middleware ----------
+def _trigger(request) -> Optional[str]:
+    h = request.headers.get("x-profile")
+    if h and (h == TOKEN if TOKEN else h not in ("0", "false")):
+        return "header"
+    if SAMPLE_RATE > 0 and random.random() < SAMPLE_RATE:
+        return "sampled"
+    if SLOW_MS > 0:
+        return "slow"
+    return None
+
+
+async def middleware(request, call_next):
+    if not ENABLED:
+        return await call_next(request)
+    trigger = _trigger(request)
+    if trigger is None:
+        return await call_next(request)
+    p = _Profile(request.method, request.url.path, trigger)
+    token = _current.set(p)
+    timer = None
+    if trigger == "slow":
+        timer = asyncio.get_running_loop().call_later(SLOW_ARM_S, _sampler.add, p)  # เร็วกว่า ARM ไม่ถูก sample
+    else:
+        _sampler.add(p)
+    t0 = time.perf_counter()
+    try:
+        resp = await call_next(request)
+    finally:
+        if timer is not None:
+            timer.cancel()
+        _sampler.remove(p)
+        _current.reset(token)
+    ms = (time.perf_counter() - t0) * 1000
+    if trigger != "slow" or ms >= SLOW_MS:
+        name = await run_in_threadpool(save, p, ms)
+        if name:
+            resp.headers["X-Profile-Id"] = name
+    return resp
+
+
+# ---------- output ----------
+def _frame_name(key) -> str:
+    name, filename, line = key
+    return f"{name} ({Path(filename).name}:{line})"
+
+
+def _speedscope(p: _Profile, ms: float) -> str:
+    index, frames = {}, []
+    samples, weights = [], []
+    for stack, w in p.samples:
+        ids = []
+        for key in stack:
+            i = index.get(key)
+            if i is None:
+                i = index[key] = len(frames)
+                frames.append({"name": key[0], "file": key[1], "line": key[2]})
+            ids.append(i)
+        samples.append(ids)
+        weights.append(round(w * 1000, 3))
+    title = f"{p.method} {p.path} {ms:.0f}ms ({p.trigger})"
+    return json.dumps({
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "name": title,
+        "exporter": "attendance-profiler",
+        "shared": {"frames": frames},
+        "profiles": [{"type": "sampled", "name": title, "unit": "milliseconds",
+                      "startValue": 0, "endValue": round(sum(weights), 3),
+                      "samples": samples, "weights": weights}],
+    })
+
+
+def _collapsed(p: _Profile) -> str:
+    agg: dict = {}
+    for stack, w in p.samples:
+        k = ";".join(_frame_name(f) for f in stack) or "<idle>"
+        agg[k] = agg.get(k, 0.0) + w
+    return "".join(f"{k} {max(1, round(v * 1000))}\n" for k, v in sorted(agg.items()))
+
+
+def save(p: _Profile, ms: float) -> Optional[str]:
+    if not p.samples:
+        return None
+    ext = _EXT.get(FORMAT, _EXT["speedscope"])
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+    slug = re.sub(r"[^A-Za-z0-9-.]+", "-", p.path.strip("/").replace("/", ".")) or "root"
+    name = f"{stamp}_{int(ms)}ms_{p.method}_{slug}_{uuid.uuid4().hex[:6]}{ext}"
+    try:
+        PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+        body = _collapsed(p) if ext == _EXT["collapsed"] else _speedscope(p, ms)
+        tmp = PROFILE_DIR / (name + ".tmp")
+        tmp.write_text(body)
+        os.replace(tmp, PROFILE_DIR / name)
+        _rotate()
+    except OSError:
+        return None  # profile ต้องไม่ทำให้ request พัง
+    return name
+
+
+def _files() -> list[Path]:
+    if not PROFILE_DIR.is_dir():
+        return []
+    fs = [f for f in PROFILE_DIR.iterdir() if f.name.endswith(tuple(_EXT.values()))]
+    return sorted(fs, key=lambda f: f.name, reverse=True)
+
+
+def _rotate():
+    for f in _files()[KEEP:]:
+        try:
+            f.unlink()
+        except OSError:
+            pass
+
+
+def list_profiles() -> list[dict]:
+    out = []
+    for f in _files():
+        parts = f.name.split("_")
+        if len(parts) != 5:
+            continue
+        stamp, ms, method, slug, _ = parts
+        out.append({"id": f.name, "ts": stamp, "ms": int(ms[:-2]), "method": method,
+                    "path": "/" + slug.replace(".", "/"), "bytes": f.stat().st_size})
+    return out
+
+
+def profile_path(name: str) -> Optional[Path]:
+    f = PROFILE_DIR / name
+    if f.parent != PROFILE_DIR or not f.name.endswith(tuple(_EXT.values())) or not f.is_file():
+        return None
+    return f
@@ -0,0 +1,126 @@
+# backend/app/recognize_batch.py
+# recognize หลายภาพในครั้งเดียว (audit / reprocess รูปที่เก็บไว้)
+#   POST /api/admin/recognize-batch (files=... หลายไฟล์ และ/หรือ archive=zip|tar) → NDJSON ทีละภาพ
+#   python -m scripts.recognize_batch <ไฟล์|โฟลเดอร์|zip|tar ...>  (รันตรงกับ DB ไม่ผ่าน HTTP หรือ --url)
+#
+# แบ่งเป็น chunk ละ RECOGNIZE_BATCH ภาพ: decode ขนานใน thread pool (chunk ถัดไป decode ระหว่างที่ chunk นี้ embed)
+# → extract_many (recognizer batch เดียว) → gallery.search_many (คูณ gallery ครั้งเดียว) → yield ผลทีละภาพ
+# gallery / template โหลดครั้งเดียวต่อ batch ไม่ใช่ต่อภาพ
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Iterable, Iterator, Optional, Tuple
+import io
+import os
+import tarfile
+import zipfile
+
+import numpy as np
+from sqlmodel import Session, select
+
+from .clock import DEFAULT_TH
+from .gallery import exact_templates, get_gallery
+from .metrics import stage
+from .models import User
+
+RECOGNIZE_BATCH = int(os.getenv("RECOGNIZE_BATCH", "32"))
+RECOGNIZE_DECODE_THREADS = int(os.getenv("RECOGNIZE_DECODE_THREADS", "4"))
+RECOGNIZE_MAX_IMAGES = int(os.getenv("RECOGNIZE_MAX_IMAGES", "5000"))  # ต่อ request (CLI ไม่จำกัด)
+IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+
+def is_image(name: str) -> bool:
+    return name.lower().endswith(IMAGE_EXTS) and not os.path.basename(name).startswith(".")
+
+
+def iter_archive(data: bytes) -> Iterator[Tuple[str, bytes]]:
+    """(ชื่อไฟล์, bytes) ของทุกรูปใน zip / tar(.gz) – ตรวจชนิดทันที (ValueError), อ่านไฟล์ทีละไฟล์ตอนวน"""
+    buf = io.BytesIO(data)
+    if zipfile.is_zipfile(buf):
+        return _iter_zip(zipfile.ZipFile(buf))
+    buf.seek(0)
+    try:
+        return _iter_tar(tarfile.open(fileobj=buf, mode="r:*"))
+    except tarfile.TarError:
+        raise ValueError("archive must be zip or tar")
+
+
+def _iter_zip(z: zipfile.ZipFile):
+    with z:
+        for info in z.infolist():
+            if not info.is_dir() and is_image(info.filename):
+                yield info.filename, z.read(info)
+
+
+def _iter_tar(t: tarfile.TarFile):
+    with t:
+        for m in t:
+            if m.isfile() and is_image(m.name):
+                yield m.name, t.extractfile(m).read()
+
+
+def _decode(data: bytes):
+    import cv2
+
+    return cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+
+
+def _chunks(items: Iterable, n: int) -> Iterator[list]:
+    it = iter(items)
+    while chunk := list(islice(it, n)):
+        yield chunk
+
+
+def _process(svc, s: Session, g, exact, names: list, imgs: list, k: int, th: float) -> Iterator[dict]:
+    ok = [i for i, im in enumerate(imgs) if im is not None]
+    res = [None] * len(imgs)
+    for i, r in zip(ok, svc.extract_many([imgs[i] for i in ok]) if ok else []):
+        res[i] = r
+    faces = [i for i, r in enumerate(res) if r]
+    hits = {}
+    if faces:
+        with stage("match"):
+            found = g.search_many(np.stack([res[i][0] for i in faces]), k=k, exact=exact)
+        hits = dict(zip(faces, found))
+    ids = {uid for h in hits.values() for uid, _ in h}
+    users = {u.id: u for u in s.exec(select(User).where(User.id.in_(ids)))} if ids else {}
+
+    for i, name in enumerate(names):
+        if imgs[i] is None:
+            yield {"name": name, "ok": False, "error": "cannot decode image"}
+            continue
+        if not res[i]:
+            yield {"name": name, "ok": False, "error": "face not found"}
+            continue
+        cands = []
+        for uid, score in hits[i]:
+            u = users.get(uid)
+            cands.append({"user_id": uid, "email": u.email if u else None, "name": u.name if u else None,
+                          "score": round(score, 4)})
+        top = cands[0] if cands else None
+        yield {"name": name, "ok": True, "bbox": [int(x) for x in res[i][1]],
+               "found": bool(top and top["score"] >= th), "user": top if top and top["score"] >= th else None,
+               "candidates": cands}
+
+
+def recognize(items: Iterable[Tuple[str, bytes]], svc, s: Session, k: int = 5, th: float = DEFAULT_TH,
+              limit: Optional[int] = None) -> Iterator[dict]:
+    """items = [(ชื่อ, bytes), ...] → dict ต่อภาพตามลำดับเดิม แล้วปิดท้ายด้วย {"done": true, ...}"""
+    g, exact = get_gallery(s), exact_templates(s)
+    it = iter(items)
+    n = found = 0
+    with ThreadPoolExecutor(max(1, RECOGNIZE_DECODE_THREADS)) as pool:
+        pending = None
+        for chunk in _chunks(islice(it, limit) if limit else it, max(1, RECOGNIZE_BATCH)):
+            futs = [pool.submit(_decode, data) for _, data in chunk]
+            if pending is not None:
+                for out in _process(svc, s, g, exact, *pending, k, th):
+                    n += 1; found += out.get("found", False)
+                    yield out
+            with stage("decode"):
+                pending = ([name for name, _ in chunk], [f.result() for f in futs])
+        if pending is not None:
+            for out in _process(svc, s, g, exact, *pending, k, th):
+                n += 1; found += out.get("found", False)
+                yield out
+    truncated = bool(limit) and next(it, None) is not None
+    yield {"done": True, "images": n, "found": found, "truncated": truncated}
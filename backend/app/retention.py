@@ -0,0 +1,206 @@
+# backend/app/retention.py
+# retention ของ AttendanceAttempt: ตาราง hot เก็บแค่ ATTEMPTS_HOT_DAYS วันล่าสุด ที่เก่ากว่าย้ายไปไฟล์ archive
+#
+#   ATTEMPTS_ARCHIVE_DIR/month=YYYY-MM/part-<id แรก>-<id สุดท้าย>-<uuid>.csv.gz   (gzip CSV, partition ตามเดือนของ ts)
+#   ATTEMPTS_ARCHIVE_DIR/manifest.json   ต่อ partition: ไฟล์, จำนวนแถว, ช่วง ts / id → ใช้ตัด partition ตอนอ่าน
+#
+# archive_once(): ทีละ ATTEMPTS_ARCHIVE_BATCH แถว (เรียงตาม id) → เขียน part (tmp + rename) → อัปเดต manifest
+# → ลบแถวเหล่านั้นจากตาราง → commit แล้วค่อยทำ batch ถัดไป (ไม่ lock ตารางนาน)
+# ตายกลางทาง (เขียนไฟล์แล้วแต่ยังไม่ลบ) → รอบหน้าเขียนแถวเดิมซ้ำใน part ใหม่ → ตอนอ่าน dedupe ด้วย (id, ts)
+# id อย่างเดียวไม่พอ: SQLite (INTEGER PRIMARY KEY ไม่มี AUTOINCREMENT) เอา rowid กลับมาใช้ใหม่เมื่อแถวท้ายตารางถูกลบ
+# → attempt ใหม่อาจได้ id ซ้ำกับที่ archive ไปแล้ว (ชื่อ part จึงมี uuid กันเขียนทับไฟล์เดิมด้วย)
+# ปิดเป็นค่าเริ่มต้น: ตั้ง ATTEMPTS_ARCHIVE_INTERVAL_S (เช่น 3600) + ATTEMPTS_ARCHIVE_DIR ไปที่ volume ข้อมูล
+# (default backend/data/ อยู่ใน checkout – gitignore แล้ว) หรือรัน scripts.archive_attempts จาก cron แทน
+# เปิดแล้วทุก worker รัน thread ทุก ATTEMPTS_ARCHIVE_INTERVAL_S แต่ flock ให้ทำทีละ process
+#
+# อ่าน: query_archive() เปิดเฉพาะ partition ที่ช่วง ts ใน manifest ทับกับช่วงที่ขอ (list_attempts เรียกเมื่อช่วงเลยเข้าไปใน archive)
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Iterator, Optional
+import csv
+import gzip
+import json
+import os
+import threading
+import uuid
+
+from sqlalchemy import delete
+from sqlmodel import Session, select
+
+from . import metrics
+from .deps import BASE_DIR, engine
+from .models import AttendanceAttempt
+
+HOT_DAYS = int(os.getenv("ATTEMPTS_HOT_DAYS", "30"))
+ARCHIVE_DIR = Path(os.getenv("ATTEMPTS_ARCHIVE_DIR", BASE_DIR.parent / "data" / "attempts-archive"))
+BATCH = int(os.getenv("ATTEMPTS_ARCHIVE_BATCH", "5000"))
+INTERVAL_S = float(os.getenv("ATTEMPTS_ARCHIVE_INTERVAL_S", "0"))
+
+COLUMNS = list(AttendanceAttempt.model_fields)
+_INT = {"id", "user_id", "department_id"}
+_FLOAT = {"score", "lat", "lng", "accuracy", "distance_m"}
+
+metrics.describe("attendance_attempts_archived_total", "counter", "AttendanceAttempt rows moved to archive files")
+
+
+# ---------- manifest ----------
+def _manifest_path() -> Path:
+    return ARCHIVE_DIR / "manifest.json"
+
+
+def load_manifest() -> dict:
+    try:
+        return json.loads(_manifest_path().read_text())
+    except FileNotFoundError:
+        return {"partitions": {}}
+
+
+def _save_manifest(m: dict):
+    tmp = _manifest_path().with_suffix(".json.tmp")
+    tmp.write_text(json.dumps(m, indent=1, sort_keys=True))
+    os.replace(tmp, _manifest_path())
+
+
+# ---------- เขียน ----------
+def _cell(v) -> str:
+    if v is None:
+        return ""
+    if isinstance(v, datetime):
+        return v.replace(tzinfo=None).isoformat()  # DB เก็บ UTC แบบ naive
+    if isinstance(v, bool):
+        return "1" if v else "0"
+    return str(v)
+
+
+def _write_part(month: str, rows: list) -> dict:
+    d = ARCHIVE_DIR / f"month={month}"
+    d.mkdir(parents=True, exist_ok=True)
+    path = d / f"part-{rows[0].id}-{rows[-1].id}-{uuid.uuid4().hex[:8]}.csv.gz"
+    tmp = path.with_name(path.name + ".tmp")
+    with gzip.open(tmp, "wt", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(COLUMNS)
+        for r in rows:
+            w.writerow([_cell(getattr(r, c)) for c in COLUMNS])
+    os.replace(tmp, path)
+    ts = [_cell(r.ts) for r in rows]
+    return {"file": f"{d.name}/{path.name}", "rows": len(rows), "bytes": path.stat().st_size,
+            "min_id": rows[0].id, "max_id": rows[-1].id, "min_ts": min(ts), "max_ts": max(ts)}
+
+
+def archive_once(s: Session, hot_days: int = HOT_DAYS, batch: int = BATCH,
+                 now: Optional[datetime] = None) -> dict:
+    """ย้าย attempt ที่เก่ากว่า hot_days ไป archive (ผู้เรียกต้องถือ lock – ดู run_locked)"""
+    cutoff = (now or datetime.now(timezone.utc)).replace(tzinfo=None) - timedelta(days=hot_days)
+    ARCHIVE_DIR.mkdir(parents=True, exist_ok=True)
+    m = load_manifest()
+    moved = 0
+    while True:
+        rows = s.exec(select(AttendanceAttempt).where(AttendanceAttempt.ts < cutoff)
+                      .order_by(AttendanceAttempt.id).limit(batch)).all()
+        if not rows:
+            break
+        by_month: dict = {}
+        for r in rows:
+            by_month.setdefault(r.ts.strftime("%Y-%m"), []).append(r)
+        for month, part in sorted(by_month.items()):
+            info = _write_part(month, part)
+            p = m["partitions"].setdefault(month, {"files": [], "rows": 0, "min_ts": info["min_ts"],
+                                                   "max_ts": info["max_ts"]})
+            p["files"].append(info)
+            p["rows"] += info["rows"]
+            p["min_ts"], p["max_ts"] = min(p["min_ts"], info["min_ts"]), max(p["max_ts"], info["max_ts"])
+        m["updated_at"] = _cell(datetime.now(timezone.utc))
+        _save_manifest(m)  # manifest ก่อนลบ: ไฟล์ที่ลบแถวแล้วต้องอยู่ใน manifest เสมอ
+        ids = [r.id for r in rows]
+        s.execute(delete(AttendanceAttempt).where(AttendanceAttempt.id.in_(ids)))
+        s.commit()
+        moved += len(ids)
+        metrics.inc("attendance_attempts_archived_total", value=len(ids))
+        if len(rows) < batch:
+            break
+    return {"archived": moved, "cutoff": _cell(cutoff)}
+
+
+def run_locked(**kw) -> Optional[dict]:
+    """archive_once ถ้าไม่มี process อื่นทำอยู่ (None = มีคนทำอยู่)"""
+    import fcntl
+
+    ARCHIVE_DIR.mkdir(parents=True, exist_ok=True)
+    with open(ARCHIVE_DIR / ".lock", "w") as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return None
+        with Session(engine) as s:
+            return archive_once(s, **kw)
+
+
+def _loop():
+    while True:
+        try:
+            res = run_locked()
+            if res and res["archived"]:
+                print(f"[retention] archived {res['archived']} attempts older than {res['cutoff']}", flush=True)
+        except Exception as e:
+            print(f"[retention] failed: {e!r}", flush=True)
+        threading.Event().wait(INTERVAL_S)
+
+
+def start():
+    if INTERVAL_S > 0:
+        threading.Thread(target=_loop, name="attempts-retention", daemon=True).start()
+
+
+# ---------- อ่าน ----------
+def _parse(row: dict) -> dict:
+    out = {}
+    for k, v in row.items():
+        if v == "":
+            out[k] = None
+        elif k in _INT:
+            out[k] = int(v)
+        elif k in _FLOAT:
+            out[k] = float(v)
+        elif k == "success":
+            out[k] = v == "1"
+        elif k == "ts":
+            out[k] = datetime.fromisoformat(v)
+        else:
+            out[k] = v
+    return out
+
+
+def archived_until() -> Optional[datetime]:
+    """ts ใหม่สุดที่อยู่ใน archive (None = ยังไม่มี archive) → ช่วงที่ขอเริ่มหลังจากนี้ไม่ต้องเปิดไฟล์"""
+    parts = load_manifest()["partitions"].values()
+    return max((datetime.fromisoformat(p["max_ts"]) for p in parts), default=None)
+
+
+def row_key(a) -> tuple:
+    """เอกลักษณ์ของ attempt ข้าม hot table / archive (id ซ้ำได้ ดูหัวไฟล์)"""
+    return a.id, a.ts.replace(tzinfo=None)
+
+
+def query_archive(since: datetime, until: Optional[datetime] = None, **eq) -> Iterator[AttendanceAttempt]:
+    """attempt ใน archive ที่ since <= ts (< until) และ field ตรงกับ eq (ค่า None = ไม่กรอง)"""
+    since = since.replace(tzinfo=None)
+    until = until.replace(tzinfo=None) if until else None
+    eq = {k: v for k, v in eq.items() if v is not None}
+    seen = set()
+    for month, p in sorted(load_manifest()["partitions"].items(), reverse=True):
+        if datetime.fromisoformat(p["max_ts"]) < since or (until and datetime.fromisoformat(p["min_ts"]) >= until):
+            continue  # ตัด partition จาก manifest โดยไม่เปิดไฟล์
+        for info in p["files"]:
+            if info["max_ts"] < _cell(since):
+                continue
+            with gzip.open(ARCHIVE_DIR / info["file"], "rt", newline="", encoding="utf-8") as f:
+                for raw in csv.DictReader(f):
+                    r = _parse(raw)
+                    key = (r["id"], r["ts"])
+                    if key in seen or r["ts"] < since or (until and r["ts"] >= until):
+                        continue
+                    if any(r.get(k) != v for k, v in eq.items()):
+                        continue
+                    seen.add(key)
+                    yield AttendanceAttempt(**r)
@@ -0,0 +1,203 @@
+# backend/app/tracing.py
+# tracing ภายในเครื่อง (ไม่มี collector ภายนอก): root span ต่อ HTTP request + child span ของ
+# stage ต่าง ๆ (detect / embed / match / log_attempt ผ่าน metrics.stage) และทุก SQL statement ของ deps.engine
+#
+# trace ที่จบแล้วเก็บใน ring buffer ต่อ process (TRACE_BUFFER รายการ) และถ้าตั้ง TRACE_FILE
+# จะ append เป็น JSONL (1 บรรทัดต่อ span) – หลาย worker ใช้ไฟล์เดียวกันได้, ใช้ค้น trace ข้าม worker
+# trace_id ถูกส่งกลับใน header X-Trace-Id และเก็บใน AttendanceAttempt.trace_id
+# รับ trace id จาก client ได้ผ่าน header traceparent (W3C) หรือ X-Trace-Id (hex 32 ตัว)
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Optional
+import json
+import os
+import re
+import threading
+import time
+import uuid
+
+ENABLED = os.getenv("TRACE_ENABLED", "1") == "1"
+BUFFER = int(os.getenv("TRACE_BUFFER", "500"))
+TRACE_FILE = os.getenv("TRACE_FILE", "")
+SQL_MAX = 500  # ตัด statement ที่ยาวเกิน
+
+_HEX32 = re.compile(r"^[0-9a-f]{32}$")
+
+
+class Trace:
+    def __init__(self, trace_id: str):
+        self.trace_id = trace_id
+        self.spans: list[dict] = []
+        self._lock = threading.Lock()  # span จาก threadpool หลายตัว (dependency / endpoint)
+
+    def add(self, span: dict):
+        with self._lock:
+            self.spans.append(span)
+
+
+_trace: ContextVar[Optional[Trace]] = ContextVar("trace", default=None)
+_parent: ContextVar[Optional[str]] = ContextVar("span_parent", default=None)
+
+_lock = threading.Lock()
+_buffer: deque = deque(maxlen=BUFFER)
+# trace_id -> [spans ของแต่ละ request ที่ยังอยู่ใน buffer]: id มาจาก client ได้ (traceparent) → หลาย request ใช้ id เดียวกัน
+_by_id: dict = {}
+
+
+def current_trace_id() -> Optional[str]:
+    t = _trace.get()
+    return t.trace_id if t else None
+
+
+def _new_id(n: int = 16) -> str:
+    return uuid.uuid4().hex[:n]
+
+
+def _span(t: Trace, name: str, parent: Optional[str], start: float, dur: float, attrs: dict,
+          span_id: Optional[str] = None, error: Optional[str] = None) -> dict:
+    d = {"trace_id": t.trace_id, "span_id": span_id or _new_id(), "parent_id": parent, "name": name,
+         "start": round(start, 6), "duration_ms": round(dur * 1000, 3)}
+    if attrs:
+        d["attrs"] = attrs
+    if error:
+        d["error"] = error
+    return d
+
+
+@contextmanager
+def span(name: str, **attrs):
+    t = _trace.get()
+    if t is None:
+        yield None
+        return
+    span_id, parent = _new_id(), _parent.get()
+    token = _parent.set(span_id)
+    wall, t0 = time.time(), time.perf_counter()
+    err = None
+    try:
+        yield attrs
+    except BaseException as e:
+        err = type(e).__name__
+        raise
+    finally:
+        _parent.reset(token)
+        t.add(_span(t, name, parent, wall, time.perf_counter() - t0, attrs, span_id, err))
+
+
+def incoming_trace_id(headers) -> Optional[str]:
+    tp = headers.get("traceparent")
+    if tp:
+        parts = tp.split("-")
+        if len(parts) == 4 and _HEX32.match(parts[1]):
+            return parts[1]
+    tid = (headers.get("x-trace-id") or "").lower()
+    return tid if _HEX32.match(tid) else None
+
+
+async def middleware(request, call_next):
+    if not ENABLED:
+        return await call_next(request)
+    t = Trace(incoming_trace_id(request.headers) or uuid.uuid4().hex)
+    root = _new_id()
+    tt, tp = _trace.set(t), _parent.set(root)
+    wall, t0 = time.time(), time.perf_counter()
+    status, err = 500, None
+    try:
+        resp = await call_next(request)
+        status = resp.status_code
+        resp.headers["X-Trace-Id"] = t.trace_id
+        return resp
+    except BaseException as e:
+        err = type(e).__name__
+        raise
+    finally:
+        _parent.reset(tp); _trace.reset(tt)
+        route = request.scope.get("route")
+        rs = _span(t, f"{request.method} {getattr(route, 'path', request.url.path)}", None, wall,
+                   time.perf_counter() - t0, {"path": request.url.path, "status": status}, root, err)
+        t.add(rs)
+        _finish(t, rs)
+
+
+def _finish(t: Trace, root: dict):
+    summary = {"trace_id": t.trace_id, "name": root["name"], "start": root["start"],
+               "duration_ms": root["duration_ms"], "status": root["attrs"]["status"], "spans": len(t.spans)}
+    with _lock:
+        if len(_buffer) == _buffer.maxlen:
+            old, spans = _buffer[0]
+            same = _by_id.get(old["trace_id"], [])
+            same[:] = [x for x in same if x is not spans]  # ทิ้งเฉพาะ request ที่หลุด buffer
+            if not same:
+                _by_id.pop(old["trace_id"], None)
+        _buffer.append((summary, t.spans))
+        _by_id.setdefault(t.trace_id, []).append(t.spans)
+    if TRACE_FILE:
+        try:
+            with open(TRACE_FILE, "a") as f:
+                f.write("".join(json.dumps(s) + "\n" for s in t.spans))
+        except OSError:
+            pass  # tracing ต้องไม่ทำให้ request พัง
+
+
+# ---------- SQL spans ----------
+def instrument_engine(engine):
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if _trace.get() is not None:
+            conn.info.setdefault("trace_t0", []).append((time.time(), time.perf_counter()))
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        t = _trace.get()
+        stack = conn.info.get("trace_t0")
+        if t is None or not stack:
+            return
+        wall, t0 = stack.pop()
+        attrs = {"statement": statement[:SQL_MAX]}
+        if cursor.rowcount is not None and cursor.rowcount >= 0:
+            attrs["rows"] = cursor.rowcount
+        t.add(_span(t, "sql", _parent.get(), wall, time.perf_counter() - t0, attrs))
+
+    @event.listens_for(engine, "handle_error")
+    def _error(ctx):
+        stack = ctx.connection.info.get("trace_t0") if ctx.connection is not None else None
+        t = _trace.get()
+        if t is None or not stack:
+            return
+        wall, t0 = stack.pop()
+        t.add(_span(t, "sql", _parent.get(), wall, time.perf_counter() - t0,
+                    {"statement": (ctx.statement or "")[:SQL_MAX]}, error=type(ctx.original_exception).__name__))
+
+
+# ---------- query ----------
+def recent(limit: int = 50, min_ms: float = 0.0, path: Optional[str] = None) -> list[dict]:
+    with _lock:
+        items = [s for s, _ in reversed(_buffer)]
+    items = [s for s in items if s["duration_ms"] >= min_ms and (not path or path in s["name"])]
+    return items[:limit]
+
+
+def get(trace_id: str) -> Optional[list[dict]]:
+    with _lock:
+        parts = _by_id.get(trace_id)
+        spans = [s for p in parts for s in p] if parts else None
+    if spans is not None:
+        return spans
+    # worker อื่น / trace เก่าที่หลุด ring buffer → หาใน TRACE_FILE
+    if not TRACE_FILE or not Path(TRACE_FILE).is_file():
+        return None
+    out = []
+    with open(TRACE_FILE) as f:
+        for line in f:
+            if trace_id in line:
+                try:
+                    s = json.loads(line)
+                except ValueError:
+                    continue
+                if s.get("trace_id") == trace_id:
+                    out.append(s)
+    return out or None
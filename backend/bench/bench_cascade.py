@@ -0,0 +1,91 @@
+# backend/bench/bench_cascade.py
+# เทียบ detection แบบ cascade (FACE_DET_CASCADE) กับ detect ที่ 640 อย่างเดียว บนชุดภาพตัวอย่าง
+#   - cost เฉลี่ย/p95 ต่อภาพ (รวมรอบที่ escalate)
+#   - escalation rate และสัดส่วนภาพที่จบที่แต่ละ det_size
+#   - miss rate: ภาพที่ 640 เจอหน้าแต่ cascade ไม่เจอ หรือเลือกหน้าคนละหน้ากับ 640 (IoU ของหน้าใหญ่สุด < --iou)
+#
+#   cd backend && python -m bench.bench_cascade --images /data/kiosk-samples
+#   cd backend && python -m bench.bench_cascade --images /data/kiosk-samples --configs 160 320 160,320 --min-score 0.6
+import argparse
+import time
+from pathlib import Path
+
+import numpy as np
+
+from app.face_service import DET_SIZE, FaceService
+
+from .bench_quant import IMG_EXT, iou
+from .common import save_results, summarize
+
+
+def largest(bboxes):
+    if not bboxes.shape[0]:
+        return None
+    return bboxes[int(np.argmax((bboxes[:, 2] - bboxes[:, 0]) * (bboxes[:, 3] - bboxes[:, 1])))]
+
+
+def run(svc, imgs, cascade: tuple, ref=None, th_iou: float = 0.5) -> tuple[dict, list]:
+    svc.cascade = cascade
+    svc.warmup()
+    lat, sizes, faces = [], [], []
+    for img in imgs:
+        t0 = time.perf_counter()
+        bboxes, _, size = svc.detect(img)
+        lat.append((time.perf_counter() - t0) * 1000)
+        sizes.append(size)
+        faces.append(largest(bboxes))
+    out = {**summarize(lat), "escalation_rate": round(float(np.mean([s == DET_SIZE for s in sizes])), 4),
+           "final_size": {str(s): sizes.count(s) for s in sorted(set(sizes))},
+           "faces_found": sum(f is not None for f in faces)}
+    if ref is not None:
+        miss = sum(r is not None and (f is None or iou(r, f) < th_iou) for r, f in zip(ref, faces))
+        with_face = sum(r is not None for r in ref)
+        out.update({"missed": miss, "miss_rate": round(miss / with_face, 4) if with_face else None,
+                    "false_extra": sum(r is None and f is not None for r, f in zip(ref, faces))})
+    return out, faces
+
+
+def main():
+    ap = argparse.ArgumentParser(description="cascaded low-res-first detection benchmark")
+    ap.add_argument("--images", required=True)
+    ap.add_argument("--configs", nargs="+", default=["160", "320", "160,320"],
+                    help="cascade ที่จะทดสอบ (ขนาดคั่นด้วย ,) – เทียบกับ 640 อย่างเดียวเสมอ")
+    ap.add_argument("--min-score", type=float, help="override FACE_CASCADE_MIN_SCORE")
+    ap.add_argument("--min-face", type=float, help="override FACE_CASCADE_MIN_FACE")
+    ap.add_argument("--iou", type=float, default=0.5)
+    ap.add_argument("--limit", type=int, default=1000)
+    ap.add_argument("--model-name", default="buffalo_sc")
+    ap.add_argument("--out")
+    args = ap.parse_args()
+
+    # เกณฑ์ accept อ่านจาก env ตอน import → ตั้งค่าที่ module ตรง ๆ
+    import app.face_service as fs
+    if args.min_score is not None:
+        fs.FACE_CASCADE_MIN_SCORE = args.min_score
+    if args.min_face is not None:
+        fs.FACE_CASCADE_MIN_FACE = args.min_face
+
+    import cv2
+
+    files = sorted(p for p in Path(args.images).rglob("*") if p.suffix.lower() in IMG_EXT)[:args.limit]
+    imgs = [im for im in (cv2.imread(str(p)) for p in files) if im is not None]
+    print(f"{len(imgs)} images  min_score={fs.FACE_CASCADE_MIN_SCORE} min_face={fs.FACE_CASCADE_MIN_FACE}")
+
+    svc = FaceService(cpu=True, model_name=args.model_name, cascade=())
+    base, ref = run(svc, imgs, ())
+    results = {str(DET_SIZE): base}
+    for cfg in args.configs:
+        cascade = tuple(sorted(int(x) for x in cfg.split(",")))
+        results[cfg], _ = run(svc, imgs, cascade, ref, args.iou)
+
+    print(f"\n{'cascade':<12}{'mean':>9}{'p95':>9}{'speedup':>9}{'escalate':>10}{'miss':>8}")
+    for name, r in results.items():
+        print(f"{name:<12}{r.get('mean_ms', 0):>9.1f}{r.get('p95_ms', 0):>9.1f}"
+              f"{base['mean_ms'] / r['mean_ms'] if r.get('mean_ms') else 0:>8.2f}x"
+              f"{r['escalation_rate']:>10.1%}{r.get('miss_rate') or 0:>8.1%}")
+    path = save_results("cascade", {"args": vars(args), "images": len(imgs), "results": results}, args.out)
+    print(f"saved {path}")
+
+
+if __name__ == "__main__":
+    main()
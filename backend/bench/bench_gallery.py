@@ -0,0 +1,97 @@
+# backend/bench/bench_gallery.py
+# เทียบ gallery float32 / float16 / int8 (+rerank): หน่วยความจำ, latency ต่อ probe, rank-1 agreement กับ float32
+#
+#   cd backend && python -m bench.bench_gallery --users 100000 --templates 3 --probes 200
+import argparse
+import json
+import time
+
+import numpy as np
+
+from app.gallery import Gallery, quantize_int8
+
+
+def _norm(m):
+    return m / np.linalg.norm(m, axis=-1, keepdims=True)
+
+
+def make_gallery(rng, users, templates, dim, probes):
+    ids = _norm(rng.standard_normal((users, dim)).astype(np.float32))
+    rows = np.repeat(ids, templates, 0)
+    mat = _norm(rows + 1.1 * _norm(rng.standard_normal(rows.shape).astype(np.float32)))
+    owners = np.repeat(np.arange(1, users + 1), templates)
+    who = rng.integers(0, users, probes)
+    probe = _norm(ids[who] + 1.1 * _norm(rng.standard_normal((probes, dim)).astype(np.float32)))
+    return mat, owners, probe
+
+
+def run(g: Gallery, probe, k, exact=None, rerank=0):
+    lat, top = [], []
+    for p in probe:
+        t0 = time.perf_counter()
+        hits = g.search(p, k=k, exact=exact, rerank=rerank)
+        lat.append((time.perf_counter() - t0) * 1000)
+        top.append(hits)
+    return np.asarray(lat), top
+
+
+def main():
+    ap = argparse.ArgumentParser(description="quantized gallery benchmark")
+    ap.add_argument("--users", type=int, default=20000)
+    ap.add_argument("--templates", type=int, default=3)
+    ap.add_argument("--dim", type=int, default=512)
+    ap.add_argument("--probes", type=int, default=200)
+    ap.add_argument("--k", type=int, default=5)
+    ap.add_argument("--rerank", type=int, default=10)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--json", help="เขียนผลเป็นไฟล์ JSON")
+    args = ap.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    mat, owners, probe = make_gallery(rng, args.users, args.templates, args.dim, args.probes)
+    by_user = {}
+    for i, uid in enumerate(owners):
+        by_user.setdefault(int(uid), []).append(i)
+    exact = lambda uid: mat[by_user[uid]]
+
+    results = {}
+    base_top = None
+    for mode in ("float32", "float16", "int8", "float16+rerank", "int8+rerank"):
+        dtype, _, rr = mode.partition("+")
+        t0 = time.perf_counter()
+        if dtype == "int8":
+            q, sc = quantize_int8(mat)
+            g = Gallery(q, owners, "int8", sc)
+        else:
+            g = Gallery(mat.astype(dtype), owners, dtype)
+        build_s = time.perf_counter() - t0
+        run(g, probe[:5], args.k)  # warm-up
+        lat, top = run(g, probe, args.k, exact if rr else None, args.rerank if rr else 0)
+        if base_top is None:
+            base_top = top
+        agree = np.mean([a[0][0] == b[0][0] for a, b in zip(top, base_top)])
+        err = np.mean([abs(a[0][1] - b[0][1]) for a, b in zip(top, base_top)])
+        overlap = np.mean([len({u for u, _ in a} & {u for u, _ in b}) / args.k for a, b in zip(top, base_top)])
+        results[mode] = {
+            "mb": round(g.nbytes / 1e6, 1),
+            "build_s": round(build_s, 3),
+            "p50_ms": round(float(np.percentile(lat, 50)), 3),
+            "p95_ms": round(float(np.percentile(lat, 95)), 3),
+            "rank1_agree": round(float(agree), 4),
+            f"top{args.k}_overlap": round(float(overlap), 4),
+            "top1_score_err": round(float(err), 5),
+        }
+
+    cols = list(next(iter(results.values())).keys())
+    print(f"gallery: {args.users} users x {args.templates} templates, dim={args.dim}, probes={args.probes}")
+    print(f"{'mode':<16}" + "".join(f"{c:>16}" for c in cols))
+    for mode, r in results.items():
+        print(f"{mode:<16}" + "".join(f"{r[c]:>16}" for c in cols))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
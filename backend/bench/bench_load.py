@@ -0,0 +1,223 @@
+# backend/bench/bench_load.py
+# load/latency benchmark แบบ end-to-end: รัน app จริง (uvicorn subprocess) บน SQLite ชั่วคราว
+# ด้วย StubFaceService (ไม่ต้องมีโมเดล) แล้วยิง login / clock-in / clock-out / anonymous-clock /
+# attendance-attempts พร้อมกันตาม --concurrency
+#
+#   cd backend && python -m bench.bench_load --users 200 --requests 400 --concurrency 16 --latency-ms 30
+#   cd backend && python -m bench.bench_load --compare bench/results/load-<rev>-<ts>.json
+#
+# ผลถูกเก็บเป็น JSON ใน bench/results/ (หรือ --out) เพื่อเทียบระหว่าง commit
+# หมายเหตุ: clock-out แต่ละ user ผ่านได้ครั้งเดียวต่อ clock-in → ถ้า --requests > --users ส่วนเกินจะได้ 400
+# (นับใน errors/status แยกไว้ให้ดู)
+import argparse
+import http.client
+import itertools
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import urlencode
+
+BACKEND = Path(__file__).resolve().parent.parent
+DEP_LAT, DEP_LNG = 13.7563, 100.5018
+PASSWORD = "bench-pass"
+ENDPOINTS = ("login", "clock-in", "clock-out", "anonymous-clock", "attendance-attempts")
+
+
+# ---------- seed ----------
+def seed_db(db_url: str, users: int, templates: int):
+    os.environ["DB_URL"] = db_url
+    from sqlmodel import Session
+    from app.auth import hash_pw
+    from app.deps import engine, init_db
+    from app.models import Department, User
+    from .stub_face import identity_embedding
+
+    init_db()
+    pw = hash_pw(PASSWORD)  # bcrypt ครั้งเดียว ใช้ร่วมทุก user
+    with Session(engine) as s:
+        dep = Department(name="Bench HQ", lat=DEP_LAT, lng=DEP_LNG, radius_m=500)
+        s.add(dep); s.commit(); s.refresh(dep)
+        s.add(User(email="admin@bench", name="Admin", role="admin", hashed_password=pw))
+        for i in range(1, users + 1):
+            embs = [identity_embedding(i, v + 1).tolist() for v in range(templates)]
+            s.add(User(email=f"u{i}@bench", name=f"User {i}", role="user", hashed_password=pw,
+                       embeddings_json=json.dumps(embs), department_id=dep.id))
+        s.commit()
+
+
+# ---------- server ----------
+def _free_port() -> int:
+    with socket.socket() as sk:
+        sk.bind(("127.0.0.1", 0))
+        return sk.getsockname()[1]
+
+
+def start_server(db_url: str, port: int, workers: int, latency_ms: float, jitter_ms: float):
+    env = dict(os.environ, DB_URL=db_url, STUB_FACE_LATENCY_MS=str(latency_ms),
+               STUB_FACE_JITTER_MS=str(jitter_ms), IMAGE_ARCHIVE="0",
+               ATTEMPTS_ARCHIVE_INTERVAL_S="0")  # bench ไม่เขียนรูป / archive ลง checkout
+    cmd = [sys.executable, "-m", "uvicorn", "bench.stub_app:app", "--host", "127.0.0.1",
+           "--port", str(port), "--workers", str(workers), "--log-level", "warning"]
+    proc = subprocess.Popen(cmd, cwd=BACKEND, env=env)
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            c = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+            c.request("GET", "/api/ready")  # health ตอบตั้งแต่ bind แต่ migrate / โมเดลยังไม่เสร็จ
+            if c.getresponse().status == 200:
+                return proc
+        except OSError:
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError("server did not start")
+
+
+# ---------- client ----------
+def _multipart(fields: dict, files: dict) -> tuple[bytes, str]:
+    boundary = uuid.uuid4().hex
+    out = []
+    for k, v in fields.items():
+        out.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{k}"\r\n\r\n{v}\r\n'.encode())
+    for k, (fname, data, ctype) in files.items():
+        out.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{k}"; filename="{fname}"\r\n'
+                   f'Content-Type: {ctype}\r\n\r\n'.encode() + data + b"\r\n")
+    out.append(f"--{boundary}--\r\n".encode())
+    return b"".join(out), f"multipart/form-data; boundary={boundary}"
+
+
+class Client:
+    def __init__(self, port: int):
+        self.port = port
+        self._local = threading.local()
+
+    def _conn(self):
+        c = getattr(self._local, "conn", None)
+        if c is None:
+            c = self._local.conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=120)
+        return c
+
+    def request(self, method, path, body=None, headers=None) -> tuple[int, bytes]:
+        for attempt in (0, 1):
+            c = self._conn()
+            try:
+                c.request(method, path, body=body, headers=headers or {})
+                r = c.getresponse()
+                return r.status, r.read()
+            except (http.client.HTTPException, OSError):
+                c.close(); self._local.conn = None
+                if attempt:
+                    raise
+
+    def login(self, email) -> str:
+        st, body = self.request("POST", "/api/login", urlencode({"username": email, "password": PASSWORD}),
+                                {"Content-Type": "application/x-www-form-urlencoded"})
+        assert st == 200, body
+        return json.loads(body)["access_token"]
+
+
+def build_jobs(endpoint: str, n: int, users: int, tokens: dict, admin_token: str):
+    from .stub_face import make_face_image
+
+    imgs = {}
+
+    def img(identity, variant):
+        key = (identity, variant)
+        if key not in imgs:
+            imgs[key] = make_face_image(identity, variant)
+        return imgs[key]
+
+    loc = {"lat": DEP_LAT + 0.0005, "lng": DEP_LNG, "accuracy": 20}
+    ids = itertools.cycle(range(1, users + 1))
+    jobs = []
+    for k in range(n):
+        i = next(ids)
+        if endpoint == "login":
+            jobs.append(("POST", "/api/login", urlencode({"username": f"u{i}@bench", "password": PASSWORD}),
+                         {"Content-Type": "application/x-www-form-urlencoded"}))
+        elif endpoint in ("clock-in", "clock-out"):
+            body, ctype = _multipart(loc, {"file": ("f.png", img(i, 9), "image/png")})
+            jobs.append(("POST", f"/api/attendance/{endpoint}", body,
+                         {"Content-Type": ctype, "Authorization": f"Bearer {tokens[i]}"}))
+        elif endpoint == "anonymous-clock":
+            body, ctype = _multipart({**loc, "action": "in"}, {"file": ("f.png", img(i, 9), "image/png")})
+            jobs.append(("POST", "/api/attendance/anonymous-clock", body, {"Content-Type": ctype}))
+        elif endpoint == "attendance-attempts":
+            jobs.append(("GET", "/api/admin/attendance-attempts?days=7", None,
+                         {"Authorization": f"Bearer {admin_token}"}))
+    return jobs
+
+
+def drive(client: Client, jobs, concurrency: int):
+    lat, statuses = [], {}
+    lock = threading.Lock()
+
+    def one(job):
+        t0 = time.perf_counter()
+        st, _ = client.request(*job)
+        ms = (time.perf_counter() - t0) * 1000
+        with lock:
+            lat.append(ms)
+            statuses[st] = statuses.get(st, 0) + 1
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as ex:
+        list(ex.map(one, jobs))
+    return lat, statuses, time.perf_counter() - t0
+
+
+def main():
+    from .common import compare, save_results, summarize
+
+    ap = argparse.ArgumentParser(description="end-to-end load benchmark (stub face engine)")
+    ap.add_argument("--users", type=int, default=200)
+    ap.add_argument("--templates", type=int, default=3)
+    ap.add_argument("--requests", type=int, default=200, help="จำนวน request ต่อ endpoint")
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--workers", type=int, default=1, help="uvicorn workers")
+    ap.add_argument("--latency-ms", type=float, default=30.0, help="latency ของ stub extract")
+    ap.add_argument("--jitter-ms", type=float, default=0.0)
+    ap.add_argument("--endpoints", nargs="+", default=list(ENDPOINTS), choices=ENDPOINTS)
+    ap.add_argument("--out", help="ไฟล์ผล JSON (default: bench/results/load-<rev>-<ts>.json)")
+    ap.add_argument("--compare", help="ไฟล์ผลเดิมสำหรับเทียบ")
+    args = ap.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="attendance-bench-")
+    db_url = f"sqlite:///{tmp}/bench.sqlite3"
+    seed_db(db_url, args.users, args.templates)
+    port = _free_port()
+    proc = start_server(db_url, port, args.workers, args.latency_ms, args.jitter_ms)
+    results = {}
+    try:
+        client = Client(port)
+        admin_token = client.login("admin@bench")
+        tokens = {i: client.login(f"u{i}@bench") for i in range(1, args.users + 1)}
+        # clock-out ต้องมี clock-in ก่อน → รันตามลำดับ ENDPOINTS (clock-in ก่อน clock-out)
+        for ep in [e for e in ENDPOINTS if e in args.endpoints]:
+            jobs = build_jobs(ep, args.requests, args.users, tokens, admin_token)
+            lat, statuses, wall = drive(client, jobs, args.concurrency)
+            errors = sum(v for k, v in statuses.items() if k >= 400)
+            results[ep] = {**summarize(lat, wall, errors), "status": {str(k): v for k, v in statuses.items()}}
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+
+    print(f"{'endpoint':<22}{'n':>6}{'err':>6}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}")
+    for ep, r in results.items():
+        print(f"{ep:<22}{r['n']:>6}{r['errors']:>6}{r.get('rps', 0):>9.1f}"
+              f"{r.get('p50_ms', 0):>9.1f}{r.get('p95_ms', 0):>9.1f}{r.get('p99_ms', 0):>9.1f}")
+    path = save_results("load", {"args": vars(args), "results": results}, args.out)
+    print(f"saved {path}")
+    if args.compare:
+        compare(json.loads(Path(args.compare).read_text()), json.loads(path.read_text()))
+
+
+if __name__ == "__main__":
+    main()
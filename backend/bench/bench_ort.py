@@ -0,0 +1,164 @@
+# backend/bench/bench_ort.py
+# sweep จำนวน ORT intra-op threads ต่อ worker × จำนวน worker process บนเครื่องนี้
+# แต่ละ worker สร้าง session ด้วย app.face_service.build_session (ORT_* เดียวกับ production)
+# แล้วรัน detection(640) + recognition(112) ต่อเนื่องพร้อมกันทุก worker → throughput รวม + latency ต่อ request
+#
+#   cd backend && python -m bench.bench_ort                                   # ~/.insightface/models/buffalo_sc
+#   cd backend && python -m bench.bench_ort --model-dir /app/models/buffalo_sc --workers 1 2 4 --threads 1 2 4 8
+#   cd backend && python -m bench.bench_ort --synthetic                       # ไม่มีโมเดล: conv net ขนาดใกล้เคียง
+#
+# ผลลัพธ์ที่ดีที่สุด → ตั้ง WEB_CONCURRENCY=<workers> ORT_INTRA_THREADS=<threads>
+import argparse
+import multiprocessing as mp
+import os
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from .common import save_results, summarize
+
+DEFAULT_MODEL_DIR = Path("~/.insightface/models/buffalo_sc").expanduser()
+
+
+# ---------- models ----------
+def synthetic_models(out_dir: Path) -> list[str]:
+    """conv stack ที่ FLOPs ใกล้ det_500m / w600k_mbf (ใช้เมื่อไม่มีไฟล์โมเดลจริง)"""
+    import onnx
+    from onnx import TensorProto, helper, numpy_helper
+
+    rng = np.random.default_rng(0)
+
+    def build(name, size, chans, head=None):
+        nodes, inits, prev, c_in = [], [], "input", 3
+        for i, c in enumerate(chans):
+            w = numpy_helper.from_array((rng.standard_normal((c, c_in, 3, 3)) * 0.05).astype(np.float32), f"w{i}")
+            inits.append(w)
+            nodes.append(helper.make_node("Conv", [prev, f"w{i}"], [f"c{i}"], pads=[1, 1, 1, 1],
+                                          strides=[2 if i % 2 == 0 else 1] * 2))
+            nodes.append(helper.make_node("Relu", [f"c{i}"], [f"r{i}"]))
+            prev, c_in = f"r{i}", c
+        if head:
+            nodes.append(helper.make_node("GlobalAveragePool", [prev], ["gap"]))
+            nodes.append(helper.make_node("Flatten", ["gap"], ["flat"]))
+            inits.append(numpy_helper.from_array((rng.standard_normal((c_in, head)) * 0.05).astype(np.float32), "fc"))
+            nodes.append(helper.make_node("MatMul", ["flat", "fc"], ["output"]))
+            out = helper.make_tensor_value_info("output", TensorProto.FLOAT, None)
+        else:
+            nodes.append(helper.make_node("Identity", [prev], ["output"]))
+            out = helper.make_tensor_value_info("output", TensorProto.FLOAT, None)
+        inp = helper.make_tensor_value_info("input", TensorProto.FLOAT, [1, 3, size, size])
+        model = helper.make_model(helper.make_graph(nodes, name, [inp], [out], inits),
+                                  opset_imports=[helper.make_opsetid("", 13)])
+        model.ir_version = 8
+        path = out_dir / f"{name}.onnx"
+        onnx.save(model, str(path))
+        return str(path)
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    return [build("synthetic_det", 640, [16, 16, 32, 32, 64, 64]),
+            build("synthetic_rec", 112, [64, 64, 128, 128, 256, 256, 512], head=512)]
+
+
+def _feed(sess) -> dict:
+    i = sess.get_inputs()[0]
+    shape = [d if isinstance(d, int) else 1 for d in i.shape]
+    return {i.name: np.random.default_rng(0).standard_normal(shape).astype(np.float32)}
+
+
+# ---------- worker ----------
+def _worker(models, intra, concurrency, duration, barrier, q):
+    import threading
+
+    from app.face_service import build_session
+
+    sessions = [build_session(m, ["CPUExecutionProvider"], intra=intra) for m in models]
+    feeds = [_feed(s) for s in sessions]
+    for s, f in zip(sessions, feeds):
+        s.run(None, f)  # warmup
+    lat = []
+    lock = threading.Lock()
+    barrier.wait()
+    deadline = time.perf_counter() + duration
+
+    def loop():
+        mine = []
+        while time.perf_counter() < deadline:
+            t0 = time.perf_counter()
+            for s, f in zip(sessions, feeds):
+                s.run(None, f)
+            mine.append((time.perf_counter() - t0) * 1000)
+        with lock:
+            lat.extend(mine)
+
+    ts = [threading.Thread(target=loop) for _ in range(concurrency)]
+    for t in ts:
+        t.start()
+    for t in ts:
+        t.join()
+    q.put(lat)
+
+
+def run_combo(models, workers: int, intra: int, concurrency: int, duration: float) -> dict:
+    ctx = mp.get_context("spawn")
+    barrier, q = ctx.Barrier(workers + 1), ctx.Queue()
+    procs = [ctx.Process(target=_worker, args=(models, intra, concurrency, duration, barrier, q))
+             for _ in range(workers)]
+    for p in procs:
+        p.start()
+    barrier.wait()
+    t0 = time.perf_counter()
+    lat = []
+    for _ in procs:
+        lat.extend(q.get())
+    wall = time.perf_counter() - t0
+    for p in procs:
+        p.join()
+    return summarize(lat, wall)
+
+
+def main():
+    cores = os.cpu_count() or 1
+    pow2 = [n for n in (1, 2, 4, 8, 16, 32, 64) if n <= cores]
+    ap = argparse.ArgumentParser(description="ORT threads-per-worker x workers sweep")
+    ap.add_argument("--model-dir", default=str(DEFAULT_MODEL_DIR))
+    ap.add_argument("--synthetic", action="store_true", help="ใช้ conv net สังเคราะห์แทนโมเดลจริง")
+    ap.add_argument("--workers", type=int, nargs="+", default=pow2)
+    ap.add_argument("--threads", type=int, nargs="+", default=pow2)
+    ap.add_argument("--concurrency", type=int, default=1, help="request พร้อมกันต่อ worker")
+    ap.add_argument("--duration", type=float, default=5.0, help="วินาทีต่อ combination")
+    ap.add_argument("--max-oversub", type=float, default=2.0, help="ข้าม combination ที่ workers*threads > cores*ค่านี้")
+    ap.add_argument("--p95-budget-ms", type=float, help="เลือก best จาก combination ที่ p95 ไม่เกินค่านี้")
+    ap.add_argument("--out")
+    args = ap.parse_args()
+
+    if args.synthetic:
+        models = synthetic_models(Path(tempfile.mkdtemp(prefix="attendance-ort-")))
+    else:
+        models = sorted(str(p) for p in Path(args.model_dir).glob("*.onnx"))
+        if not models:
+            ap.error(f"no .onnx in {args.model_dir} (use --synthetic)")
+    print(f"cores={cores} models={[Path(m).name for m in models]}")
+    print(f"{'workers':>8}{'threads':>8}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}")
+    results = []
+    for w in args.workers:
+        for t in args.threads:
+            if w * t > cores * args.max_oversub:
+                continue
+            r = {"workers": w, "threads": t, **run_combo(models, w, t, args.concurrency, args.duration)}
+            results.append(r)
+            print(f"{w:>8}{t:>8}{r['rps']:>9.1f}{r['p50_ms']:>9.1f}{r['p95_ms']:>9.1f}{r['p99_ms']:>9.1f}", flush=True)
+
+    ok = [r for r in results if args.p95_budget_ms is None or r["p95_ms"] <= args.p95_budget_ms]
+    best = max(ok, key=lambda r: r["rps"]) if ok else None
+    if best:
+        print(f"best: WEB_CONCURRENCY={best['workers']} ORT_INTRA_THREADS={best['threads']} "
+              f"({best['rps']:.1f} rps, p95 {best['p95_ms']:.1f}ms)")
+    path = save_results("ort", {"args": vars(args), "cores": cores, "models": models,
+                                "results": results, "best": best}, args.out)
+    print(f"saved {path}")
+
+
+if __name__ == "__main__":
+    main()
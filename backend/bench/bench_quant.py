@@ -0,0 +1,142 @@
+# backend/bench/bench_quant.py
+# เทียบ FaceService โหมด fp32 กับ int8-dynamic / int8-static (จาก scripts/quantize_models.py) บนภาพชุดเดียวกัน
+#   - latency ของ detect / embed / รวม
+#   - detection agreement (เจอหน้าตรงกัน + IoU ของ bbox) และ cosine ระหว่าง embedding fp32 กับ int8 ของภาพเดียวกัน
+#   - การตัดสิน verification ที่ threshold (default 0.35 เท่ากับ main.py): คู่ภาพที่ผลเปลี่ยนเมื่อใช้ int8
+#     ถ้าภาพอยู่ในโฟลเดอร์ย่อยตามคน (<images>/<person>/*.jpg) จะรายงาน TAR/FAR ของแต่ละโหมดด้วย
+#
+#   cd backend && python -m bench.bench_quant --images /data/eval-faces
+#   cd backend && python -m bench.bench_quant --images /data/eval-faces --variants fp32 int8-static --th 0.35
+import argparse
+import time
+from pathlib import Path
+
+import numpy as np
+
+from app.face_service import VARIANTS, FaceService
+
+from .common import save_results, summarize
+
+IMG_EXT = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+
+def run_variant(svc, imgs: list) -> dict:
+    from insightface.app.common import Face
+
+    det_ms, emb_ms, embs, boxes = [], [], [], []
+    for img in imgs:
+        t0 = time.perf_counter()
+        bboxes, kpss = svc.det.detect(img, max_num=0, metric="default")
+        t1 = time.perf_counter()
+        det_ms.append((t1 - t0) * 1000)
+        if bboxes.shape[0] == 0:
+            embs.append(None); boxes.append(None)
+            continue
+        i = int(np.argmax((bboxes[:, 2] - bboxes[:, 0]) * (bboxes[:, 3] - bboxes[:, 1])))
+        f = Face(bbox=bboxes[i, 0:4], kps=kpss[i] if kpss is not None else None, det_score=bboxes[i, 4])
+        svc.rec.get(img, f)
+        emb_ms.append((time.perf_counter() - t1) * 1000)
+        embs.append(f.normed_embedding); boxes.append(f.bbox)
+    return {"detect": summarize(det_ms), "embed": summarize(emb_ms),
+            "total_p50_ms": round(float(np.percentile(det_ms, 50)) + (float(np.percentile(emb_ms, 50)) if emb_ms else 0), 3),
+            "embs": embs, "boxes": boxes}
+
+
+def iou(a, b) -> float:
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0.0, x2 - x1) * max(0.0, y2 - y1)
+    area = lambda r: (r[2] - r[0]) * (r[3] - r[1])
+    return float(inter / (area(a) + area(b) - inter + 1e-9))
+
+
+def pairs(n: int, max_pairs: int, rng) -> tuple[np.ndarray, np.ndarray]:
+    i, j = np.triu_indices(n, 1)
+    if len(i) > max_pairs:
+        k = rng.choice(len(i), max_pairs, replace=False)
+        i, j = i[k], j[k]
+    return i, j
+
+
+def compare(base: dict, other: dict, labels: list, th: float, max_pairs: int, seed: int = 0) -> dict:
+    both = [k for k, (a, b) in enumerate(zip(base["embs"], other["embs"])) if a is not None and b is not None]
+    found_base = sum(e is not None for e in base["embs"])
+    found_other = sum(e is not None for e in other["embs"])
+    out = {"faces_found": found_other, "faces_found_fp32": found_base,
+           "detect_disagree": sum((a is None) != (b is None) for a, b in zip(base["embs"], other["embs"]))}
+    if not both:
+        return out
+    A = np.stack([base["embs"][k] for k in both]); B = np.stack([other["embs"][k] for k in both])
+    cos = np.sum(A * B, axis=1)
+    ious = [iou(base["boxes"][k], other["boxes"][k]) for k in both]
+    out.update({"cos_mean": round(float(cos.mean()), 5), "cos_p5": round(float(np.percentile(cos, 5)), 5),
+                "cos_min": round(float(cos.min()), 5), "bbox_iou_mean": round(float(np.mean(ious)), 4)})
+    i, j = pairs(len(both), max_pairs, np.random.default_rng(seed))
+    sa, sb = np.sum(A[i] * A[j], axis=1), np.sum(B[i] * B[j], axis=1)
+    da, db = sa >= th, sb >= th
+    out.update({"pairs": int(len(i)), "decision_agree": round(float(np.mean(da == db)), 5),
+                "flips_accept_to_reject": int(np.sum(da & ~db)), "flips_reject_to_accept": int(np.sum(~da & db)),
+                "score_abs_err_mean": round(float(np.mean(np.abs(sa - sb))), 5)})
+    lab = np.array([labels[k] for k in both])
+    if len(set(lab)) > 1:
+        same = lab[i] == lab[j]
+        for name, d in (("fp32", da), ("variant", db)):
+            out[f"tar_{name}"] = round(float(d[same].mean()), 4) if same.any() else None
+            out[f"far_{name}"] = round(float(d[~same].mean()), 5) if (~same).any() else None
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser(description="fp32 vs int8 FaceService accuracy/latency comparison")
+    ap.add_argument("--images", required=True, help="โฟลเดอร์ภาพ (โฟลเดอร์ย่อย = คน ถ้ามี)")
+    ap.add_argument("--variants", nargs="+", default=list(VARIANTS), choices=VARIANTS)
+    ap.add_argument("--model-name", default="buffalo_sc")
+    ap.add_argument("--limit", type=int, default=500)
+    ap.add_argument("--th", type=float, default=0.35)
+    ap.add_argument("--max-pairs", type=int, default=50_000)
+    ap.add_argument("--out")
+    args = ap.parse_args()
+
+    import cv2
+
+    root = Path(args.images)
+    files = sorted(p for p in root.rglob("*") if p.suffix.lower() in IMG_EXT)[:args.limit]
+    imgs, labels = [], []
+    for p in files:
+        img = cv2.imread(str(p))
+        if img is not None:
+            imgs.append(img)
+            labels.append(p.parent.name if p.parent != root else p.stem)
+    print(f"{len(imgs)} images, {len(set(labels))} labels")
+
+    variants = ["fp32"] + [v for v in args.variants if v != "fp32"]
+    runs = {}
+    for v in variants:
+        try:
+            svc = FaceService(cpu=True, model_name=args.model_name, variant=v)
+        except FileNotFoundError as e:
+            print(f"{v}: skipped ({e})")
+            continue
+        svc.warmup()
+        runs[v] = run_variant(svc, imgs)
+        print(f"{v:<14}detect p50={runs[v]['detect'].get('p50_ms', 0):.1f}ms  "
+              f"embed p50={runs[v]['embed'].get('p50_ms', 0):.1f}ms", flush=True)
+
+    results = {}
+    for v, r in runs.items():
+        results[v] = {"detect": r["detect"], "embed": r["embed"], "total_p50_ms": r["total_p50_ms"]}
+        if v != "fp32":
+            results[v]["vs_fp32"] = compare(runs["fp32"], r, labels, args.th, args.max_pairs)
+
+    print(f"\n{'variant':<14}{'det p50':>9}{'emb p50':>9}{'cos mean':>10}{'cos p5':>9}{'agree@th':>10}{'flips':>7}")
+    for v, r in results.items():
+        c = r.get("vs_fp32", {})
+        print(f"{v:<14}{r['detect'].get('p50_ms', 0):>9.1f}{r['embed'].get('p50_ms', 0):>9.1f}"
+              f"{c.get('cos_mean', 1.0):>10.4f}{c.get('cos_p5', 1.0):>9.4f}{c.get('decision_agree', 1.0):>10.4f}"
+              f"{c.get('flips_accept_to_reject', 0) + c.get('flips_reject_to_accept', 0):>7}")
+    path = save_results("quant", {"args": vars(args), "images": len(imgs), "results": results}, args.out)
+    print(f"saved {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+# backend/bench/bench_queries.py
+# จับเวลา query ที่ถูกเรียกบ่อย (last_attendance, list_attempts, user lookup, gallery version)
+# บนข้อมูลสังเคราะห์หลายขนาด (จำนวนแถว attendance) – ใช้ยืนยันผลของ index/schema ก่อน rollout
+#
+#   cd backend && python -m bench.bench_queries --scales 100000 1000000 10000000 --workdir /tmp/attendance-bench
+#
+# DB ของแต่ละ scale ถูกเก็บไว้ใน --workdir และใช้ซ้ำได้ (ลบไฟล์เพื่อสร้างใหม่)
+import argparse
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+from sqlalchemy import create_engine, text
+from sqlmodel import Session, select
+
+from app.gallery import current_version
+from app.models import Attendance, AttendanceAttempt, Department, User
+
+from .common import save_results, summarize
+from .gen_dataset import generate, users_for_rows
+
+
+def queries(s: Session, rng, n_users: int, first_uid: int, n_deps: int, first_dep: int):
+    # เหมือน statement ใน app/main.py
+    def last_attendance():
+        uid = int(rng.integers(first_uid, first_uid + n_users))
+        return s.exec(select(Attendance).where(Attendance.user_id == uid)
+                      .order_by(Attendance.ts.desc())).first()
+
+    def _attempts(days, success=None, email=None):
+        since = datetime.utcnow() - timedelta(days=days)
+        q = select(AttendanceAttempt).where(AttendanceAttempt.ts >= since).order_by(AttendanceAttempt.ts.desc())
+        if success is not None:
+            q = q.where(AttendanceAttempt.success == success)
+        if email:
+            q = q.where(AttendanceAttempt.email == email)
+        return s.exec(q).all()
+
+    def rand_email():
+        return f"user{int(rng.integers(first_uid, first_uid + n_users))}@synthetic"
+
+    return {
+        "last_attendance": last_attendance,
+        "list_attempts(7d)": lambda: _attempts(7),
+        "list_attempts(30d,failed)": lambda: _attempts(30, success=False),
+        "list_attempts(90d,email)": lambda: _attempts(90, email=rand_email()),
+        "user_by_email": lambda: s.exec(select(User).where(User.email == rand_email())).first(),
+        "department_get": lambda: s.get(Department, int(rng.integers(first_dep, first_dep + n_deps))),
+        "gallery_version": lambda: current_version(s),
+    }
+
+
+def explain(eng, sql_by_name: dict):
+    with eng.connect() as conn:
+        for name, sql in sql_by_name.items():
+            plan = " | ".join(r[-1] for r in conn.execute(text("EXPLAIN QUERY PLAN " + sql)))
+            print(f"    {name:<28}{plan}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="hot query benchmark over synthetic histories")
+    ap.add_argument("--scales", type=int, nargs="+", default=[100_000, 1_000_000])
+    ap.add_argument("--workdir", default="/tmp/attendance-bench")
+    ap.add_argument("--iterations", type=int, default=50)
+    ap.add_argument("--departments", type=int, default=20)
+    ap.add_argument("--embeddings", type=int, default=2)
+    ap.add_argument("--dim", type=int, default=512)
+    ap.add_argument("--years", type=float, default=2.0)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out")
+    args = ap.parse_args()
+
+    wd = Path(args.workdir); wd.mkdir(parents=True, exist_ok=True)
+    results = {}
+    for scale in args.scales:
+        db = wd / f"scale-{scale}.sqlite3"
+        url = f"sqlite:///{db}"
+        if not db.exists():
+            users = users_for_rows(scale, args.years, 0.9)
+            print(f"[{scale:,}] generating {users} users ...")
+            generate(url, args.departments, users, args.embeddings, args.years, dim=args.dim,
+                     seed=args.seed, verbose=False)
+        eng = create_engine(url)
+        with Session(eng) as s:
+            n_users = s.exec(text("SELECT COUNT(*) FROM user")).one()[0]
+            first_uid = s.exec(text("SELECT MIN(id) FROM user")).one()[0]
+            n_deps = s.exec(text("SELECT COUNT(*) FROM department")).one()[0]
+            first_dep = s.exec(text("SELECT MIN(id) FROM department")).one()[0]
+            rows = {t: s.exec(text(f"SELECT COUNT(*) FROM {t}")).one()[0] for t in ("attendance", "attendanceattempt")}
+            print(f"[{scale:,}] users={n_users:,} attendance={rows['attendance']:,} attempts={rows['attendanceattempt']:,}")
+            rng = np.random.default_rng(args.seed)
+            res = {}
+            for name, fn in queries(s, rng, n_users, first_uid, n_deps, first_dep).items():
+                fn()  # warm cache
+                lat, n_rows = [], 0
+                for _ in range(args.iterations):
+                    t0 = time.perf_counter()
+                    r = fn()
+                    lat.append((time.perf_counter() - t0) * 1000)
+                    n_rows = len(r) if isinstance(r, list) else 1
+                    s.expunge_all()
+                res[name] = {**summarize(lat), "rows": n_rows}
+                print(f"    {name:<28}p50={res[name]['p50_ms']:>9.2f}ms  p95={res[name]['p95_ms']:>9.2f}ms  rows={n_rows}")
+        print("  query plans:")
+        explain(eng, {
+            "last_attendance": "SELECT * FROM attendance WHERE user_id = 1 ORDER BY ts DESC LIMIT 1",
+            "list_attempts(7d)": "SELECT * FROM attendanceattempt WHERE ts >= '2000-01-01' ORDER BY ts DESC",
+            "list_attempts(90d,email)": "SELECT * FROM attendanceattempt WHERE ts >= '2000-01-01' "
+                                        "AND email = 'x' ORDER BY ts DESC",
+        })
+        eng.dispose()
+        results[str(scale)] = {"tables": rows, "users": n_users, "queries": res}
+
+    path = save_results("queries", {"args": vars(args), "results": results}, args.out)
+    print(f"saved {path}")
+
+
+if __name__ == "__main__":
+    main()
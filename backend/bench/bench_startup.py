@@ -0,0 +1,150 @@
+# backend/bench/bench_startup.py
+# วัด cold start ของ worker: เวลา import app.main, เวลาที่ /api/health (liveness) ตอบครั้งแรก,
+# เวลาที่ /api/ready เป็น 200 (migrate + โหลดโมเดล + warmup เสร็จ) และ latency ของ inference ครั้งแรก/ครั้งถัดไป
+#
+#   cd backend && python -m bench.bench_startup --runs 3                  # โมเดลจริง (ต้องมี buffalo_sc)
+#   cd backend && python -m bench.bench_startup --stub --stub-load-ms 3000  # ไม่มีโมเดล: StubFaceService
+#
+# แต่ละ run ใช้ process ใหม่ (cold) บน SQLite ชั่วคราว
+import argparse
+import http.client
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from .bench_load import BACKEND, Client, _free_port, _multipart, seed_db
+from .common import save_results
+
+HEAVY = ("numpy", "cv2", "onnxruntime", "insightface", "sqlmodel", "fastapi")
+
+
+def import_time(module: str, env: dict) -> float:
+    code = f"import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+    out = subprocess.run([sys.executable, "-c", code], cwd=BACKEND, env=env, capture_output=True, text=True)
+    if out.returncode:
+        return float("nan")
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def _get(port: int, path: str) -> tuple[int, bytes]:
+    c = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+    try:
+        c.request("GET", path)
+        r = c.getresponse()
+        return r.status, r.read()
+    finally:
+        c.close()
+
+
+def _wait(port: int, path: str, t0: float, timeout: float, poll: float = 0.01):
+    while time.perf_counter() - t0 < timeout:
+        try:
+            st, body = _get(port, path)
+            if st == 200:
+                return time.perf_counter() - t0, body
+            if st == 503 and path == "/api/ready" and json.loads(body).get("error"):
+                return None, body  # startup ล้มเหลว (เช่นโหลดโมเดลไม่ได้) ไม่ต้องรอจน timeout
+        except OSError:
+            pass
+        time.sleep(poll)
+    return None, None
+
+
+def one_run(args, env: dict, image: bytes, seed: Path) -> dict:
+    # seed_db ผูก engine ของ process นี้กับ DB แรก → seed ครั้งเดียวแล้ว copy ไฟล์ให้แต่ละ run
+    tmp = Path(tempfile.mkdtemp(prefix="attendance-startup-"))
+    shutil.copy(seed, tmp / "bench.sqlite3")
+    db_url = f"sqlite:///{tmp}/bench.sqlite3"
+    port = _free_port()
+    target = "bench.stub_app:app" if args.stub else "app.main:app"
+    cmd = [sys.executable, "-m", "uvicorn", target, "--host", "127.0.0.1", "--port", str(port),
+           "--log-level", "warning"]
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(cmd, cwd=BACKEND, env=dict(env, DB_URL=db_url))
+    try:
+        health_s, _ = _wait(port, "/api/health", t0, args.timeout)
+        ready_s, body = _wait(port, "/api/ready", t0, args.timeout)
+        res = {"health_s": health_s, "ready_s": ready_s}
+        if ready_s is None:
+            try:
+                res["ready_body"] = _get(port, "/api/ready")[1].decode()
+            except OSError:
+                pass
+            return res
+        res["startup"] = json.loads(body)
+        c = Client(port)
+        token = c.login("admin@bench")
+        lat = []
+        for _ in range(1 + args.inferences):
+            b, ct = _multipart({}, {"file": ("f.png", image, "image/png")})
+            t = time.perf_counter()
+            st, _ = c.request("POST", "/api/admin/recognize", b,
+                              {"Content-Type": ct, "Authorization": f"Bearer {token}"})
+            lat.append((time.perf_counter() - t) * 1000)
+            res["infer_status"] = st
+        res["first_infer_ms"] = round(lat[0], 2)
+        res["steady_infer_ms"] = round(statistics.median(lat[1:]), 2) if len(lat) > 1 else None
+        return res
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="cold start benchmark (import / liveness / readiness / first inference)")
+    ap.add_argument("--runs", type=int, default=3)
+    ap.add_argument("--inferences", type=int, default=5, help="จำนวน inference หลังครั้งแรก (steady)")
+    ap.add_argument("--image", help="ภาพทดสอบ (default: ภาพสังเคราะห์)")
+    ap.add_argument("--stub", action="store_true", help="ใช้ StubFaceService แทนโมเดลจริง")
+    ap.add_argument("--stub-load-ms", type=float, default=2000.0)
+    ap.add_argument("--stub-latency-ms", type=float, default=30.0)
+    ap.add_argument("--timeout", type=float, default=180.0)
+    ap.add_argument("--out")
+    args = ap.parse_args()
+
+    from .stub_face import make_face_image
+
+    image = Path(args.image).read_bytes() if args.image else make_face_image(1, 9, size=256)
+    env = dict(os.environ, METRICS_DIR=tempfile.mkdtemp(prefix="attendance-metrics-"), IMAGE_ARCHIVE="0",
+               ATTEMPTS_ARCHIVE_INTERVAL_S="0")
+    if args.stub:
+        env.update(STUB_FACE_LOAD_MS=str(args.stub_load_ms), STUB_FACE_LATENCY_MS=str(args.stub_latency_ms))
+
+    imp_env = dict(env, DB_URL=f"sqlite:///{tempfile.mkdtemp()}/imp.sqlite3")
+    imports = {m: round(statistics.median(import_time(m, imp_env) for _ in range(args.runs)), 3)
+               for m in ("app.main",) + HEAVY}
+    print("import (median of cold processes):")
+    for m, v in imports.items():
+        print(f"  {m:<14}{v:>8.3f}s")
+
+    seed = Path(tempfile.mkdtemp(prefix="attendance-startup-")) / "seed.sqlite3"
+    seed_db(f"sqlite:///{seed}", 1, 1)
+    runs = []
+    for i in range(args.runs):
+        r = one_run(args, env, image, seed)
+        runs.append(r)
+        print(f"run {i + 1}: health={r['health_s'] or float('nan'):.3f}s  ready={r['ready_s'] or float('nan'):.3f}s  "
+              f"first_infer={r.get('first_infer_ms', float('nan'))}ms  steady={r.get('steady_infer_ms')}ms  "
+              f"status={r.get('infer_status')}")
+        if r["ready_s"] is None:
+            print(f"  not ready: {r.get('ready_body')}")
+
+    def med(key):
+        vals = [r[key] for r in runs if r.get(key) is not None]
+        return round(statistics.median(vals), 3) if vals else None
+
+    summary = {k: med(k) for k in ("health_s", "ready_s", "first_infer_ms", "steady_infer_ms")}
+    print("median:", json.dumps(summary))
+    path = save_results("startup", {"args": vars(args), "imports_s": imports, "runs": runs, "summary": summary},
+                        args.out)
+    print(f"saved {path}")
+
+
+if __name__ == "__main__":
+    main()
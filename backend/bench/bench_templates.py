@@ -0,0 +1,128 @@
+# backend/bench/bench_templates.py
+# รายงานผลของ enroll_policy บน gallery สังเคราะห์: ขนาด gallery, เวลา match และความแม่นบน probe ที่กันไว้
+#
+#   cd backend && python -m bench.bench_templates --users 2000 --sessions 8 --per-session 4
+#
+# จำลองผู้ใช้ที่ถูก re-enroll ซ้ำ: แต่ละ "session" (แสง/มุมกล้อง) ให้ภาพเกือบซ้ำกันหลายใบ
+# probe มาจาก session ใหม่ที่ไม่อยู่ใน gallery
+import argparse
+import json
+import time
+
+import numpy as np
+
+from app.enroll_policy import EnrollPolicy
+
+
+def _norm(m):
+    return m / np.linalg.norm(m, axis=-1, keepdims=True)
+
+
+def _jitter(rng, base, spread):
+    # spread = ขนาด noise เทียบกับ base (cos ~ 1/sqrt(1+spread^2) ใน dim สูง)
+    noise = rng.standard_normal(base.shape).astype(np.float32)
+    noise = _norm(noise) * np.asarray(spread, dtype=np.float32)[..., None]
+    return _norm(base + noise)
+
+
+def make_dataset(rng, users, sessions, per_session, probes, dim, spread=(1.0, 1.8)):
+    ids = _norm(rng.standard_normal((users, dim)).astype(np.float32))
+    gallery = []
+    for u in range(users):
+        sess = _jitter(rng, np.repeat(ids[u:u + 1], sessions, 0), rng.uniform(*spread, sessions))
+        shots = _jitter(rng, np.repeat(sess, per_session, 0), np.full(sessions * per_session, 0.25))
+        gallery.append(shots)
+    probe_sess = _jitter(rng, np.repeat(ids, probes, 0), rng.uniform(*spread, users * probes))
+    probe = _jitter(rng, probe_sess, np.full(users * probes, 0.25))
+    owners = np.repeat(np.arange(users), probes)
+    return gallery, probe, owners
+
+
+def evaluate(templates, probe, owners, th, scan_probes):
+    users = len(templates)
+    sizes = np.array([len(t) for t in templates])
+    G = np.vstack(templates).astype(np.float32)
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+
+    # per-user max(dot) แบบเดียวกับ best_match_user / clock_in (เก็บเป็น np array แล้ว ไม่นับ json.loads)
+    per_user = [np.asarray(t, dtype=np.float32) for t in templates]
+    t0 = time.perf_counter()
+    for p in probe[:scan_probes]:
+        best = -1.0
+        for t in per_user:
+            sc = max(float(np.dot(p, x)) for x in t)
+            if sc > best:
+                best = sc
+    scan_ms = (time.perf_counter() - t0) * 1000 / scan_probes
+
+    t0 = time.perf_counter()
+    S = probe @ G.T                                    # (P, templates)
+    per_user_max = np.maximum.reduceat(S, starts, axis=1)   # (P, users)
+    matmul_ms = (time.perf_counter() - t0) * 1000 / len(probe)
+
+    genuine = per_user_max[np.arange(len(probe)), owners]
+    impostor_ids = (owners + 1 + np.arange(len(probe)) % (users - 1)) % users
+    impostor = per_user_max[np.arange(len(probe)), impostor_ids]
+    rank1 = np.argmax(per_user_max, axis=1) == owners
+    return {
+        "templates": int(sizes.sum()),
+        "templates_per_user": round(float(sizes.mean()), 2),
+        "json_mb": round(sum(len(json.dumps(t.tolist())) for t in per_user) / 1e6, 2),
+        "float32_mb": round(G.nbytes / 1e6, 2),
+        "scan_ms_per_probe": round(scan_ms, 2),
+        "matmul_ms_per_probe": round(matmul_ms, 4),
+        "tar": round(float(np.mean(genuine >= th)), 4),
+        "far": round(float(np.mean(impostor >= th)), 5),
+        "rank1": round(float(np.mean(rank1)), 4),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description="enrollment policy report")
+    ap.add_argument("--users", type=int, default=1000)
+    ap.add_argument("--sessions", type=int, default=8)
+    ap.add_argument("--per-session", type=int, default=4)
+    ap.add_argument("--probes", type=int, default=2)
+    ap.add_argument("--dim", type=int, default=512)
+    ap.add_argument("--th", type=float, default=0.35)
+    ap.add_argument("--spread", type=float, nargs=2, default=(1.0, 1.8),
+                    help="ช่วง noise ต่อ session (มาก = ยากขึ้น)")
+    ap.add_argument("--scan-probes", type=int, default=20, help="จำนวน probe ที่จับเวลา loop แบบเดิม")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--json", help="เขียนผลเป็นไฟล์ JSON")
+    args = ap.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    gallery, probe, owners = make_dataset(rng, args.users, args.sessions, args.per_session,
+                                          args.probes, args.dim, args.spread)
+    policies = {
+        "none": None,
+        "dedupe": EnrollPolicy(max_templates=0, centroids=0),
+        "dedupe+cap8": EnrollPolicy(max_templates=8, centroids=0),
+        "dedupe+cap4": EnrollPolicy(max_templates=4, centroids=0),
+        "k3+outliers+cap8": EnrollPolicy(max_templates=8, centroids=3),
+    }
+    rows = {}
+    for name, pol in policies.items():
+        t0 = time.perf_counter()
+        templates = gallery if pol is None else [np.asarray(pol.apply(g.tolist()).templates, np.float32) for g in gallery]
+        apply_s = time.perf_counter() - t0
+        rows[name] = evaluate(templates, probe, owners, args.th, min(args.scan_probes, len(probe)))
+        rows[name]["policy_s"] = round(apply_s, 2)
+
+    base = rows["none"]
+    cols = ["templates_per_user", "float32_mb", "json_mb", "scan_ms_per_probe",
+            "matmul_ms_per_probe", "tar", "far", "rank1", "policy_s"]
+    w = {c: max(len(c), 8) + 2 for c in cols}
+    print(f"{'policy':<18}" + "".join(f"{c:>{w[c]}}" for c in cols) + f"{'speedup':>10}")
+    for name, r in rows.items():
+        speed = base["scan_ms_per_probe"] / max(r["scan_ms_per_probe"], 1e-9)
+        print(f"{name:<18}" + "".join(f"{r[c]:>{w[c]}}" for c in cols) + f"{speed:>9.1f}x")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "results": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+# backend/bench/common.py
+# helper ที่ benchmark หลายตัวใช้ร่วมกัน: percentiles, git rev, บันทึก/เทียบผล JSON
+import json
+import os
+import platform
+import subprocess
+import time
+from pathlib import Path
+
+import numpy as np
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+
+def summarize(lat_ms, wall_s=None, errors=0) -> dict:
+    a = np.asarray(lat_ms, dtype=np.float64)
+    out = {"n": int(a.size), "errors": int(errors)}
+    if a.size:
+        out.update({
+            "mean_ms": round(float(a.mean()), 3),
+            "p50_ms": round(float(np.percentile(a, 50)), 3),
+            "p95_ms": round(float(np.percentile(a, 95)), 3),
+            "p99_ms": round(float(np.percentile(a, 99)), 3),
+            "max_ms": round(float(a.max()), 3),
+        })
+    if wall_s:
+        out["rps"] = round(a.size / wall_s, 2)
+    return out
+
+
+def git_rev() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       cwd=Path(__file__).parent, text=True).strip()
+    except Exception:
+        return "unknown"
+
+
+def save_results(name: str, payload: dict, out: str | None = None) -> Path:
+    rev = git_rev()
+    payload = {"bench": name, "git": rev, "ts": time.strftime("%Y-%m-%dT%H:%M:%S"),
+               "host": {"python": platform.python_version(), "cpus": os.cpu_count(),
+                        "machine": platform.machine()}, **payload}
+    path = Path(out) if out else RESULTS_DIR / f"{name}-{rev}-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(payload, indent=2))
+    return path
+
+
+def compare(old: dict, new: dict, key: str = "p95_ms"):
+    """พิมพ์ส่วนต่างของ endpoint ที่มีในทั้งสองไฟล์ (ค่าบวก = ช้าลง)"""
+    print(f"\ncompare {key}: {old.get('git')} -> {new.get('git')}")
+    for ep, r in new.get("results", {}).items():
+        o = old.get("results", {}).get(ep)
+        if not o or key not in o or key not in r:
+            continue
+        d = (r[key] - o[key]) / o[key] * 100 if o[key] else 0.0
+        print(f"  {ep:<24}{o[key]:>10.2f}{r[key]:>10.2f}  {d:+6.1f}%")
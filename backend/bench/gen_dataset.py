@@ -0,0 +1,204 @@
+# backend/bench/gen_dataset.py
+# สร้างข้อมูลสังเคราะห์ขนาดใหญ่ลง DB (Department / User / Attendance / AttendanceAttempt)
+# ใช้ทดสอบ index/schema ก่อน rollout – อย่าชี้ DB_URL ไปที่ DB จริง
+#
+#   cd backend && python -m bench.gen_dataset --db sqlite:////tmp/big.sqlite3 --attendance-rows 1000000
+#
+# รูปแบบข้อมูล:
+#   - user กระจายไปตาม department แบบ zipf (แผนกใหญ่/เล็ก)
+#   - วันทำงาน จ.-ศ. ย้อนหลัง --years ปี, มาทำงาน --presence ของวัน
+#   - เข้า ~08:00 ± 30 นาที, ออก ~17:30 ± 45 นาที (เวลาไทย) → slot ตาม derive_slot
+#   - attempt สำเร็จ 1 แถวต่อ attendance + attempt ล้มเหลวตาม --failure-rate พร้อม reason จริงของระบบ
+import argparse
+import json
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+from sqlalchemy import create_engine, event, func, select
+from sqlmodel import SQLModel
+
+from app.models import Attendance, AttendanceAttempt, Department, User
+
+EPOCH = datetime(1970, 1, 1)
+CHUNK = 50_000
+
+FAIL_REASONS = [
+    ("face not found", 0.35),
+    ("face mismatch", 0.25),
+    ("Location accuracy too low", 0.15),
+    ("Out of permitted area", 0.15),
+    ("not clocked in yet", 0.05),
+    ("No department assigned", 0.05),
+]
+
+
+def slots_for_hours(h: np.ndarray) -> np.ndarray:
+    # เหมือน derive_slot ใน app/clock.py (ชั่วโมงเวลาไทย)
+    return np.select([h < 10, h < 13, h < 17], ["morning", "noon", "afternoon"], "evening")
+
+
+def workdays(years: float, end: datetime) -> np.ndarray:
+    start = end - timedelta(days=int(365 * years))
+    days = np.arange(np.datetime64(start.date()), np.datetime64(end.date()), dtype="datetime64[D]")
+    return days[((days.astype("int64") + 3) % 7) < 5]  # 1970-01-01 เป็นวันพฤหัส
+
+
+def users_for_rows(rows: int, years: float, presence: float) -> int:
+    per_user = 2 * len(workdays(years, datetime.now())) * presence
+    return max(1, int(round(rows / per_user)))
+
+
+def _engine(db_url: str):
+    eng = create_engine(db_url)
+    if db_url.startswith("sqlite"):
+        @event.listens_for(eng, "connect")
+        def _fast(dbapi_conn, _):
+            cur = dbapi_conn.cursor()
+            cur.execute("PRAGMA journal_mode=WAL")
+            cur.execute("PRAGMA synchronous=OFF")
+            cur.execute("PRAGMA cache_size=-200000")
+            cur.close()
+    return eng
+
+
+def _to_dt(sec: np.ndarray) -> list:
+    # epoch seconds (UTC) → naive datetime แบบเดียวกับที่ SQLite เก็บ
+    return [EPOCH + timedelta(seconds=float(x)) for x in sec]
+
+
+def _insert(conn, table, rows: list[dict]):
+    # executemany ใช้ key ของ dict แรกเป็นคอลัมน์ → ทุกแถวต้องมี key ครบชุดเดียวกัน
+    for i in range(0, len(rows), CHUNK):
+        conn.execute(table.insert(), rows[i:i + CHUNK])
+
+
+def generate(db_url: str, departments: int, users: int, embeddings: int, years: float,
+             presence: float = 0.9, failure_rate: float = 0.15, anonymous_rate: float = 0.05,
+             dim: int = 512, seed: int = 0, verbose: bool = True) -> dict:
+    rng = np.random.default_rng(seed)
+    eng = _engine(db_url)
+    SQLModel.metadata.create_all(eng)
+    end = datetime.now(timezone.utc).replace(tzinfo=None)
+    days = workdays(years, end)
+    day_sec = days.astype("datetime64[s]").astype("int64")
+    counts = {"department": departments, "user": users, "attendance": 0, "attendanceattempt": 0}
+    t_start = time.perf_counter()
+
+    with eng.begin() as conn:
+        deps = [{"name": f"Dept {i}", "lat": 13.75 + rng.uniform(-0.3, 0.3), "lng": 100.5 + rng.uniform(-0.3, 0.3),
+                 "radius_m": int(rng.choice([100, 200, 300, 500]))} for i in range(departments)]
+        _insert(conn, Department.__table__, deps)
+        dep_t, user_t = Department.__table__, User.__table__
+        dep_ids = [r[0] for r in conn.execute(select(dep_t.c.id).order_by(dep_t.c.id.desc()).limit(departments))][::-1]
+        dep_w = 1.0 / np.arange(1, departments + 1) ** 0.8
+        user_dep = rng.choice(dep_ids, size=users, p=dep_w / dep_w.sum())
+        first_uid = (conn.execute(select(func.max(user_t.c.id))).scalar() or 0) + 1
+
+    for lo in range(0, users, 1000):
+        hi = min(users, lo + 1000)
+        rows = []
+        for i in range(lo, hi):
+            n_emb = max(1, int(rng.poisson(embeddings)))
+            e = rng.standard_normal((n_emb, dim)).astype(np.float32)
+            e /= np.linalg.norm(e, axis=1, keepdims=True)
+            rows.append({"email": f"user{first_uid + i}@synthetic", "name": f"User {first_uid + i}",
+                         "role": "user", "hashed_password": "!", "department_id": int(user_dep[i]),
+                         "embeddings_json": json.dumps(np.round(e, 5).tolist())})
+        with eng.begin() as conn:
+            _insert(conn, User.__table__, rows)
+
+    reasons = [r for r, _ in FAIL_REASONS]
+    reason_p = np.array([p for _, p in FAIL_REASONS]); reason_p /= reason_p.sum()
+    dep_by_id = dict(zip(dep_ids, deps))
+    u_dep = np.asarray(user_dep, dtype=np.int64)
+    u_lat = np.array([dep_by_id[d]["lat"] for d in user_dep]); u_lng = np.array([dep_by_id[d]["lng"] for d in user_dep])
+    u_rad = np.array([dep_by_id[d]["radius_m"] for d in user_dep])
+    # ไล่ตามช่วงวัน (ทุก user พร้อมกัน) → insert เรียงตามเวลาเหมือนข้อมูลจริง (id เพิ่มตาม ts)
+    for lo in range(0, len(day_sec), 20):
+        block = day_sec[lo:lo + 20]
+        uu, dd = np.nonzero(rng.random((users, len(block))) < presence)
+        n = len(uu)
+        # เวลาไทย → UTC
+        t_in = block[dd] + (8 * 3600 + rng.normal(0, 1800, n)).astype("int64") - 7 * 3600
+        t_out = block[dd] + (17.5 * 3600 + rng.normal(0, 2700, n)).astype("int64") - 7 * 3600
+        ts = np.concatenate([t_in, t_out]); who = np.concatenate([uu, uu])
+        acts = np.repeat(np.array(["in", "out"]), n)
+        order = np.argsort(ts, kind="stable")
+        ts, who, acts = ts[order], who[order], acts[order]
+        m = len(ts)
+        slots = slots_for_hours(((ts + 7 * 3600) // 3600) % 24)
+        lat = u_lat[who] + rng.normal(0, 0.0005, m)
+        lng = u_lng[who] + rng.normal(0, 0.0005, m)
+        dist = np.abs(rng.normal(0, 60, m))
+        score = np.clip(rng.normal(0.62, 0.08, m), 0.35, 0.99)
+        when = _to_dt(ts)
+        att, tries = [], []
+        for k in range(m):
+            uid = first_uid + int(who[k])
+            att.append({"user_id": uid, "ts": when[k], "action": acts[k], "score": float(score[k]),
+                        "lat": float(lat[k]), "lng": float(lng[k]), "distance_m": float(dist[k]), "slot": slots[k]})
+            tries.append((ts[k], {"ts": when[k], "user_id": uid, "email": f"user{uid}@synthetic", "action": acts[k],
+                                  "success": True, "reason": None, "score": float(score[k]), "lat": float(lat[k]),
+                                  "lng": float(lng[k]), "accuracy": 15.0, "distance_m": float(dist[k]),
+                                  "department_id": int(u_dep[who[k]]), "client_ip": "10.0.0.1",
+                                  "user_agent": "synthetic", "slot": slots[k]}))
+        # failures: ไม่กี่นาทีก่อน attempt ที่สำเร็จ
+        nf = rng.binomial(m, failure_rate)
+        pick = rng.integers(0, m, nf)
+        f_ts = ts[pick] - rng.integers(20, 600, nf)
+        f_reason = rng.choice(len(reasons), nf, p=reason_p)
+        f_anon = rng.random(nf) < anonymous_rate
+        f_when = _to_dt(f_ts)
+        for k in range(nf):
+            j = pick[k]; uid = first_uid + int(who[j]); anon = bool(f_anon[k])
+            r, sc = reasons[f_reason[k]], None
+            if r == "face mismatch":
+                sc = float(rng.uniform(0.05, 0.34)); r = f"face mismatch (score={sc:.2f} < th=0.35)"
+            elif r == "Out of permitted area":
+                r = f"Out of permitted area: {int(rng.uniform(600, 5000))}m > {int(u_rad[who[j]]) + 15}m"
+            tries.append((f_ts[k], {"ts": f_when[k], "user_id": None if anon else uid,
+                                    "email": None if anon else f"user{uid}@synthetic", "action": acts[j],
+                                    "success": False, "reason": r, "score": sc, "lat": float(lat[j]),
+                                    "lng": float(lng[j]), "accuracy": 15.0, "distance_m": None,
+                                    "department_id": None if anon else int(u_dep[who[j]]),
+                                    "client_ip": "10.0.0.1", "user_agent": "synthetic", "slot": slots[j]}))
+        tries.sort(key=lambda x: x[0])
+        with eng.begin() as conn:
+            _insert(conn, Attendance.__table__, att)
+            _insert(conn, AttendanceAttempt.__table__, [r for _, r in tries])
+        counts["attendance"] += len(att)
+        counts["attendanceattempt"] += len(tries)
+        if verbose:
+            el = time.perf_counter() - t_start
+            print(f"  days {min(lo + 20, len(day_sec))}/{len(day_sec)}  attendance={counts['attendance']:,}  "
+                  f"attempts={counts['attendanceattempt']:,}  {el:.0f}s", flush=True)
+
+    eng.dispose()
+    counts["seconds"] = round(time.perf_counter() - t_start, 1)
+    return counts
+
+
+def main():
+    ap = argparse.ArgumentParser(description="generate a synthetic attendance dataset")
+    ap.add_argument("--db", required=True, help="เช่น sqlite:////tmp/big.sqlite3")
+    ap.add_argument("--departments", type=int, default=20)
+    ap.add_argument("--users", type=int, help="ถ้าไม่ใส่ คำนวณจาก --attendance-rows")
+    ap.add_argument("--attendance-rows", type=int, default=100_000)
+    ap.add_argument("--embeddings", type=int, default=3, help="ค่าเฉลี่ย embedding ต่อ user (poisson)")
+    ap.add_argument("--dim", type=int, default=512)
+    ap.add_argument("--years", type=float, default=2.0)
+    ap.add_argument("--presence", type=float, default=0.9)
+    ap.add_argument("--failure-rate", type=float, default=0.15)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    users = args.users or users_for_rows(args.attendance_rows, args.years, args.presence)
+    print(f"generating: departments={args.departments} users={users} years={args.years}")
+    counts = generate(args.db, args.departments, users, args.embeddings, args.years, args.presence,
+                      args.failure_rate, dim=args.dim, seed=args.seed)
+    print(json.dumps(counts))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,11 @@
+# backend/bench/stub_app.py
+# app.main ที่ใช้ StubFaceService แทนโมเดลจริง
+#
+#   cd backend && DB_URL=sqlite:////tmp/bench.sqlite3 uvicorn bench.stub_app:app
+import app.face_service as face_service
+
+from .stub_face import StubFaceService
+
+face_service.FaceService = StubFaceService
+
+from app.main import app  # noqa: E402
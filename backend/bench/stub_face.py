@@ -0,0 +1,112 @@
+# backend/bench/stub_face.py
+# FaceService ปลอมสำหรับ benchmark: ไม่ต้องมีไฟล์โมเดล, ผลลัพธ์ deterministic, latency ตั้งได้
+#
+# identity ถูกฝังไว้ใน pixel (0,0) ของภาพ PNG (lossless): B + 256*G = identity, R = variant
+# identity 0 = "ไม่มีหน้า" → extract คืน None
+# ภาพกลุ่ม (make_group_image): identity ของแต่ละหน้าเรียงใน pixel (0,0), (0,1), ... จนถึง pixel พื้นหลัง
+import os
+import time
+from typing import Optional, Tuple
+
+import cv2
+import numpy as np
+
+DIM = 512
+LATENCY_MS = float(os.getenv("STUB_FACE_LATENCY_MS", "30"))
+JITTER_MS = float(os.getenv("STUB_FACE_JITTER_MS", "0"))
+LOAD_MS = float(os.getenv("STUB_FACE_LOAD_MS", "0"))  # จำลองเวลาโหลดโมเดล (bench_startup)
+
+
+def identity_embedding(identity: int, variant: int = 0) -> np.ndarray:
+    base = np.random.default_rng(identity).standard_normal(DIM).astype(np.float32)
+    base /= np.linalg.norm(base)
+    if variant:
+        noise = np.random.default_rng(identity * 1000 + variant).standard_normal(DIM).astype(np.float32)
+        base = base + 0.3 * noise / np.linalg.norm(noise)
+        base /= np.linalg.norm(base)
+    return base
+
+
+def make_face_image(identity: int, variant: int = 0, size: int = 64) -> bytes:
+    img = np.full((size, size, 3), 128, dtype=np.uint8)
+    img[0, 0] = (identity % 256, identity // 256, variant)
+    ok, buf = cv2.imencode(".png", img)
+    assert ok
+    return buf.tobytes()
+
+
+def make_group_image(identities: list, variant: int = 0, size: int = 64) -> bytes:
+    img = np.full((size, size, 3), 128, dtype=np.uint8)
+    for j, identity in enumerate(identities):
+        img[0, j] = (identity % 256, identity // 256, variant)
+    ok, buf = cv2.imencode(".png", img)
+    assert ok
+    return buf.tobytes()
+
+
+class StubFaceService:
+    def __init__(self, cpu: bool = True, model_name: str = "buffalo_sc",
+                 latency_ms: float = LATENCY_MS, jitter_ms: float = JITTER_MS):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self._rng = np.random.default_rng(0)
+        if LOAD_MS > 0:
+            time.sleep(LOAD_MS / 1000.0)
+
+    def _sleep(self):
+        ms = self.latency_ms
+        if self.jitter_ms:
+            ms += float(self._rng.uniform(0, self.jitter_ms))
+        if ms > 0:
+            time.sleep(ms / 1000.0)   # ปล่อย GIL เหมือน onnxruntime
+
+    @staticmethod
+    def _identity(bgr) -> Tuple[int, int]:
+        b, g, r = (int(x) for x in bgr[0, 0])
+        return b + 256 * g, r
+
+    def extract(self, bgr) -> Optional[Tuple[np.ndarray, list]]:
+        self._sleep()
+        if bgr is None:
+            return None
+        identity, variant = self._identity(bgr)
+        if not identity:
+            return None
+        h, w = bgr.shape[:2]
+        return identity_embedding(identity, variant), np.array([0, 0, w, h], dtype=int)
+
+    def extract_all(self, bgr, **_) -> list:
+        # batch เดียว → latency เท่ากับหน้าเดียว (เหมือน get_feat ทั้ง batch)
+        self._sleep()
+        out, w = [], bgr.shape[1]
+        for j in range(w):
+            if (bgr[0, j] == 128).all():
+                break
+            b, g, r = (int(x) for x in bgr[0, j])
+            if b + 256 * g:
+                out.append((identity_embedding(b + 256 * g, r), np.array([j, 0, j + 1, 1], dtype=int)))
+        return out
+
+    def extract_many(self, imgs: list) -> list:
+        self._sleep()
+        out = []
+        for bgr in imgs:
+            identity, variant = self._identity(bgr)
+            h, w = bgr.shape[:2]
+            out.append((identity_embedding(identity, variant), np.array([0, 0, w, h], dtype=int)) if identity else None)
+        return out
+
+    # detect / embed แยกกัน (kiosk WebSocket): detect ฟรี, latency ทั้งหมดอยู่ที่ embed
+    def detect(self, bgr):
+        h, w = bgr.shape[:2]
+        identity, _ = self._identity(bgr)
+        bboxes = np.array([[0, 0, w, h, 0.99]], np.float32) if identity else np.zeros((0, 5), np.float32)
+        return bboxes, None, max(h, w)
+
+    def embed(self, bgr, bbox, kps) -> np.ndarray:
+        self._sleep()
+        return identity_embedding(*self._identity(bgr))
+
+    @staticmethod
+    def cos(a, b):
+        return float(np.dot(a, b))
@@ -0,0 +1,44 @@
+# backend/scripts/archive_attempts.py
+# ย้าย AttendanceAttempt ที่เก่ากว่า --hot-days ไป archive ทันที (ใช้จาก cron เมื่อไม่ได้เปิด thread ใน server ด้วย ATTEMPTS_ARCHIVE_INTERVAL_S)
+#
+#   cd backend && python -m scripts.archive_attempts --hot-days 30
+#   cd backend && python -m scripts.archive_attempts --dry-run     # นับอย่างเดียว
+#   cd backend && python -m scripts.archive_attempts --manifest    # ดู partition ที่มีอยู่
+import argparse
+import json
+from datetime import datetime, timedelta
+
+from sqlalchemy import func
+from sqlmodel import Session, select
+
+from app import retention
+from app.deps import engine
+from app.models import AttendanceAttempt
+
+
+def main():
+    ap = argparse.ArgumentParser(description="archive old attendance attempts to gzip CSV partitions")
+    ap.add_argument("--hot-days", type=int, default=retention.HOT_DAYS)
+    ap.add_argument("--batch", type=int, default=retention.BATCH)
+    ap.add_argument("--dry-run", action="store_true", help="count rows that would be archived")
+    ap.add_argument("--manifest", action="store_true", help="print the archive manifest and exit")
+    args = ap.parse_args()
+
+    if args.manifest:
+        print(json.dumps(retention.load_manifest(), indent=1))
+        return
+    if args.dry_run:
+        cutoff = datetime.utcnow() - timedelta(days=args.hot_days)
+        with Session(engine) as s:
+            n = s.exec(select(func.count()).select_from(AttendanceAttempt)
+                       .where(AttendanceAttempt.ts < cutoff)).one()
+        print(f"{n} attempts older than {cutoff.isoformat()} → {retention.ARCHIVE_DIR}")
+        return
+    res = retention.run_locked(hot_days=args.hot_days, batch=args.batch)
+    if res is None:
+        raise SystemExit("another process is archiving (lock held)")
+    print(f"archived {res['archived']} attempts older than {res['cutoff']} → {retention.ARCHIVE_DIR}")
+
+
+if __name__ == "__main__":
+    main()
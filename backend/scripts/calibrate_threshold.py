@@ -0,0 +1,59 @@
+# backend/scripts/calibrate_threshold.py
+# ประเมิน threshold ของ face match จากข้อมูลที่มี (ดู app/calibrate.py) แล้วแนะนำค่าต่อ department
+#
+#   cd backend && python -m scripts.calibrate_threshold                      # gallery all-pairs
+#   cd backend && python -m scripts.calibrate_threshold --source attempts --days 30
+#   cd backend && python -m scripts.calibrate_threshold --target-far 1e-4 --roc roc.csv
+import argparse
+import csv
+import json
+
+from sqlmodel import Session
+
+from app import calibrate
+from app.clock import DEFAULT_TH
+from app.deps import engine
+
+
+def _fmt(p) -> str:
+    if p is None:
+        return "n/a (needs both genuine and impostor scores)"
+    return f"th={p['threshold']:.4f} FAR={p['far']:.2e} FRR={p['frr']:.2%}"
+
+
+def main():
+    ap = argparse.ArgumentParser(description="face match threshold calibration (FAR/FRR/ROC)")
+    ap.add_argument("--source", choices=("gallery", "attempts"), default="gallery")
+    ap.add_argument("--target-far", type=float, default=1e-3)
+    ap.add_argument("--current", type=float, default=DEFAULT_TH, help="threshold to evaluate alongside")
+    ap.add_argument("--days", type=int, default=90, help="history window for --source attempts")
+    ap.add_argument("--roc", help="write the full ROC (every threshold) as CSV here")
+    ap.add_argument("--json", action="store_true", help="print the full result as JSON")
+    args = ap.parse_args()
+
+    with Session(engine) as s:
+        res = calibrate.calibrate(s, source=args.source, target_far=args.target_far, current=args.current,
+                                  days=args.days, points=calibrate.BINS if args.roc else 0)
+    if args.roc:
+        with open(args.roc, "w", newline="") as f:
+            w = csv.DictWriter(f, ["threshold", "far", "frr"])
+            w.writeheader()
+            w.writerows(res["overall"].pop("roc"))
+    if args.json:
+        print(json.dumps(res, indent=1, ensure_ascii=False))
+        return
+
+    o = res["overall"]
+    print(f"{args.source}: genuine={o['genuine']} impostor={o['impostor']} ({res['elapsed_s']}s)")
+    print(f"  current     {_fmt(o['current'])}")
+    print(f"  recommended {_fmt(o['recommended'])}  (FAR <= {args.target_far:g})")
+    if o["eer"]:
+        print(f"  EER         th={o['eer']['threshold']:.4f} rate={o['eer']['rate']:.2%}")
+    for d in res["departments"]:
+        name = d["name"] or ("(no department)" if d["department_id"] is None else f"#{d['department_id']}")
+        note = f"  [too few genuine → use overall th={d['threshold']}]" if d["fallback"] else ""
+        print(f"  {name:<24} {_fmt(d['recommended'])}  genuine={d['genuine']}{note}")
+
+
+if __name__ == "__main__":
+    main()
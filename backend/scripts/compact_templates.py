@@ -0,0 +1,65 @@
+# backend/scripts/compact_templates.py
+# บีบ template ของผู้ใช้ที่ enroll ไว้แล้วตาม enroll_policy (ใช้ครั้งเดียวหลังเปิด policy หรือรันเป็น cron)
+#
+#   cd backend && python -m scripts.compact_templates --dry-run
+#   cd backend && python -m scripts.compact_templates --max-templates 6 --centroids 3
+import argparse
+import json
+
+import numpy as np
+from sqlmodel import Session, select
+
+from app.deps import engine
+from app.enroll_policy import EnrollPolicy, DEDUP_TH, MAX_TEMPLATES, CENTROIDS, OUTLIER_TH, MAX_RAW
+from app.gallery import record_change
+from app.models import User
+
+
+def _same(a: list, b) -> bool:
+    # float32 ↔ JSON ไป-กลับไม่ตรงบิตเป๊ะ → เทียบแบบมี tolerance
+    return b is not None and len(a) == len(b) and (not a or np.allclose(a, b, atol=1e-6))
+
+
+def main():
+    ap = argparse.ArgumentParser(description="compact per-user face templates")
+    ap.add_argument("--dedup-th", type=float, default=DEDUP_TH)
+    ap.add_argument("--max-templates", type=int, default=MAX_TEMPLATES)
+    ap.add_argument("--centroids", type=int, default=CENTROIDS)
+    ap.add_argument("--outlier-th", type=float, default=OUTLIER_TH)
+    ap.add_argument("--max-raw", type=int, default=MAX_RAW)
+    ap.add_argument("--batch", type=int, default=500, help="commit ทุกกี่ user")
+    ap.add_argument("--dry-run", action="store_true")
+    args = ap.parse_args()
+
+    pol = EnrollPolicy(args.dedup_th, args.max_templates, args.centroids, args.outlier_th, args.max_raw)
+    before = after = touched = 0
+    with Session(engine) as s:
+        users = s.exec(select(User).where(User.embeddings_json.is_not(None))).all()
+        for i, u in enumerate(users, 1):
+            embs = json.loads(u.embeddings_json)
+            raw = json.loads(u.raw_embeddings_json) if u.raw_embeddings_json else None
+            res = pol.apply(embs, raw=raw)
+            out = res.templates
+            before += len(embs); after += len(out)
+            # เทียบเนื้อหา ไม่ใช่แค่จำนวน: centroid ที่ขยับ / template ที่สลับตัวจำนวนเท่าเดิมก็ต้องเขียนกลับ
+            if not _same(out, embs) or (res.raw is not None and not _same(res.raw, raw)):
+                touched += 1
+                print(f"{u.email}: {len(embs)} -> {len(out)}")
+                if not args.dry_run:
+                    u.embeddings_json = json.dumps(out)
+                    if res.raw is not None:
+                        u.raw_embeddings_json = json.dumps(res.raw)
+                    s.add(u)
+                    record_change(s, u, "compact")
+            if not args.dry_run and i % args.batch == 0:
+                s.commit()
+        if not args.dry_run:
+            s.commit()
+
+    pct = (1 - after / before) * 100 if before else 0.0
+    print(f"users={len(users)} changed={touched} templates {before} -> {after} (-{pct:.1f}%)"
+          + (" [dry-run]" if args.dry_run else ""))
+
+
+if __name__ == "__main__":
+    main()
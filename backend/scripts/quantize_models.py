@@ -0,0 +1,128 @@
+# backend/scripts/quantize_models.py
+# สร้างโมเดล int8 (detection + recognition) จาก model pack เดิม สำหรับ FACE_MODEL_VARIANT=int8-dynamic|int8-static
+#
+#   cd backend && python -m scripts.quantize_models --mode dynamic
+#   cd backend && python -m scripts.quantize_models --mode static --calib-dir /data/calib-faces --limit 300
+#
+# static ต้องมีภาพ calibration (ภาพถ่ายจริงจากหน้างาน, มีหน้าคนชัด ๆ): ภาพถูกส่งผ่าน FaceAnalysis fp32
+# แล้วเก็บ input tensor ที่ส่งเข้า session จริง (หลัง preprocessing ของ insightface) ไปใช้ calibrate
+# → detector ได้ภาพเต็ม 640x640, recognizer ได้หน้าที่ align แล้ว 112x112
+# ไฟล์ผลลัพธ์: <out-dir>/<model>.<variant>.onnx (default <model dir>_int8 ซึ่ง FaceService หาเจอเอง)
+# ตรวจความแม่น/latency ก่อนเปิดใช้: python -m bench.bench_quant --images <folder>
+import argparse
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from app.face_service import quant_path
+
+IMG_EXT = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+
+class _Recorder:
+    """ครอบ InferenceSession: เก็บ feed ทุกครั้งที่ถูก run แล้วส่งต่อให้ session จริง"""
+
+    def __init__(self, sess):
+        self._sess = sess
+        self.feeds: list[dict] = []
+
+    def run(self, names, feed, *a, **kw):
+        self.feeds.append({k: np.array(v, copy=True) for k, v in feed.items()})
+        return self._sess.run(names, feed, *a, **kw)
+
+    def __getattr__(self, name):
+        return getattr(self._sess, name)
+
+
+class _Reader:
+    def __init__(self, feeds: list[dict]):
+        self._it = iter(feeds)
+
+    def get_next(self):
+        return next(self._it, None)
+
+
+def images(folder: str, limit: int) -> list[Path]:
+    files = sorted(p for p in Path(folder).rglob("*") if p.suffix.lower() in IMG_EXT)
+    return files[:limit]
+
+
+def collect_feeds(model_name: str, calib: list[Path]) -> tuple[dict, dict]:
+    """(task -> [feed dict], task -> ไฟล์ fp32) จากการรัน FaceAnalysis fp32 บนภาพ calibration"""
+    import cv2
+    from insightface.app import FaceAnalysis
+
+    app = FaceAnalysis(name=model_name, providers=["CPUExecutionProvider"])
+    app.prepare(ctx_id=-1, det_size=(640, 640))
+    rec = {task: _Recorder(m.session) for task, m in app.models.items()}
+    for task, m in app.models.items():
+        m.session = rec[task]
+    faces = 0
+    for p in calib:
+        img = cv2.imread(str(p))
+        if img is not None:
+            faces += len(app.get(img))
+    print(f"calibration: {len(calib)} images, {faces} faces")
+    return {task: r.feeds for task, r in rec.items()}, {task: m.model_file for task, m in app.models.items()}
+
+
+def preprocess(src: str, dst: str) -> str:
+    # shape inference + fold constants ตามที่ onnxruntime แนะนำก่อน quantize
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    try:
+        quant_pre_process(src, dst, skip_symbolic_shape=True)
+        return dst
+    except Exception as e:  # บางโมเดล pre-process ไม่ผ่าน → quantize จากไฟล์เดิม
+        print(f"  pre-process skipped: {e}")
+        return src
+
+
+def main():
+    ap = argparse.ArgumentParser(description="build int8 detection/recognition models")
+    ap.add_argument("--model-name", default="buffalo_sc")
+    ap.add_argument("--mode", choices=("dynamic", "static", "both"), default="dynamic")
+    ap.add_argument("--calib-dir", help="โฟลเดอร์ภาพสำหรับ static calibration")
+    ap.add_argument("--limit", type=int, default=200, help="จำนวนภาพ calibration สูงสุด")
+    ap.add_argument("--method", choices=("minmax", "entropy", "percentile"), default="minmax")
+    ap.add_argument("--out-dir", default="", help="default: <model dir>_int8")
+    ap.add_argument("--tasks", nargs="+", default=["detection", "recognition"])
+    args = ap.parse_args()
+
+    from onnxruntime.quantization import (CalibrationMethod, QuantFormat, QuantType, quantize_dynamic,
+                                          quantize_static)
+
+    modes = ["dynamic", "static"] if args.mode == "both" else [args.mode]
+    if "static" in modes and not args.calib_dir:
+        ap.error("--mode static ต้องใส่ --calib-dir")
+
+    calib = images(args.calib_dir, args.limit) if args.calib_dir else []
+    feeds, files = collect_feeds(args.model_name, calib)
+    tmp = Path(tempfile.mkdtemp(prefix="attendance-quant-"))
+    method = {"minmax": CalibrationMethod.MinMax, "entropy": CalibrationMethod.Entropy,
+              "percentile": CalibrationMethod.Percentile}[args.method]
+
+    for task in args.tasks:
+        if task not in files:
+            print(f"{task}: not in model pack, skipped")
+            continue
+        src = preprocess(files[task], str(tmp / f"{task}.pre.onnx"))
+        for mode in modes:
+            out = quant_path(files[task], f"int8-{mode}", args.out_dir)
+            out.parent.mkdir(parents=True, exist_ok=True)
+            if mode == "dynamic":
+                quantize_dynamic(src, str(out), weight_type=QuantType.QInt8, per_channel=True)
+            else:
+                if not feeds.get(task):
+                    print(f"{task}: no calibration inputs (ไม่มีหน้าในภาพ?) – skipped")
+                    continue
+                quantize_static(src, str(out), _Reader(feeds[task]), quant_format=QuantFormat.QDQ,
+                                per_channel=True, weight_type=QuantType.QInt8,
+                                activation_type=QuantType.QUInt8, calibrate_method=method)
+            size = lambda p: Path(p).stat().st_size / 2**20
+            print(f"{task}: int8-{mode} {size(files[task]):.1f}MB -> {size(out):.1f}MB  {out}")
+
+
+if __name__ == "__main__":
+    main()
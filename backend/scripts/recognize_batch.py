@@ -0,0 +1,100 @@
+# backend/scripts/recognize_batch.py
+# recognize รูปจำนวนมาก (audit / reprocess) → NDJSON หนึ่งบรรทัดต่อภาพ (stdout หรือ --out)
+#
+#   cd backend && python -m scripts.recognize_batch /data/audit/2025-06 captures.zip --k 3 > result.ndjson
+#   cd backend && python -m scripts.recognize_batch /data/audit --url https://hr.example.com --token <admin JWT>
+#
+# ค่า default รันตรงกับ DB_URL + โมเดลบนเครื่องนี้ (ไม่จำกัดจำนวนภาพ)
+# --url → แพ็ครูปเป็น zip แล้วส่งให้ POST /api/admin/recognize-batch (จำกัด RECOGNIZE_MAX_IMAGES ต่อครั้ง)
+import argparse
+import http.client
+import io
+import json
+import sys
+import uuid
+import zipfile
+from pathlib import Path
+from urllib.parse import urlencode, urlsplit
+
+from app.clock import DEFAULT_TH
+from app.recognize_batch import is_image, iter_archive
+
+
+def iter_inputs(paths: list[str]):
+    """(ชื่อ, bytes) จากไฟล์รูป / โฟลเดอร์ (recursive) / zip / tar"""
+    for p in map(Path, paths):
+        if p.is_dir():
+            for f in sorted(p.rglob("*")):
+                if f.is_file() and is_image(f.name):
+                    yield str(f), f.read_bytes()
+        elif is_image(p.name):
+            yield str(p), p.read_bytes()
+        else:
+            for name, data in iter_archive(p.read_bytes()):
+                yield f"{p}:{name}", data
+
+
+def run_local(items, k: int, th: float):
+    from sqlmodel import Session
+
+    from app.deps import engine
+    from app.face_service import FaceService
+    from app.recognize_batch import recognize
+
+    svc = FaceService()
+    with Session(engine) as s:
+        yield from recognize(items, svc, s, k=k, th=th)
+
+
+def run_remote(items, url: str, token: str, k: int, th: float):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_STORED) as z:  # jpeg/png บีบอัดอยู่แล้ว
+        for name, data in items:
+            z.writestr(name.replace(":", "/"), data)
+    boundary = uuid.uuid4().hex
+    body = (f'--{boundary}\r\nContent-Disposition: form-data; name="archive"; filename="images.zip"\r\n'
+            f"Content-Type: application/zip\r\n\r\n").encode() + buf.getvalue() + f"\r\n--{boundary}--\r\n".encode()
+
+    u = urlsplit(url)
+    conn_cls = http.client.HTTPSConnection if u.scheme == "https" else http.client.HTTPConnection
+    c = conn_cls(u.netloc, timeout=600)
+    c.request("POST", f"{u.path.rstrip('/')}/api/admin/recognize-batch?{urlencode({'k': k, 'th': th})}", body,
+              {"Content-Type": f"multipart/form-data; boundary={boundary}", "Authorization": f"Bearer {token}"})
+    r = c.getresponse()
+    if r.status != 200:
+        raise SystemExit(f"HTTP {r.status}: {r.read().decode(errors='replace')}")
+    for line in r:  # NDJSON ทยอยมาเป็น chunk
+        if line.strip():
+            yield json.loads(line)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="batch face recognition (NDJSON output)")
+    ap.add_argument("paths", nargs="+", help="image files, folders, zip or tar archives")
+    ap.add_argument("--k", type=int, default=5, help="candidates per image")
+    ap.add_argument("--th", type=float, default=DEFAULT_TH)
+    ap.add_argument("--url", help="server base URL (default: run locally against DB_URL)")
+    ap.add_argument("--token", help="admin access token (with --url)")
+    ap.add_argument("--out", help="write NDJSON here instead of stdout")
+    args = ap.parse_args()
+    if args.url and not args.token:
+        ap.error("--url needs --token")
+
+    items = iter_inputs(args.paths)
+    results = run_remote(items, args.url, args.token, args.k, args.th) if args.url else \
+        run_local(items, args.k, args.th)
+    out = open(args.out, "w", encoding="utf-8") if args.out else sys.stdout
+    try:
+        for res in results:
+            out.write(json.dumps(res, ensure_ascii=False) + "\n")
+            out.flush()
+            if res.get("done"):
+                print(f"images={res.get('images')} found={res.get('found')}"
+                      + (" [truncated: server limit]" if res.get("truncated") else ""), file=sys.stderr)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+# backend/tests/conftest.py
+# app จริง (bench.stub_app: StubFaceService แทนโมเดล) บน SQLite ชั่วคราวที่ seed แบบเดียวกับ bench_load
+#
+#   cd backend && python -m pytest -q tests
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import pytest
+
+BACKEND = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND))
+
+# ต้องตั้งก่อน import app.* (deps / metrics / image_archive อ่าน env ตอน import)
+_TMP = tempfile.mkdtemp(prefix="attendance-test-")
+DB_URL = f"sqlite:///{_TMP}/test.sqlite3"
+os.environ.update(DB_URL=DB_URL, IMAGE_ARCHIVE="0", ATTEMPTS_ARCHIVE_INTERVAL_S="0",
+                  METRICS_DIR=f"{_TMP}/metrics", GALLERY_MMAP_DIR=f"{_TMP}/gallery",
+                  STUB_FACE_LATENCY_MS="0", STUB_FACE_LOAD_MS="0")
+
+from bench.bench_load import DEP_LAT, PASSWORD, seed_db  # noqa: E402
+
+USERS = 8
+seed_db(DB_URL, users=USERS, templates=2)  # u1..u8@bench อยู่ department เดียว รัศมี 500 m
+
+FAR_LAT = DEP_LAT + 0.1  # ~11 km นอก geofence
+
+
+@pytest.fixture(scope="session")
+def client():
+    from fastapi.testclient import TestClient
+    from bench.stub_app import app
+
+    with TestClient(app) as c:  # lifespan → warmup thread (migrate + โหลด stub)
+        deadline = time.time() + 30
+        while c.get("/api/ready").status_code != 200:
+            assert time.time() < deadline, c.get("/api/ready").json()
+            time.sleep(0.05)
+        yield c
+
+
+@pytest.fixture(scope="session")
+def login(client):
+    def _login(email: str) -> dict:
+        r = client.post("/api/login", data={"username": email, "password": PASSWORD})
+        assert r.status_code == 200, r.text
+        return {"Authorization": f"Bearer {r.json()['access_token']}"}
+    return _login
+
+
+@pytest.fixture
+def inferences(monkeypatch):
+    """จำนวนครั้งที่เรียก StubFaceService.extract (= inference จริงที่ request จ่าย)"""
+    from bench.stub_face import StubFaceService
+
+    calls = []
+    orig = StubFaceService.extract
+
+    def extract(self, bgr):
+        calls.append(1)
+        return orig(self, bgr)
+
+    monkeypatch.setattr(StubFaceService, "extract", extract)
+    return calls
@@ -0,0 +1,118 @@
+# backend/tests/test_clock_stages.py
+# stage ที่ไม่ต้องใช้รูป (clock.FACE / MANUAL / ANONYMOUS) ต้องตัดสินก่อน decode + inference
+# และทุก reject บันทึก AttendanceAttempt(success=False) แบบเดียวกัน
+import itertools
+
+from sqlmodel import Session, select
+
+from app.deps import engine
+from app.models import AttendanceAttempt
+from bench.bench_load import DEP_LAT, DEP_LNG
+from bench.stub_face import make_face_image, make_group_image
+
+from conftest import FAR_LAT
+
+
+_variant = itertools.count(1)
+
+
+def _upload(identity: int) -> dict:
+    # variant ไม่ซ้ำทุกครั้ง: bytes เดิมจะได้ผลจาก extract_cache โดยไม่ผ่าน inference
+    return {"file": ("face.png", make_face_image(identity, next(_variant)), "image/png")}
+
+
+def _last_attempt(email=None) -> AttendanceAttempt:
+    with Session(engine) as s:
+        q = select(AttendanceAttempt).order_by(AttendanceAttempt.id.desc())
+        if email:
+            q = q.where(AttendanceAttempt.email == email)
+        return s.exec(q).first()
+
+
+# ---------- FACE (clock-in / clock-out) ----------
+def test_face_out_of_area_rejected_before_inference(client, login, inferences):
+    r = client.post("/api/attendance/clock-in", headers=login("u1@bench"), files=_upload(1),
+                    data={"lat": FAR_LAT, "lng": DEP_LNG, "accuracy": 10})
+    assert r.status_code == 403 and r.json()["detail"].startswith("Out of permitted area")
+    assert inferences == []
+    a = _last_attempt("u1@bench")
+    assert not a.success and a.reason.startswith("Out of permitted area") and a.action == "in"
+
+
+def test_face_low_accuracy_rejected_before_inference(client, login, inferences):
+    r = client.post("/api/attendance/clock-in", headers=login("u1@bench"), files=_upload(1),
+                    data={"lat": DEP_LAT, "lng": DEP_LNG, "accuracy": 5000})
+    assert r.status_code == 400 and r.json()["detail"] == "Location accuracy too low"
+    assert inferences == []
+
+
+def test_face_clock_out_without_clock_in_rejected_before_inference(client, login, inferences):
+    r = client.post("/api/attendance/clock-out", headers=login("u2@bench"), files=_upload(2),
+                    data={"lat": DEP_LAT, "lng": DEP_LNG})
+    assert r.status_code == 400 and r.json()["detail"] == "not clocked in yet"
+    assert inferences == []
+
+
+def test_face_in_area_runs_inference(client, login, inferences):
+    r = client.post("/api/attendance/clock-in", headers=login("u3@bench"), files=_upload(3),
+                    data={"lat": DEP_LAT, "lng": DEP_LNG, "accuracy": 10})
+    assert r.status_code == 200, r.text
+    assert r.json()["user"]["email"] == "u3@bench"
+    assert len(inferences) == 1
+    assert _last_attempt("u3@bench").success
+
+
+# ---------- MANUAL (manual-in / manual-out, ไม่มีรูป) ----------
+def test_manual_out_of_area_rejected(client, login, inferences):
+    r = client.post("/api/attendance/manual-in", headers=login("u4@bench"),
+                    data={"lat": FAR_LAT, "lng": DEP_LNG})
+    assert r.status_code == 403
+    assert inferences == []
+    assert not _last_attempt("u4@bench").success
+
+
+def test_manual_clock_out_without_clock_in_logs_manual_reason(client, login):
+    r = client.post("/api/attendance/manual-out", headers=login("u4@bench"),
+                    data={"lat": DEP_LAT, "lng": DEP_LNG})
+    assert r.status_code == 400
+    assert _last_attempt("u4@bench").reason == "not clocked in yet (manual)"
+
+
+# ---------- ANONYMOUS (kiosk: ยังไม่รู้ตัวตน) ----------
+def test_anonymous_out_of_area_rejected_before_inference(client, inferences):
+    r = client.post("/api/attendance/anonymous-clock", files=_upload(5),
+                    data={"action": "in", "lat": FAR_LAT, "lng": DEP_LNG, "accuracy": 10})
+    assert r.status_code == 403 and r.json()["detail"].startswith("Out of permitted area")
+    assert inferences == []
+    a = _last_attempt()
+    assert not a.success and a.user_id is None
+
+
+def test_anonymous_low_accuracy_rejected_before_inference(client, inferences):
+    r = client.post("/api/attendance/anonymous-clock", files=_upload(5),
+                    data={"action": "in", "lat": DEP_LAT, "lng": DEP_LNG, "accuracy": 5000})
+    assert r.status_code == 400
+    assert inferences == []
+
+
+def test_anonymous_in_area_identifies(client, inferences):
+    r = client.post("/api/attendance/anonymous-clock", files=_upload(6),
+                    data={"action": "in", "lat": DEP_LAT, "lng": DEP_LNG, "accuracy": 10})
+    assert r.status_code == 200, r.text
+    assert r.json()["user"]["email"] == "u6@bench"
+    assert len(inferences) == 1
+
+
+# ---------- group (หลายหน้าในเฟรมเดียว) ----------
+def test_group_logs_an_attempt_for_every_face(client):
+    last = _last_attempt()
+    before = last.id if last else 0
+    img = make_group_image([5, 5, 250], next(_variant))  # u5 สองหน้า (เงาสะท้อน) + คนที่ไม่ได้ enroll
+    r = client.post("/api/attendance/group-clock", files={"file": ("group.png", img, "image/png")},
+                    data={"action": "in", "lat": DEP_LAT, "lng": DEP_LNG, "accuracy": 10})
+    assert r.status_code == 200, r.text
+    assert [x.get("status", 200) for x in r.json()["results"]] == [200, 409, 401]
+    with Session(engine) as s:
+        rows = s.exec(select(AttendanceAttempt).where(AttendanceAttempt.id > before)).all()
+    got = sorted((a.email or "", a.success, (a.reason or "").split(" (")[0]) for a in rows)
+    assert got == [("", False, "face mismatch"), ("u5@bench", False, "duplicate face"), ("u5@bench", True, "")]
@@ -0,0 +1,103 @@
+# backend/tests/test_gallery.py
+# gallery ที่ได้จาก delta (change feed) ต้องค้นได้ผลเดียวกับ build ใหม่ทั้งหมดจาก User ทุกขั้น
+# ทั้งแบบในหน่วยความจำ (GALLERY_MMAP=0) และ snapshot memmap ร่วมกัน (GALLERY_MMAP=1)
+import json
+
+import numpy as np
+import pytest
+from sqlmodel import Session, SQLModel, create_engine
+
+from app import gallery
+from app.gallery import get_gallery, record_change
+from app.models import Department, User
+from bench.stub_face import identity_embedding
+
+USERS = 6
+PROBES = np.stack([identity_embedding(i, 7) for i in range(1, USERS + 2)])  # +1 = คนที่ enroll ทีหลัง
+
+
+def _templates(identity: int, variants=(1, 2)) -> str:
+    return json.dumps([identity_embedding(identity, v).tolist() for v in variants])
+
+
+@pytest.fixture
+def db(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/gallery.sqlite3")
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as s:
+        deps = [Department(name=n, lat=0.0, lng=0.0, radius_m=100) for n in ("A", "B")]
+        s.add_all(deps); s.commit()
+        for i in range(1, USERS + 1):
+            s.add(User(id=i, email=f"g{i}@test", name=f"G{i}", role="user", hashed_password="-",
+                       embeddings_json=_templates(i), department_id=deps[0].id))
+        s.commit()
+        yield s
+
+
+@pytest.fixture(params=[False, True], ids=["mmap0", "mmap1"])
+def builds(request, monkeypatch, tmp_path):
+    """จำนวน full build ที่ get_gallery ทำ (ที่เหลือต้องเป็น delta / เปิด snapshot เดิม)"""
+    monkeypatch.setattr(gallery, "GALLERY_MMAP", request.param)
+    monkeypatch.setattr(gallery, "GALLERY_MMAP_DIR", tmp_path / "snapshots")
+    monkeypatch.setattr(gallery, "GALLERY_DTYPE", "float32")
+    monkeypatch.setattr(gallery, "_cache", (None, None))
+    calls = []
+    orig = gallery._build
+    monkeypatch.setattr(gallery, "_build", lambda s, epoch: (calls.append(epoch), orig(s, epoch))[1])
+    return calls, orig
+
+
+def _assert_same_as_build(s: Session, build):
+    g = get_gallery(s)
+    ref = build(s, g.epoch)
+    assert g.seq == ref.seq
+    assert sorted(g.user_ids.tolist()) == sorted(ref.user_ids.tolist())
+    got, want = g.search_many(PROBES, k=3), ref.search_many(PROBES, k=3)
+    for a, b in zip(got, want):
+        assert [u for u, _ in a] == [u for u, _ in b]
+        np.testing.assert_allclose([x for _, x in a], [x for _, x in b], atol=1e-5)
+    return g
+
+
+def _change(s: Session, u: User, op: str):
+    s.add(u)
+    record_change(s, u, op)
+    s.commit()
+
+
+def test_delta_matches_full_build(db, builds):
+    calls, build = builds
+    s = db
+    _assert_same_as_build(s, build)
+    assert len(calls) == 1  # ครั้งแรกต้อง build
+
+    # enroll: user ใหม่ + enroll ซ้ำด้วย template ชุดใหม่
+    new = User(id=USERS + 1, email="late@test", name="Late", role="user", hashed_password="-",
+               embeddings_json=_templates(USERS + 1), department_id=1)
+    _change(s, new, "enroll")
+    u2 = s.get(User, 2); u2.embeddings_json = _templates(2, (3, 4, 5)); _change(s, u2, "enroll")
+    u2.embeddings_json = _templates(2, (6,)); _change(s, u2, "compact")  # user เดียวสอง change ใน delta เดียว → ใช้อันหลัง
+    assert (USERS + 1) in _assert_same_as_build(s, build).user_ids
+
+    u3 = s.get(User, 3); u3.embeddings_json = None; _change(s, u3, "remove")
+    assert 3 not in _assert_same_as_build(s, build).user_ids
+
+    u4 = s.get(User, 4); u4.active = False; _change(s, u4, "deactivate")
+    assert 4 not in _assert_same_as_build(s, build).user_ids
+
+    u5 = s.get(User, 5); u5.department_id = 2; _change(s, u5, "department")
+    _assert_same_as_build(s, build)
+
+    u4.active = True; _change(s, u4, "activate")
+    assert 4 in _assert_same_as_build(s, build).user_ids
+    assert len(calls) == 1, "every refresh after the first should be a delta"
+
+    # worker ใหม่ (cache ว่าง): mmap เปิด snapshot เดิม / ในหน่วยความจำต้อง build
+    gallery._cache = (None, None)
+    _assert_same_as_build(s, build)
+    assert len(calls) == (1 if gallery.GALLERY_MMAP else 2)
+
+    # แล้ว change ถัดไปเป็น delta จากฐานนั้น (mmap: จาก snapshot บนดิสก์)
+    u6 = s.get(User, 6); u6.embeddings_json = _templates(6, (8,)); _change(s, u6, "enroll")
+    _assert_same_as_build(s, build)
+    assert len(calls) == (1 if gallery.GALLERY_MMAP else 2)
@@ -0,0 +1,126 @@
+# backend/tests/test_preflight.py
+# preflight token: ใช้ได้เฉพาะ user / action / ตำแหน่งเดียวกัน (หลังปัดพิกัด) ภายใน PREFLIGHT_TTL_S
+# token ที่ไม่ตรง → clock endpoint ตรวจเต็มตามปกติ (ไม่ error)
+import itertools
+import re
+
+import pytest
+from sqlmodel import Session, select
+
+from app import auth, clock
+from app.deps import engine
+from app.models import User
+from bench.bench_load import DEP_LAT, DEP_LNG
+from bench.stub_face import make_face_image
+
+from conftest import FAR_LAT
+
+_variant = itertools.count(100)  # variant อยู่ใน byte เดียว (ไม่ชนกับ test_clock_stages)
+
+
+def _upload(identity: int) -> dict:
+    return {"file": ("face.png", make_face_image(identity, next(_variant)), "image/png")}
+
+
+def _accepted(client) -> float:
+    m = re.search(r'^attendance_preflight_total\{result="token_accepted"\} (\S+)$',
+                  client.get("/api/metrics").text, re.M)
+    return float(m.group(1)) if m else 0.0
+
+
+@pytest.fixture
+def req():
+    # ClockRequest ของ user ตาม email บน session จริง (ตรวจ accept_preflight ตรง ๆ)
+    with Session(engine) as s:
+        def make(email: str, action: str = "in", lat: float = DEP_LAT, lng: float = DEP_LNG,
+                 accuracy=10.0) -> clock.ClockRequest:
+            u = s.exec(select(User).where(User.email == email)).one()
+            return clock.ClockRequest(s=s, action=action, lat=lat, lng=lng, accuracy=accuracy, user=u)
+        yield make
+
+
+def _token(r: clock.ClockRequest) -> str:
+    res = clock.preflight(r, clock.FACE)
+    assert res["ok"], res
+    return res["token"]
+
+
+def test_same_request_accepted(req):
+    r = req("u7@bench")
+    clock.accept_preflight(r, _token(req("u7@bench")))
+    assert r.preflight and r.dist_m is not None
+
+
+def test_rounded_coordinates_accepted(req):
+    # form ส่ง float คนละรูป (เช่น 13.7563 กับ 13.75630000001) → ต้องยังใช้ token ได้
+    t = _token(req("u7@bench", lat=DEP_LAT + 1e-9, accuracy=10.2))
+    r = req("u7@bench", accuracy=10.0)
+    clock.accept_preflight(r, t)
+    assert r.preflight
+
+
+@pytest.mark.parametrize("change", [
+    {"lat": DEP_LAT + 0.001},   # ~110 m
+    {"lng": DEP_LNG - 0.001},
+    {"accuracy": 60.0},
+    {"accuracy": None},
+    {"action": "out"},
+])
+def test_mismatched_claims_ignored(req, change):
+    t = _token(req("u7@bench"))
+    r = req("u7@bench", **change)
+    clock.accept_preflight(r, t)
+    assert not r.preflight
+
+
+def test_other_users_token_ignored(req):
+    t = _token(req("u7@bench"))
+    r = req("u8@bench")
+    clock.accept_preflight(r, t)
+    assert not r.preflight
+
+
+def test_expired_token_ignored(req, monkeypatch):
+    monkeypatch.setattr(auth, "PREFLIGHT_TTL_S", -5)
+    t = _token(req("u7@bench"))
+    r = req("u7@bench")
+    clock.accept_preflight(r, t)
+    assert not r.preflight
+
+
+def test_forged_or_access_token_ignored(req):
+    r = req("u7@bench")
+    clock.accept_preflight(r, auth.make_access_token("u7@bench", "user"))  # คนละ key / typ
+    clock.accept_preflight(r, "not-a-token")
+    assert not r.preflight
+
+
+# ---------- ผ่าน HTTP ----------
+def test_clock_in_with_token(client, login):
+    h = login("u7@bench")
+    pre = client.post("/api/attendance/preflight", headers=h,
+                      data={"action": "in", "lat": DEP_LAT, "lng": DEP_LNG, "accuracy": 10})
+    assert pre.status_code == 200 and pre.json()["ok"], pre.text
+    before = _accepted(client)
+    r = client.post("/api/attendance/clock-in", headers=h, files=_upload(7),
+                    data={"lat": DEP_LAT, "lng": DEP_LNG, "accuracy": 10, "preflight": pre.json()["token"]})
+    assert r.status_code == 200, r.text
+    assert _accepted(client) == before + 1
+
+
+def test_token_from_other_location_does_not_skip_geofence(client, login, inferences):
+    h = login("u8@bench")
+    pre = client.post("/api/attendance/preflight", headers=h,
+                      data={"action": "in", "lat": DEP_LAT, "lng": DEP_LNG, "accuracy": 10})
+    assert pre.json()["ok"]
+    r = client.post("/api/attendance/clock-in", headers=h, files=_upload(8),
+                    data={"lat": FAR_LAT, "lng": DEP_LNG, "accuracy": 10, "preflight": pre.json()["token"]})
+    assert r.status_code == 403 and r.json()["detail"].startswith("Out of permitted area")
+    assert inferences == []
+
+
+def test_preflight_out_of_area(client, login):
+    r = client.post("/api/attendance/preflight", headers=login("u8@bench"),
+                    data={"action": "in", "lat": FAR_LAT, "lng": DEP_LNG})
+    assert r.status_code == 200
+    assert not r.json()["ok"] and r.json()["stage"] == "check_geofence" and r.json()["status"] == 403
@@ -0,0 +1,62 @@
+# backend/tests/test_presence.py
+# presence state ต้องตาม user / department ที่เกิดหรือเปลี่ยนหลังจาก dashboard แรกต่อเข้ามา
+import asyncio
+
+import pytest
+
+from app.presence import hub
+from bench.bench_load import DEP_LAT, DEP_LNG, PASSWORD
+
+
+class _Loop:
+    # แทน event loop ของ connection: ส่งเข้าคิวทันที (ไม่ต้องมี loop จริง)
+    def call_soon_threadsafe(self, fn, *args):
+        fn(*args)
+
+
+@pytest.fixture
+def subscription(client):
+    q, snap = hub.subscribe(_Loop())
+    yield q, snap
+    hub.unsubscribe(q)
+
+
+def _events(q: asyncio.Queue) -> list:
+    out = []
+    while not q.empty():
+        out.append(q.get_nowait())
+    return out
+
+
+def _department(client, admin, name: str) -> int:
+    r = client.post("/api/admin/departments", headers=admin,
+                    json={"name": name, "lat": DEP_LAT, "lng": DEP_LNG, "radius_m": 500})
+    assert r.status_code == 200, r.text
+    return r.json()["department"]["id"]
+
+
+def test_user_created_and_moved_after_subscribe(client, login, subscription):
+    q, _ = subscription
+    admin = login("admin@bench")
+    r = client.post("/api/admin/users", headers=admin,
+                    data={"email": "late@bench", "name": "Late Joiner", "password": PASSWORD})
+    uid = r.json()["id"]
+    dep_a = _department(client, admin, "Presence A")
+    assert client.post("/api/admin/assign-department", headers=admin,
+                       json={"user_id": uid, "department_id": dep_a}).status_code == 200
+    assert _events(q) == []  # ย้ายตอนยังไม่ clock-in → ไม่มีอะไรให้ dashboard เปลี่ยน
+
+    r = client.post("/api/attendance/manual-in", headers=login("late@bench"), data={"lat": DEP_LAT, "lng": DEP_LNG})
+    assert r.status_code == 200, r.text
+    (ev,) = [e for e in _events(q) if e["type"] == "clock"]
+    assert (ev["user_id"], ev["name"], ev["email"], ev["department_id"]) == (uid, "Late Joiner", "late@bench", dep_a)
+    assert ev["present_count"] == 1
+
+    dep_b = _department(client, admin, "Presence B")
+    assert client.post("/api/admin/assign-department", headers=admin,
+                       json={"user_id": uid, "department_id": dep_b}).status_code == 200
+    (snap,) = _events(q)
+    assert snap["type"] == "snapshot"
+    deps = {d["id"]: d for d in snap["departments"]}
+    assert [p["user_id"] for p in deps[dep_b]["present"]] == [uid] and deps[dep_b]["name"] == "Presence B"
+    assert deps[dep_a]["present_count"] == 0
@@ -0,0 +1,30 @@
+# backend/tests/test_tracing.py
+# ring buffer ของ trace: หลาย request ใช้ trace id เดียวกันได้ (traceparent จาก client)
+from collections import deque
+
+from app import tracing
+
+
+def _request(trace_id: str, n: int):
+    t = tracing.Trace(trace_id)
+    root = {"name": f"GET /{n}", "start": 0.0, "duration_ms": 1.0, "attrs": {"status": 200}}
+    t.add(root)
+    tracing._finish(t, root)
+
+
+def _names(trace_id: str):
+    spans = tracing.get(trace_id)
+    return spans and [s["name"] for s in spans]
+
+
+def test_shared_trace_id_survives_eviction_of_older_request(monkeypatch):
+    monkeypatch.setattr(tracing, "_buffer", deque(maxlen=3))
+    monkeypatch.setattr(tracing, "_by_id", {})
+    monkeypatch.setattr(tracing, "TRACE_FILE", "")
+    _request("a", 1); _request("b", 2); _request("a", 3)
+    assert _names("a") == ["GET /1", "GET /3"]
+    _request("c", 4)  # หลุด: a/1 เท่านั้น
+    assert _names("a") == ["GET /3"]
+    _request("d", 5); _request("e", 6)  # หลุด: b, a/3
+    assert _names("a") is None and _names("b") is None
+    assert sorted(tracing._by_id) == ["c", "d", "e"]
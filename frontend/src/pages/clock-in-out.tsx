@@ -71,6 +71,20 @@ export default function ClockInOut() {
       const { latitude, longitude, accuracy } = pos.coords;
       setLoc({ lat: latitude, lng: longitude, accuracy });
 
+      // 1.5) preflight: ตรวจ department / ระยะ / สถานะเข้า-ออกก่อน ไม่ผ่านก็ไม่ต้องอัปโหลดรูป
+      const pf = new FormData();
+      pf.append("action", action);
+      pf.append("lat", String(latitude));
+      pf.append("lng", String(longitude));
+      if (typeof accuracy === "number") pf.append("accuracy", String(accuracy));
+      const pre = await fetch(`${API}/api/attendance/preflight`, { method: "POST", headers: authHeader(), body: pf })
+        .then(r => (r.ok ? r.json() : null))
+        .catch(() => null);  // preflight ล่ม → ส่งรูปตามปกติ (backend ตรวจเต็มเอง)
+      if (pre && !pre.ok) {
+        alert(pre.detail ?? `Clock-${action} failed`);
+        return;
+      }
+
       // 2) แคปภาพจากกล้อง
       const w = videoRef.current.videoWidth;
       const h = videoRef.current.videoHeight;
@@ -92,6 +106,7 @@ export default function ClockInOut() {
       fd.append("lat", String(latitude));
       fd.append("lng", String(longitude));
       if (typeof accuracy === "number") fd.append("accuracy", String(accuracy));
+      if (pre?.token) fd.append("preflight", pre.token);
 
       // 4) ยิง API
       const endpoint = action === "in" ? "clock-in" : "clock-out";
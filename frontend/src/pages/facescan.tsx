@@ -4,6 +4,8 @@ import { useRouter } from "next/router";
 import { kalnia } from "./_app";
 
 const API_BASE = process.env.NEXT_PUBLIC_API_BASE || process.env.NEXT_PUBLIC_API_URL || "http://localhost:8000";
+const STREAM_WIDTH = 480;        // ย่อเฟรมก่อนส่งทาง WebSocket
+const STREAM_TIMEOUT_MS = 8000;  // ส่งเฟรมได้นานสุดต่อการกดหนึ่งครั้ง
 
 const SLOT_LABEL: Record<string, string> = {
   morning: "เช้า",
@@ -23,6 +25,7 @@ function detectDefaultSlot() {
 export default function FaceScanPage() {
   const router = useRouter();
   const videoRef = useRef<HTMLVideoElement>(null);
+  const wsRef = useRef<WebSocket | null>(null);
   const [busy, setBusy] = useState(false);
   const [msg, setMsg] = useState<string | null>(null);
   const [name, setName] = useState("Guest");
@@ -37,17 +40,21 @@ export default function FaceScanPage() {
     return () => {
       const s = videoRef.current?.srcObject as MediaStream | undefined;
       s?.getTracks().forEach((t) => t.stop());
+      wsRef.current?.close();
     };
   }, []);
 
-  async function snapBlob(): Promise<Blob> {
+  async function snapBlob(maxWidth = 0, quality = 0.9): Promise<Blob> {
     const v = videoRef.current!;
+    const w = v.videoWidth || 640;
+    const h = v.videoHeight || 480;
+    const k = maxWidth && w > maxWidth ? maxWidth / w : 1;
     const c = document.createElement("canvas");
-    c.width = v.videoWidth || 640;
-    c.height = v.videoHeight || 480;
+    c.width = Math.round(w * k);
+    c.height = Math.round(h * k);
     const ctx = c.getContext("2d")!;
-    ctx.drawImage(v, 0, 0);
-    return await new Promise((res) => c.toBlob((b) => res(b!), "image/jpeg", 0.9));
+    ctx.drawImage(v, 0, 0, c.width, c.height);
+    return await new Promise((res) => c.toBlob((b) => res(b!), "image/jpeg", quality));
   }
 
   function getGeo(): Promise<GeolocationPosition> {
@@ -56,22 +63,81 @@ export default function FaceScanPage() {
     );
   }
 
+  // ---- streaming (WebSocket /api/attendance/kiosk): connection เดียวใช้ต่อกันทุกคน ----
+  function kioskSocket(): Promise<WebSocket> {
+    const cur = wsRef.current;
+    if (cur && cur.readyState === WebSocket.OPEN) return Promise.resolve(cur);
+    return new Promise((res, rej) => {
+      const ws = new WebSocket(`${API_BASE.replace(/^http/, "ws")}/api/attendance/kiosk`);
+      ws.onopen = () => {
+        wsRef.current = ws;
+        res(ws);
+      };
+      ws.onerror = () => rej(new Error("kiosk socket unavailable"));
+    });
+  }
+
+  function ask(ws: WebSocket, payload: string | Blob): Promise<any> {
+    return new Promise((res, rej) => {
+      ws.onmessage = (ev) => res(JSON.parse(ev.data));
+      ws.onclose = () => rej(new Error("connection closed"));
+      ws.send(payload);
+    });
+  }
+
+  async function clockStream(ws: WebSocket, action: "in" | "out", pos: GeolocationPosition) {
+    const cfg = await ask(ws, JSON.stringify({
+      type: "config", action,
+      lat: pos.coords.latitude, lng: pos.coords.longitude,
+      accuracy: pos.coords.accuracy != null ? Math.round(pos.coords.accuracy) : null,
+    }));
+    if (cfg.type !== "ready") throw new Error(cfg.detail || "failed");
+    // ส่งเฟรมย่อทีละเฟรม (รอคำตอบก่อนส่งเฟรมถัดไป) จน server ลงเวลาให้หรือปฏิเสธ
+    const deadline = Date.now() + STREAM_TIMEOUT_MS;
+    while (Date.now() < deadline) {
+      const r = await ask(ws, await snapBlob(STREAM_WIDTH, 0.8));
+      if (r.type === "clocked") return r;
+      if (r.type === "rejected" || r.type === "error") throw new Error(r.detail || "failed");
+      if (r.type === "frame" && r.state === "low_quality") setMsg("กรุณาอยู่นิ่ง ๆ และหันหน้าเข้ากล้อง");
+    }
+    throw new Error("face not recognized");
+  }
+
+  // ---- fallback: preflight + อัปโหลดรูปเดียว ----
+  async function clockUpload(action: "in" | "out", pos: GeolocationPosition) {
+    // preflight (ไม่มีรูป): อยู่นอกพื้นที่ทุก department → ไม่ต้องอัปโหลด
+    const pf = new FormData();
+    pf.append("action", action);
+    pf.append("lat", String(pos.coords.latitude));
+    pf.append("lng", String(pos.coords.longitude));
+    if (pos.coords.accuracy != null) pf.append("accuracy", String(Math.round(pos.coords.accuracy)));
+    const pre = await fetch(`${API_BASE}/api/attendance/preflight`, { method: "POST", body: pf })
+      .then((r) => (r.ok ? r.json() : null))
+      .catch(() => null);
+    if (pre && !pre.ok) throw new Error(pre.detail || "failed");
+
+    const blob = await snapBlob();
+    const fd = new FormData();
+    if (pre?.token) fd.append("preflight", pre.token);
+    fd.append("action", action);
+    fd.append("file", blob, "face.jpg");
+    fd.append("lat", String(pos.coords.latitude));
+    fd.append("lng", String(pos.coords.longitude));
+    if (pos.coords.accuracy != null) fd.append("accuracy", String(Math.round(pos.coords.accuracy)));
+
+    const r = await fetch(`${API_BASE}/api/attendance/anonymous-clock`, { method: "POST", body: fd });
+    const data = await r.json();
+    if (!r.ok) throw new Error(data?.detail || "failed");
+    return data;
+  }
+
   async function clock(action: "in" | "out") {
     try {
       setBusy(true);
       setMsg(null);
-      const [blob, pos] = await Promise.all([snapBlob(), getGeo()]);
-
-      const fd = new FormData();
-      fd.append("action", action);
-      fd.append("file", blob, "face.jpg");
-      fd.append("lat", String(pos.coords.latitude));
-      fd.append("lng", String(pos.coords.longitude));
-      if (pos.coords.accuracy != null) fd.append("accuracy", String(Math.round(pos.coords.accuracy)));
-
-      const r = await fetch(`${API_BASE}/api/attendance/anonymous-clock`, { method: "POST", body: fd });
-      const data = await r.json();
-      if (!r.ok) throw new Error(data?.detail || "failed");
+      const pos = await getGeo();
+      const ws = await kioskSocket().catch(() => null);
+      const data = ws ? await clockStream(ws, action, pos) : await clockUpload(action, pos);
 
       setName(data.user.name);
       setMsg(`✅ ${data.user.name} clock-${data.action} (${data.slot}) • ~${data.distance_m} m`);